@@ -1,18 +1,24 @@
 import os
-import tempfile
+import json
 import logging
 import time
-from typing import List
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
+import uuid
+from typing import List, Dict, Any, Optional, Set
+from fastapi import APIRouter, Request, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from ..services.rag_service import RAGService
+from ..services.remote_llm import LLMOverloadedError
+from ..services.document_registry import encode_cursor, decode_cursor
+from ..services.ingest_jobs import IngestJobManager
+from ..services.document_processor import FileTooLargeError
 from ..models.schemas import (
     QueryRequest, QueryResponse, SystemStatus, 
-    FileUploadResponse, BatchQueryRequest, BatchQueryResponse,
+    IngestJobStatus, BatchQueryRequest, BatchQueryResponse,
     ErrorResponse
 )
 from ..core.config import settings
+from ..core.deadline import DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
@@ -22,44 +28,82 @@ router = APIRouter()
 # 全局RAG服务实例
 rag_service = RAGService()
 
-@router.post("/upload", response_model=FileUploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """上传文档到知识库"""
+# 后台入库任务
+job_manager = IngestJobManager(rag_service)
+
+# 列表接口可投影的字段（id / chunk_index 始终返回）
+DOCUMENT_FIELDS = ("id", "source", "file_type", "created_at", "chunk_count", "size", "content")
+CHUNK_FIELDS = ("chunk_index", "content", "chunk_size", "metadata")
+
+def _parse_fields(fields: Optional[str], allowed: tuple, required: str) -> Optional[Set[str]]:
+    """解析逗号分隔的字段列表，未指定时返回 None 表示全部字段"""
+    if not fields:
+        return None
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - set(allowed)
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(sorted(unknown))}，可选: {', '.join(allowed)}")
+    return selected | {required}
+
+def _project(item: Dict[str, Any], fields: Optional[Set[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
+
+@router.post("/upload", response_model=IngestJobStatus, status_code=202, openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}}
+        }}}
+    }
+})
+async def upload_document(request: Request):
+    """上传文档：保存文件并登记后台入库任务，立即返回任务信息，通过 /jobs/{job_id} 查询进度"""
     try:
-        # 验证文件
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="文件名不能为空")
-        
-        # 获取文件大小
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # 验证文件格式和大小
-        rag_service.document_processor.validate_file(file.filename, file_size)
-        
-        # 保存临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            tmp_file.write(file_content)
-            tmp_file_path = tmp_file.name
-        
-        # 处理文档
-        start_time = time.time()
-        result = await rag_service.add_document(tmp_file_path, file.filename)
-        processing_time = time.time() - start_time
-        
-        return FileUploadResponse(
-            filename=file.filename,
-            file_size=file_size,
-            document_id=result["id"],
-            chunk_count=result["chunk_count"],
-            processing_time=processing_time
+        content_length = request.headers.get("content-length")
+        # 边接收请求体边解析，文件直接写入上传目录（任务重启后仍需读取）；
+        # Content-Length 超出限制时不读取请求体，文件格式不支持或写入中超出大小限制时中途拒绝
+        filename, file_path, file_size, sha256 = await rag_service.document_processor.save_multipart_upload(
+            request.headers.get("content-type", ""),
+            int(content_length) if content_length and content_length.isdigit() else None,
+            request.stream()
         )
         
+        return await job_manager.submit(filename, file_path, file_size, sha256)
+        
+    except HTTPException:
+        raise
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"文档上传失败: {str(e)}")
-        raise HTTPException(status_code=500, detail="文档处理失败")
+        raise HTTPException(status_code=500, detail="文档上传失败")
+
+@router.get("/jobs", response_model=List[IngestJobStatus])
+async def list_jobs(limit: int = Query(50, ge=1, le=settings.max_page_size, description="返回的任务数量")):
+    """按创建时间倒序列出入库任务"""
+    return await job_manager.list_jobs(limit)
+
+@router.get("/jobs/{job_id}", response_model=IngestJobStatus)
+async def get_job(job_id: str):
+    """查询入库任务的阶段、进度、吞吐量和错误信息"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.post("/jobs/{job_id}/cancel", response_model=IngestJobStatus)
+async def cancel_job(job_id: str):
+    """取消排队中或执行中的入库任务，已写入的文档块会被回滚"""
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
 
 @router.post("/query", response_model=QueryResponse)
 async def query_knowledge_base(request: QueryRequest):
@@ -68,21 +112,43 @@ async def query_knowledge_base(request: QueryRequest):
         response = await rag_service.query(request)
         return response
         
+    except LLMOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"查询失败: {str(e)}")
         raise HTTPException(status_code=500, detail="查询处理失败")
 
+@router.post("/query/stream")
+async def query_knowledge_base_stream(request: QueryRequest):
+    """流式查询知识库（Server-Sent Events）"""
+    # 事件顺序: chunks（检索结果） -> token（增量答案） -> done（置信度与耗时），出错时为 error
+    # 响应头发出后无法再改状态码，因此在开始推送前先检查LLM是否已过载
+    if rag_service.llm_service and rag_service.llm_service.is_overloaded():
+        raise HTTPException(status_code=503, detail="LLM服务繁忙，请稍后重试", headers={"Retry-After": "1"})
+    
+    async def event_stream():
+        async for event in rag_service.query_stream(request):
+            data = json.dumps(event["data"], ensure_ascii=False)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @router.post("/batch_query", response_model=BatchQueryResponse)
 async def batch_query_knowledge_base(request: BatchQueryRequest):
     """批量查询知识库"""
     try:
         start_time = time.time()
         
-        results = []
-        for question in request.questions:
-            query_req = QueryRequest(question=question, top_k=request.top_k)
-            response = await rag_service.query(query_req)
-            results.append(response)
+        results = await rag_service.batch_query(request.questions, request.top_k)
         
         total_time = time.time() - start_time
         
@@ -91,6 +157,10 @@ async def batch_query_knowledge_base(request: BatchQueryRequest):
             total_time=total_time
         )
         
+    except LLMOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"批量查询失败: {str(e)}")
         raise HTTPException(status_code=500, detail="批量查询处理失败")
@@ -106,6 +176,16 @@ async def get_system_status():
         logger.error(f"获取系统状态失败: {str(e)}")
         raise HTTPException(status_code=500, detail="无法获取系统状态")
 
+@router.post("/status/rebuild_stats")
+async def rebuild_collection_stats():
+    """全量扫描向量集合，重建文档/来源统计计数"""
+    try:
+        return await rag_service.vector_store.rebuild_collection_stats()
+        
+    except Exception as e:
+        logger.error(f"重建集合统计失败: {str(e)}")
+        raise HTTPException(status_code=500, detail="重建集合统计失败")
+
 @router.delete("/documents/{document_id}")
 async def delete_document(document_id: str):
     """删除指定文档"""
@@ -139,9 +219,15 @@ async def clear_knowledge_base():
         raise HTTPException(status_code=500, detail="清空知识库失败")
 
 @router.get("/documents")
-async def list_documents():
-    """列出所有文档"""
+async def list_documents(
+    cursor: Optional[str] = Query(None, description="分页游标，取自上一页的 next_cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.max_page_size, description="每页文档数量"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，如 id,source,chunk_count")
+):
+    """分页列出文档"""
     try:
+        selected_fields = _parse_fields(fields, DOCUMENT_FIELDS, "id")
+        
         # 获取统计信息
         stats = rag_service.vector_store.get_collection_stats()
         
@@ -150,47 +236,23 @@ async def list_documents():
             logger.error(f"获取集合统计失败: {stats['error']}")
             raise HTTPException(status_code=500, detail="获取文档列表失败")
         
-        # 获取所有文档的详细信息
-        documents = []
-        if stats.get("total_documents", 0) > 0 and stats.get("total_chunks", 0) > 0:
-            try:
-                # 从向量存储中获取所有文档
-                results = rag_service.vector_store.collection.get(
-                    include=["documents", "metadatas"]
-                )
-                
-                # 按文档ID/source分组
-                doc_groups = {}
-                for i, (content, metadata) in enumerate(zip(
-                    results.get("documents", []),
-                    results.get("metadatas", [])
-                )):
-                    group_key = metadata.get("document_id") or metadata.get("source") or f"doc_{i}"
-                    if group_key not in doc_groups:
-                        doc_groups[group_key] = {
-                            "id": group_key,
-                            "source": metadata.get("source", "未知文档"),
-                            "file_type": metadata.get("file_type", ".txt"),
-                            "chunk_count": 0,
-                            "created_at": metadata.get("created_at", ""),
-                            "content": content[:200] + "..." if len(content) > 200 else content
-                        }
-                    doc_groups[group_key]["chunk_count"] += 1
-                
-                documents = list(doc_groups.values())
-            except Exception as e:
-                logger.error(f"获取文档详情失败: {str(e)}")
-                # 如果获取详情失败，至少返回统计信息
-                documents = []
+        # 从文档登记表读取一页文档（不加载文档块文本）
+        documents, next_cursor = rag_service.document_registry.list_page(
+            cursor, limit or settings.documents_page_size
+        )
         
         return {
             "total_documents": stats.get("total_documents", 0),
             "total_chunks": stats.get("total_chunks", 0),
             "sources": stats.get("sources", {}),
             "embedding_model": stats.get("embedding_model", "unknown"),
-            "documents": documents
+            "documents": [_project(document, selected_fields) for document in documents],
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -207,36 +269,52 @@ async def health_check():
     }
 
 @router.get("/documents/{document_id}/chunks")
-async def get_document_chunks(document_id: str):
-    """获取指定文档的块信息"""
+async def get_document_chunks(
+    document_id: str,
+    cursor: Optional[str] = Query(None, description="分页游标，取自上一页的 next_cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.max_page_size, description="每页块数量"),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，如 chunk_index,metadata（不含正文）")
+):
+    """分页获取指定文档的块信息，按块索引排序"""
     try:
-        # 从向量存储中获取文档块
-        results = rag_service.vector_store.collection.get(
-            where={"document_id": document_id},
-            include=["documents", "metadatas"]
-        )
+        selected_fields = _parse_fields(fields, CHUNK_FIELDS, "chunk_index")
+        limit = limit or settings.chunks_page_size
+        after_index = None
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 1 or not isinstance(values[0], int):
+                raise ValueError(f"无效的分页游标: {cursor}")
+            after_index = values[0]
         
+        # 按块索引键集分页：过滤索引记录文档的全部块ID（含去重时跳过的重复块），多取一个判断是否还有下一页
+        vector_store = rag_service.vector_store
+        total_chunks, page = vector_store.filter_index.document_chunks(document_id, after_index, limit + 1)
+        has_more = len(page) > limit
+        page = page[:limit]
+        
+        need_content = selected_fields is None or "content" in selected_fields
         chunks = []
-        for i, (content, metadata) in enumerate(zip(
-            results.get("documents", []),
-            results.get("metadatas", [])
-        )):
-            chunks.append({
-                "content": content,
-                "chunk_index": metadata.get("chunk_index", i),
-                "chunk_size": len(content),
+        for _, content, metadata in vector_store.get_chunks([chunk_id for chunk_id, _ in page], need_content):
+            chunk = {
+                "chunk_index": metadata.get("chunk_index", 0),
+                "chunk_size": metadata.get("chunk_size", len(content or "")),
                 "metadata": metadata
-            })
-        
-        # 按块索引排序
-        chunks.sort(key=lambda x: x["chunk_index"])
+            }
+            if need_content:
+                chunk["content"] = content
+            chunks.append(_project(chunk, selected_fields))
         
+        next_cursor = encode_cursor(page[-1][1]) if has_more else None
         return {
             "document_id": document_id,
-            "total_chunks": len(chunks),
-            "chunks": chunks
+            "total_chunks": total_chunks,
+            "chunks": chunks,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取文档块失败 {document_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="获取文档块失败")
@@ -16,6 +16,15 @@ class Settings(BaseSettings):
     # 数据库配置
     chroma_persist_directory: str = "./data/chroma"
     chroma_collection_name: str = "knowledge_base"
+    collection_stats_path: str = "./data/collection_stats.json"  # 增量维护的集合统计
+    document_registry_path: str = "./data/documents.db"  # 文档登记表
+    
+    # 向量存储后端: "chroma" 或 "numpy"（内存映射平铺矩阵，精确检索）
+    vector_store_backend: str = "chroma"
+    numpy_index_directory: str = "./data/numpy_index"
+    numpy_index_compact_ratio: float = 0.3  # 墓碑占比超过该值时自动压缩
+    numpy_index_quantization: str = "none"  # "none" 或 "int8"（内存中只保留int8编码，全精度向量留在磁盘用于重排）
+    numpy_index_rescore_factor: int = 4  # 量化检索时精确重排的候选数为 top_k 的倍数
     
     # AI模型配置
     ai_config: Dict[str, Any] = {
@@ -45,19 +54,113 @@ class Settings(BaseSettings):
         }
     }
     
+    # 嵌入服务连接配置
+    embedding_timeout: float = 30.0  # 单次请求总超时(秒)
+    embedding_connect_timeout: float = 5.0  # 建立连接超时(秒)
+    embedding_max_connections: int = 20  # 连接池最大连接数
+    embedding_max_keepalive_connections: int = 10  # 保持活跃的空闲连接数
+    embedding_keepalive_expiry: float = 30.0  # 空闲连接保活时间(秒)
+    embedding_max_concurrency: int = 8  # 同时在途的嵌入请求上限
+    embedding_batch_window_ms: float = 5.0  # 查询编码请求合并窗口(毫秒)，0表示不合并
+    embedding_batch_max_size: int = 32  # 单次合并的最大请求数
+    
+    # 嵌入持久化缓存配置
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = "./data/embedding_cache.db"
+    embedding_cache_max_mb: int = 1024  # 缓存容量上限(MB)，超出后按LRU淘汰
+    
+    # 查询向量内存缓存配置
+    query_cache_enabled: bool = True
+    query_cache_max_entries: int = 10000
+    query_cache_max_mb: int = 64  # 缓存向量占用的内存上限(MB)
+    query_cache_ttl: float = 3600.0  # 条目有效期(秒)
+    
+    # 语义答案缓存配置
+    answer_cache_enabled: bool = True
+    answer_cache_similarity_threshold: float = 0.95  # 查询向量余弦相似度阈值
+    answer_cache_max_entries: int = 1000
+    answer_cache_ttl: float = 1800.0  # 条目有效期(秒)
+    
+    # 文档入库嵌入批处理配置
+    embedding_ingest_batch_chars: int = 16000  # 初始批次字符预算
+    embedding_ingest_min_batch_chars: int = 2000  # 批次字符预算下限
+    embedding_ingest_max_batch_chars: int = 64000  # 批次字符预算上限
+    embedding_ingest_max_batch_items: int = 64  # 单批最多文本数
+    embedding_ingest_concurrency: int = 4  # 并行嵌入的批次数
+    embedding_ingest_target_latency: float = 5.0  # 单批目标延迟(秒)
+    embedding_ingest_max_retries: int = 3  # 单批失败重试次数
+    
+    # LLM服务连接与并发配置
+    llm_timeout: float = 120.0  # 单次生成请求超时(秒)，流式请求中为相邻数据块的最长间隔
+    llm_connect_timeout: float = 10.0
+    llm_max_connections: int = 20
+    llm_max_concurrency: int = 8  # 同时进行的生成请求上限
+    llm_max_queue_size: int = 32  # 等待队列上限，超出后直接返回503
+    
+    # 请求截止时间配置
+    request_timeout_header: str = "X-Request-Timeout"  # 客户端指定截止时间(秒)的请求头
+    default_request_timeout: float = 180.0  # 未指定时的默认截止时间(秒)，0表示不限制
+    
     # 检索配置
     chunk_size: int = 1000
     chunk_overlap: int = 200
     top_k: int = 5
     similarity_threshold: float = 0.3
+    filter_bruteforce_max_chunks: int = 5000  # 过滤后的子集不超过该块数时直接精确计算（Chroma后端）
     
     # 重排序配置
     rerank_enabled: bool = True
     rerank_initial_top_k_multiplier: float = 2.0  # 初始检索数量的倍数
+    rerank_score_weight: float = 0.7  # 组合分数中重排序分数的权重
+    original_score_weight: float = 0.3  # 组合分数中原始检索分数的权重
+    rerank_latency_budget: float = 3.0  # 重排序延迟预算(秒)，超出后使用向量检索顺序
+    rerank_max_connections: int = 10
+    rerank_cache_enabled: bool = True  # 按 (查询, 文档块) 缓存重排序分数
+    rerank_cache_max_entries: int = 50000
+    
+    # 混合检索配置（BM25 + 向量，倒数排名融合）
+    hybrid_search_enabled: bool = True
+    hybrid_candidate_k: int = 20  # 每一路召回的候选数量
+    hybrid_rrf_k: int = 60  # RRF 平滑常数
+    hybrid_rerank_top_k_multiplier: float = 1.5  # 混合检索召回质量更高，重排序候选池可小于纯向量检索
+    bm25_tokenizer: str = "bigram"  # "bigram"（中文二元组）或 "jieba"（需安装 jieba）
+    bm25_index_path: str = "./data/bm25_index.pkl"
+    index_journal_compact_min_ops: int = 10000  # BM25/去重索引增量日志至少累计多少个操作才重写快照
+    
+    # 入库去重配置（SimHash 近似重复检测）
+    dedup_enabled: bool = True
+    dedup_hamming_threshold: int = 3  # 64位指纹海明距离不超过该值视为近似重复
+    dedup_shingle_size: int = 3  # 字符 n-gram 长度
+    dedup_min_chunk_length: int = 50  # 短于该长度的块不参与去重
+    dedup_index_path: str = "./data/dedup_index.pkl"
+    
+    # 写入配置（预写日志 + 单写入者组提交）
+    ingest_log_path: str = "./data/ingest_log.db"
+    ingest_group_commit_max_rows: int = 2000  # 一次组提交合并的最大块数
+    ingest_pipeline_queue_size: int = 256  # 流式入库中读取阶段与组批阶段之间队列的最大块数
+    
+    # 后台入库任务配置
+    ingest_job_workers: int = 2  # 同时执行的入库任务数
+    ingest_job_db_path: str = "./data/ingest_jobs.db"
+    
+    # 分页配置
+    documents_page_size: int = 50  # 文档列表默认每页数量
+    chunks_page_size: int = 20  # 文档块列表默认每页数量
+    max_page_size: int = 200
+    
+    # 批量查询配置
+    batch_query_concurrency: int = 4  # 批量查询中同时进行重排序/生成的问题数
+    
+    # 文档解析配置（进程池）
+    extraction_workers: int = 0  # 解析进程数，0表示按CPU核数
+    extraction_timeout: float = 120.0  # 单个文件的解析超时(秒)，0表示不限制
+    extraction_memory_limit_mb: int = 1024  # 每个解析进程可新增的地址空间上限，0表示不限制
+    extraction_pdf_pages_per_task: int = 50  # 大PDF按页拆分，每个解析子任务的页数
     
     # 文件上传配置
     upload_directory: str = "./data/uploads"
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    upload_chunk_size: int = 1024 * 1024  # 流式写入上传文件的分块大小
     allowed_extensions: list = [".pdf", ".docx", ".txt", ".md"]
     
     # 安全配置
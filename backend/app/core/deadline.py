@@ -0,0 +1,43 @@
+"""
+请求截止时间
+
+由HTTP中间件根据请求头 X-Request-Timeout（秒）或默认配置设置，
+下游服务通过 remaining_time() 读取剩余时间，用于限制排队和远程调用的超时
+"""
+
+import time
+from contextvars import ContextVar, Token
+from typing import Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求已超过截止时间"""
+    pass
+
+
+def set_request_deadline(timeout: Optional[float]) -> Token:
+    """设置当前请求的截止时间，timeout 为空或不大于0表示不限制"""
+    deadline = time.monotonic() + timeout if timeout and timeout > 0 else None
+    return _deadline.set(deadline)
+
+
+def reset_request_deadline(token: Token):
+    """恢复设置前的截止时间"""
+    _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """当前请求剩余的秒数，未设置截止时间时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline(stage: str = ""):
+    """若已超过截止时间则抛出 DeadlineExceeded"""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"请求已超过截止时间{f'（{stage}）' if stage else ''}")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -22,6 +22,16 @@ class QueryRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=500, description="用户查询问题")
     top_k: Optional[int] = Field(5, ge=1, le=20, description="返回相关文档数量")
     use_rerank: Optional[bool] = Field(False, description="是否使用重排序")
+    document_id: Optional[List[str]] = Field(None, description="只在指定文档中检索（单个ID或ID列表）")
+    source: Optional[List[str]] = Field(None, description="只在指定来源（文件名）中检索")
+    file_type: Optional[List[str]] = Field(None, description="只在指定文件类型中检索，如 .pdf")
+    
+    @field_validator("document_id", "source", "file_type", mode="before")
+    @classmethod
+    def _to_list(cls, value):
+        if isinstance(value, str):
+            return [value]
+        return value
 
 class RetrievedChunk(BaseModel):
     content: str = Field(..., description="文档片段内容")
@@ -43,6 +53,7 @@ class SystemStatus(BaseModel):
     chunk_count: int = Field(..., description="文档片段总数")
     model_status: Dict[str, str] = Field(..., description="模型加载状态")
     memory_usage: float = Field(..., description="内存使用率")
+    service_metrics: Dict[str, Any] = Field(default_factory=dict, description="服务性能指标")
 
 # 文件上传模型
 class FileUploadResponse(BaseModel):
@@ -52,6 +63,29 @@ class FileUploadResponse(BaseModel):
     chunk_count: int = Field(..., description="分块数量")
     processing_time: float = Field(..., description="处理时间")
 
+# 入库任务模型
+class IngestJobStatus(BaseModel):
+    id: str = Field(..., description="任务ID")
+    filename: str = Field(..., description="文件名")
+    file_size: int = Field(..., description="文件大小")
+    sha256: Optional[str] = Field(None, description="文件内容的 sha256")
+    status: str = Field(..., description="任务状态：queued / running / succeeded / failed / cancelled")
+    stage: str = Field(..., description="当前阶段：queued / extracting / embedding / registering / done")
+    total_chunks: int = Field(0, description="文档块总数（分块完成后可用）")
+    processed_chunks: int = Field(0, description="已处理的文档块数量")
+    progress: float = Field(0.0, description="处理进度 0~1")
+    chunks_per_second: float = Field(0.0, description="处理吞吐量(块/秒)")
+    elapsed: Optional[float] = Field(None, description="已执行时间(秒)")
+    document_id: Optional[str] = Field(None, description="生成的文档ID（成功后可用）")
+    result: Optional[Dict[str, Any]] = Field(
+        None,
+        description="入库结果（成功后可用）：chunk_count 分块数量、duplicate_count 跳过的近似重复块数量、dedup_ratio 近似重复块占比"
+    )
+    error: Optional[str] = Field(None, description="失败原因")
+    created_at: str = Field(..., description="创建时间")
+    started_at: Optional[str] = Field(None, description="开始执行时间")
+    finished_at: Optional[str] = Field(None, description="结束时间")
+
 # 错误响应模型
 class ErrorResponse(BaseModel):
     error: str = Field(..., description="错误类型")
@@ -0,0 +1,82 @@
+"""
+自适应批次大小控制
+
+文档入库时按字符预算切分嵌入批次，并根据观测到的延迟和错误调整预算：
+延迟低于目标时加性增长，延迟过高或请求失败时乘性收缩
+"""
+
+import logging
+from typing import List, Dict, Any, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatchSizer:
+    """基于 AIMD 策略的批次字符预算控制器"""
+    
+    def __init__(
+        self,
+        initial_chars: Optional[int] = None,
+        min_chars: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        max_items: Optional[int] = None,
+        target_latency: Optional[float] = None
+    ):
+        self.min_chars = min_chars or settings.embedding_ingest_min_batch_chars
+        self.max_chars = max_chars or settings.embedding_ingest_max_batch_chars
+        self.max_items = max_items or settings.embedding_ingest_max_batch_items
+        self.target_latency = target_latency or settings.embedding_ingest_target_latency
+        self.budget = min(max(initial_chars or settings.embedding_ingest_batch_chars, self.min_chars), self.max_chars)
+        
+        # 每次增长的字符数
+        self._increase_step = max(self.min_chars // 2, 1)
+        
+        self._success_count = 0
+        self._failure_count = 0
+        self._last_latency = 0.0
+    
+    def next_batch_end(self, texts: List[str], start: int) -> int:
+        """从 start 开始按当前预算确定批次结束位置（至少包含一个文本）"""
+        end = start
+        used = 0
+        while end < len(texts) and end - start < self.max_items:
+            length = len(texts[end])
+            if end > start and used + length > self.budget:
+                break
+            used += length
+            end += 1
+        return end
+    
+    def record_success(self, latency: float):
+        """记录一次成功请求并调整预算"""
+        self._success_count += 1
+        self._last_latency = latency
+        
+        if latency > self.target_latency * 1.5:
+            self._shrink(0.75)
+        elif latency < self.target_latency:
+            self.budget = min(self.budget + self._increase_step, self.max_chars)
+    
+    def record_failure(self):
+        """记录一次失败请求，预算减半"""
+        self._failure_count += 1
+        self._shrink(0.5)
+    
+    def _shrink(self, factor: float):
+        old_budget = self.budget
+        self.budget = max(int(self.budget * factor), self.min_chars)
+        if self.budget != old_budget:
+            logger.info(f"嵌入批次预算调整: {old_budget} -> {self.budget} 字符")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批次控制统计信息"""
+        return {
+            "batch_chars": self.budget,
+            "max_items": self.max_items,
+            "target_latency": self.target_latency,
+            "last_latency": self._last_latency,
+            "successes": self._success_count,
+            "failures": self._failure_count
+        }
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+语义答案缓存
+
+以查询向量为键缓存完整的 QueryResponse，新查询与已缓存查询的余弦相似度
+超过阈值时直接复用答案；来源文档被删除或知识库被清空时相应条目失效
+"""
+
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from ..models.schemas import QueryResponse
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnswerCacheEntry:
+    """答案缓存条目"""
+    embedding: np.ndarray
+    params: Tuple
+    response: QueryResponse
+    chunk_ids: List[str]
+    document_ids: Set[str] = field(default_factory=set)
+    expires_at: float = 0.0
+
+
+class SemanticAnswerCache:
+    """基于查询向量余弦相似度的答案缓存，LRU + TTL 淘汰"""
+    
+    def __init__(
+        self,
+        similarity_threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None
+    ):
+        self.similarity_threshold = similarity_threshold or settings.answer_cache_similarity_threshold
+        self.max_entries = max_entries or settings.answer_cache_max_entries
+        self.ttl = ttl if ttl is not None else settings.answer_cache_ttl
+        
+        self._entries: "OrderedDict[int, AnswerCacheEntry]" = OrderedDict()
+        self._ids = itertools.count()
+        
+        # 查找时使用的向量矩阵，条目变化后惰性重建
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._invalidations = 0
+        self._evictions = 0
+    
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def lookup(self, embedding: np.ndarray, params: Tuple) -> Optional[AnswerCacheEntry]:
+        """查找相似度最高且超过阈值的条目（仅匹配相同查询参数）"""
+        self._expire()
+        if not self._entries:
+            self._misses += 1
+            return None
+        
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[key].embedding for key in self._matrix_keys])
+        
+        query = self._normalize(embedding)
+        if query.shape[0] != self._matrix.shape[1]:
+            self._misses += 1
+            return None
+        
+        similarities = self._matrix @ query
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.similarity_threshold:
+                break
+            key = self._matrix_keys[index]
+            entry = self._entries[key]
+            if entry.params == params:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                logger.info(f"答案缓存命中，相似度: {similarities[index]:.4f}")
+                return entry
+        
+        self._misses += 1
+        return None
+    
+    def put(self, embedding: np.ndarray, params: Tuple, response: QueryResponse, chunk_ids: List[str], document_ids: Set[str]):
+        """写入缓存，超出条目上限时淘汰最久未使用的条目"""
+        entry = AnswerCacheEntry(
+            embedding=self._normalize(embedding),
+            params=params,
+            response=response,
+            chunk_ids=chunk_ids,
+            document_ids=set(document_ids),
+            expires_at=time.monotonic() + self.ttl
+        )
+        self._entries[next(self._ids)] = entry
+        self._matrix = None
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+    
+    def discard(self, entry: AnswerCacheEntry):
+        """移除失效条目（如引用的文档块已不存在）"""
+        for key, value in list(self._entries.items()):
+            if value is entry:
+                del self._entries[key]
+                self._matrix = None
+                self._stale += 1
+                break
+    
+    def invalidate_document(self, document_id: Optional[str]):
+        """使引用指定文档的条目失效，document_id 为 None 时清空全部"""
+        if document_id is None:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            self._matrix = None
+            return
+        
+        stale_keys = [key for key, entry in self._entries.items() if document_id in entry.document_ids]
+        for key in stale_keys:
+            del self._entries[key]
+        if stale_keys:
+            self._invalidations += len(stale_keys)
+            self._matrix = None
+    
+    def _expire(self):
+        """移除已过期的条目"""
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "similarity_threshold": self.similarity_threshold,
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "stale": self._stale,
+            "invalidations": self._invalidations,
+            "evictions": self._evictions
+        }
\ No newline at end of file
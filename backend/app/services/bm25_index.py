@@ -0,0 +1,278 @@
+"""
+BM25 倒排索引
+
+为混合检索提供关键词召回：英文/数字按词切分（保留产品编号、错误码等整体），
+中文默认按字符二元组切分，安装 jieba 且配置 bm25_tokenizer="jieba" 时使用
+jieba 搜索模式分词。索引随文档入库增量构建、随删除同步更新，以快照 + 增量日志的
+形式持久化到磁盘。
+"""
+
+import heapq
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from ..core.config import settings
+from .query_cache import normalize_query
+from .index_journal import IndexJournal, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# 英文/数字词（允许 -_. 连接，如 E-1024、v2.1）或连续的中文字符
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*|[\u3400-\u4dbf\u4e00-\u9fff]+")
+_PART_RE = re.compile(r"[-_.]")
+
+_jieba = None
+_jieba_checked = False
+
+
+def _get_jieba():
+    """按需加载 jieba，未安装时回退到二元组切分"""
+    global _jieba, _jieba_checked
+    if not _jieba_checked:
+        _jieba_checked = True
+        try:
+            import jieba
+            jieba.setLogLevel(logging.WARNING)
+            _jieba = jieba
+        except ImportError:
+            logger.warning("未安装 jieba，BM25 使用中文二元组分词")
+    return _jieba
+
+
+def tokenize(text: str, tokenizer: Optional[str] = None) -> List[str]:
+    """切分文本为 BM25 词项"""
+    tokenizer = tokenizer or settings.bm25_tokenizer
+    jieba = _get_jieba() if tokenizer == "jieba" else None
+    
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(normalize_query(text).lower()):
+        token = match.group()
+        if token[0].isascii():
+            tokens.append(token)
+            # 带连接符的编号同时索引各部分，"E-1024" 也能被 "1024" 命中
+            if _PART_RE.search(token):
+                tokens.extend(part for part in _PART_RE.split(token) if part)
+        elif jieba is not None:
+            tokens.extend(word for word in jieba.cut_for_search(token) if word.strip())
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    
+    return tokens
+
+
+class BM25Index:
+    """内存倒排索引 + BM25 打分，支持增量添加和按文档删除"""
+    
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path or settings.bm25_index_path
+        self.k1 = k1
+        self.b = b
+        
+        self._lock = threading.Lock()
+        # 词项 -> {chunk_id: 词频}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # chunk_id -> (文档长度, 词项列表, document_id)
+        self._chunks: Dict[str, Tuple[int, List[str], Optional[str]]] = {}
+        # document_id -> chunk_id 集合
+        self._document_chunks: Dict[str, Set[str]] = {}
+        self._total_length = 0
+        
+        # 自上次保存以来的变更操作，save 时追加到增量日志
+        self._ops: List[Tuple] = []
+        self._save_lock = threading.Lock()
+        self._journal: Optional[IndexJournal] = None
+        self._journal_ops = 0
+        
+        self._load()
+    
+    def _reset(self):
+        self._postings, self._chunks, self._document_chunks, self._total_length = {}, {}, {}, 0
+    
+    def _load(self):
+        """加载快照，再回放快照之后的增量日志"""
+        if not self.path:
+            return
+        self._journal = IndexJournal(self.path + ".journal")
+        snapshot_seq = 0
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    state = pickle.load(f)
+                self._postings = state["postings"]
+                self._chunks = state["chunks"]
+                self._document_chunks = state["document_chunks"]
+                self._total_length = state["total_length"]
+                snapshot_seq = state.get("journal_seq", 0)
+            for _, ops in self._journal.replay(snapshot_seq):
+                for op in ops:
+                    self._apply(op)
+            self._journal_ops = self._journal.op_count(snapshot_seq)
+            if self._chunks:
+                logger.info(f"BM25索引已加载: {len(self._chunks)} 个文档块，{len(self._postings)} 个词项")
+        except Exception as e:
+            logger.error(f"加载BM25索引失败，将重新构建: {str(e)}")
+            self._reset()
+            self._journal.truncate()
+    
+    def save(self):
+        """
+        持久化自上次保存以来的变更：通常只追加到增量日志，日志累计的操作数超过索引
+        块数时重写快照并截断日志
+        """
+        if self._journal is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._ops:
+                    return
+                ops, self._ops = self._ops, []
+                compact = self._journal_ops + len(ops) >= max(settings.index_journal_compact_min_ops, len(self._chunks))
+                if compact:
+                    snapshot_seq = self._journal.last_seq()
+                    state = pickle.dumps({
+                        "postings": self._postings,
+                        "chunks": self._chunks,
+                        "document_chunks": self._document_chunks,
+                        "total_length": self._total_length,
+                        "journal_seq": snapshot_seq
+                    }, protocol=pickle.HIGHEST_PROTOCOL)
+            
+            try:
+                if compact:
+                    write_snapshot(self.path, state)
+                    self._journal.truncate(snapshot_seq)
+                    self._journal_ops = 0
+                else:
+                    self._journal.append(ops)
+                    self._journal_ops += len(ops)
+            except Exception:
+                # 未写入的变更留到下次保存
+                with self._lock:
+                    self._ops[:0] = ops
+                raise
+    
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+    
+    def __len__(self) -> int:
+        return len(self._chunks)
+    
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """添加文档块，已存在的ID先移除"""
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                terms = tokenize(text)
+                frequencies: Dict[str, int] = {}
+                for term in terms:
+                    frequencies[term] = frequencies.get(term, 0) + 1
+                self._record(("add", chunk_id, frequencies, len(terms), (metadata or {}).get("document_id")))
+    
+    def remove(self, ids: List[str]):
+        """按文档块ID移除"""
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self._chunks:
+                    self._record(("remove", chunk_id))
+    
+    def remove_document(self, document_id: str) -> int:
+        """移除文档的全部块，返回移除数量"""
+        with self._lock:
+            chunk_ids = list(self._document_chunks.get(document_id, ()))
+            for chunk_id in chunk_ids:
+                if chunk_id in self._chunks:
+                    self._record(("remove", chunk_id))
+            return len(chunk_ids)
+    
+    def clear(self):
+        with self._lock:
+            self._record(("clear",))
+    
+    def _record(self, op: Tuple):
+        """执行一个变更操作并记录，等待下次 save 写入日志"""
+        self._apply(op)
+        self._ops.append(op)
+    
+    def _apply(self, op: Tuple):
+        kind = op[0]
+        if kind == "add":
+            _, chunk_id, frequencies, length, document_id = op
+            if chunk_id in self._chunks:
+                self._remove_chunk(chunk_id)
+            for term, tf in frequencies.items():
+                self._postings.setdefault(term, {})[chunk_id] = tf
+            self._chunks[chunk_id] = (length, list(frequencies), document_id)
+            self._total_length += length
+            if document_id:
+                self._document_chunks.setdefault(document_id, set()).add(chunk_id)
+        elif kind == "remove":
+            if op[1] in self._chunks:
+                self._remove_chunk(op[1])
+        elif kind == "clear":
+            self._reset()
+    
+    def _remove_chunk(self, chunk_id: str):
+        length, terms, document_id = self._chunks.pop(chunk_id)
+        self._total_length -= length
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(chunk_id, None)
+            if not posting:
+                del self._postings[term]
+        
+        chunk_ids = self._document_chunks.get(document_id)
+        if chunk_ids is not None:
+            chunk_ids.discard(chunk_id)
+            if not chunk_ids:
+                del self._document_chunks[document_id]
+    
+    def search(self, query: str, top_k: int, allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """BM25检索，返回按分数降序的 (chunk_id, score)；allowed_ids 限定只在子集内打分"""
+        query_terms = set(tokenize(query))
+        with self._lock:
+            total = len(self._chunks)
+            if not total or not query_terms:
+                return []
+            
+            avg_length = self._total_length / total if total else 0.0
+            scores: Dict[str, float] = {}
+            for term in query_terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, tf in posting.items():
+                    if allowed_ids is not None and chunk_id not in allowed_ids:
+                        continue
+                    length = self._chunks[chunk_id][0]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": len(self._chunks),
+            "documents": len(self._document_chunks),
+            "terms": len(self._postings),
+            "avg_chunk_terms": self._total_length / len(self._chunks) if self._chunks else 0.0
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """倒数排名融合：score = Σ 1 / (k + rank)，rank 从1开始"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
\ No newline at end of file
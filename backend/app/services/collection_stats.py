@@ -0,0 +1,145 @@
+"""
+集合统计计数器
+
+文档块数、文档数和各来源块数在入库、删除、清空时增量维护，并持久化为 JSON 文件，
+/status 读取统计时无需扫描全部元数据。写操作开始前先把状态标记为未完成并落盘，
+进程在写入过程中崩溃后重启时据此检测到计数可能不准确，再从集合全量扫描重建。
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import List, Dict, Any, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionStats:
+    """增量维护的集合统计"""
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.collection_stats_path
+        self._lock = threading.Lock()
+        # document_id -> {source: 块数}
+        self._documents: Dict[str, Dict[str, int]] = {}
+        self._sources: Dict[str, int] = {}
+        self._total_chunks = 0
+        # 正在进行的写操作数；不为0时持久化状态标记为未完成
+        self._pending = 0
+        self._rebuilds = 0
+        self.loaded_clean = self._load()
+    
+    def _load(self) -> bool:
+        """读取持久化的统计，返回其是否可信（存在且上次写操作已正常完成）"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._documents = state["documents"]
+            self._total_chunks = state["total_chunks"]
+            self._sources = {}
+            for sources in self._documents.values():
+                for source, count in sources.items():
+                    self._sources[source] = self._sources.get(source, 0) + count
+            return bool(state.get("clean"))
+        except Exception as e:
+            logger.error(f"读取集合统计失败: {str(e)}")
+            return False
+    
+    def _save(self):
+        state = {
+            "clean": self._pending == 0,
+            "total_chunks": self._total_chunks,
+            "documents": self._documents
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+    
+    def begin_write(self):
+        """写操作开始：标记为未完成并落盘"""
+        with self._lock:
+            self._pending += 1
+            if self._pending == 1:
+                self._save()
+    
+    def end_write(self):
+        """写操作结束：全部写操作完成后以已完成状态落盘"""
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+            self._save()
+    
+    def needs_rebuild(self, collection_count: int) -> bool:
+        """上次未正常结束或块数与集合不一致时需要重建"""
+        return not self.loaded_clean or self._total_chunks != collection_count
+    
+    def record_added(self, metadatas: List[Dict[str, Any]]):
+        with self._lock:
+            for metadata in metadatas:
+                self._apply(metadata, 1)
+    
+    def record_removed(self, metadatas: List[Dict[str, Any]]):
+        with self._lock:
+            for metadata in metadatas:
+                self._apply(metadata, -1)
+    
+    def _apply(self, metadata: Dict[str, Any], delta: int):
+        metadata = metadata or {}
+        source = metadata.get("source", "unknown")
+        document_id = metadata.get("document_id", source)
+        
+        sources = self._documents.setdefault(document_id, {})
+        sources[source] = sources.get(source, 0) + delta
+        if sources[source] <= 0:
+            del sources[source]
+        if not sources:
+            del self._documents[document_id]
+        
+        self._sources[source] = self._sources.get(source, 0) + delta
+        if self._sources[source] <= 0:
+            del self._sources[source]
+        
+        self._total_chunks = max(0, self._total_chunks + delta)
+    
+    def reset(self):
+        with self._lock:
+            self._documents.clear()
+            self._sources.clear()
+            self._total_chunks = 0
+    
+    def rebuild(self, collection, page_size: int = 1000):
+        """从集合全量扫描重建统计"""
+        total = collection.count()
+        logger.info(f"全量扫描重建集合统计，共 {total} 个文档块")
+        
+        with self._lock:
+            self._documents.clear()
+            self._sources.clear()
+            self._total_chunks = 0
+            for offset in range(0, total, page_size):
+                results = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+                for metadata in results.get("metadatas") or []:
+                    self._apply(metadata, 1)
+            self._rebuilds += 1
+            self._save()
+        self.loaded_clean = True
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total_chunks": self._total_chunks,
+                "total_documents": len(self._documents),
+                "sources": dict(self._sources)
+            }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pending_writes": self._pending,
+            "rebuilds": self._rebuilds
+        }
\ No newline at end of file
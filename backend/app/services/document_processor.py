@@ -1,141 +1,148 @@
+import asyncio
+import codecs
+import hashlib
 import os
 import uuid
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Optional, Tuple
 from pathlib import Path
 import logging
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from PyPDF2 import PdfReader
-from docx import Document as DocxDocument
+from multipart.multipart import MultipartParser, parse_options_header
 import aiofiles
 
 from ..core.config import settings
+from .text_extraction import TextExtractor
+from .text_splitter import TextSplitter
 
 logger = logging.getLogger(__name__)
 
+# 纯文本每次读取的字符数
+TEXT_BLOCK_CHARS = 64 * 1024
+# 流式分块时缓冲区累积到多少个块大小后切分一次
+SPLIT_BUFFER_CHUNKS = 4
+# multipart 请求体中除文件内容外的边界和字段头部允许占用的字节数
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+def detect_text_encoding(file_path: str) -> str:
+    """逐块增量解码检查文件是否为 UTF-8，否则按 GBK 读取"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(file_path, 'rb') as f:
+            while True:
+                block = f.read(TEXT_BLOCK_CHARS)
+                if not block:
+                    break
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gbk'
+
+class FileTooLargeError(ValueError):
+    """上传文件超出大小限制"""
+    pass
+
 class DocumentProcessor:
     """文档处理服务，负责文档解析和文本分块"""
     
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.chunk_size,
-            chunk_overlap=settings.chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-    
-    async def process_file(self, file_path: str, filename: str) -> Dict[str, Any]:
-        """处理上传的文件，返回文档信息和分块结果"""
-        try:
-            # 提取文本内容
-            text_content = await self._extract_text(file_path, filename)
-            
-            if not text_content.strip():
-                raise ValueError("文档内容为空")
-            
-            # 生成文档ID
-            doc_id = str(uuid.uuid4())
-            
-            # 文本分块
-            chunks = self._split_text(text_content, filename, doc_id)
-            
-            # 构建文档元数据
-            document_info = {
-                "id": doc_id,
-                "title": filename,
-                "content": text_content,
-                "file_type": Path(filename).suffix.lower(),
-                "source": filename,
-                "chunk_count": len(chunks),
-                "chunks": chunks
-            }
-            
-            logger.info(f"成功处理文档: {filename}, 生成 {len(chunks)} 个文本块")
-            return document_info
-            
-        except Exception as e:
-            logger.error(f"处理文档失败 {filename}: {str(e)}")
-            raise
+        self.text_splitter = TextSplitter(settings.chunk_size, settings.chunk_overlap)
+        self.extractor = TextExtractor()
     
-    async def _extract_text(self, file_path: str, filename: str) -> str:
-        """根据文件类型提取文本内容"""
+    async def iter_text(self, file_path: str, filename: str) -> AsyncIterator[str]:
+        """根据文件类型逐段产出文本内容（PDF 按页范围，纯文本按固定大小的块）"""
         file_ext = Path(filename).suffix.lower()
         
         if file_ext == '.pdf':
-            return await self._extract_pdf_text(file_path)
+            try:
+                async for text in self.extractor.iter_pdf(file_path):
+                    yield text
+            except ValueError as e:
+                raise ValueError(f"PDF解析失败: {str(e)}")
         elif file_ext == '.docx':
-            return await self._extract_docx_text(file_path)
+            # python-docx 只能整体加载文档
+            try:
+                yield await self.extractor.extract_docx(file_path)
+            except ValueError as e:
+                raise ValueError(f"DOCX解析失败: {str(e)}")
         elif file_ext in ['.txt', '.md']:
-            return await self._extract_plain_text(file_path)
+            async for text in self._iter_plain_text(file_path):
+                yield text
         else:
             raise ValueError(f"不支持的文件格式: {file_ext}")
     
-    async def _extract_pdf_text(self, file_path: str) -> str:
-        """提取PDF文本"""
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                text_content = ""
-                
-                for page in pdf_reader.pages:
-                    text_content += page.extract_text() + "\n"
-                
-                return text_content.strip()
-        except Exception as e:
-            raise ValueError(f"PDF解析失败: {str(e)}")
-    
-    async def _extract_docx_text(self, file_path: str) -> str:
-        """提取DOCX文本"""
-        try:
-            doc = DocxDocument(file_path)
-            text_content = ""
-            
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text_content += paragraph.text + "\n"
-            
-            return text_content.strip()
-        except Exception as e:
-            raise ValueError(f"DOCX解析失败: {str(e)}")
-    
-    async def _extract_plain_text(self, file_path: str) -> str:
-        """提取纯文本"""
+    async def _iter_plain_text(self, file_path: str) -> AsyncIterator[str]:
+        """按块读取纯文本（先确定编码，避免读到一半才发现不是 UTF-8）"""
+        encoding = await asyncio.to_thread(detect_text_encoding, file_path)
         try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as file:
-                content = await file.read()
-                return content.strip()
-        except UnicodeDecodeError:
-            # 尝试其他编码
-            try:
-                async with aiofiles.open(file_path, 'r', encoding='gbk') as file:
-                    content = await file.read()
-                    return content.strip()
-            except Exception as e:
-                raise ValueError(f"文本文件编码错误: {str(e)}")
-        except Exception as e:
-            raise ValueError(f"纯文本解析失败: {str(e)}")
+            async with aiofiles.open(file_path, 'r', encoding=encoding) as file:
+                while True:
+                    text = await file.read(TEXT_BLOCK_CHARS)
+                    if not text:
+                        break
+                    yield text
+        except UnicodeDecodeError as e:
+            raise ValueError(f"文本文件编码错误: {str(e)}")
     
-    def _split_text(self, text: str, source: str, doc_id: str) -> List[Document]:
-        """将文本分割成块"""
-        # 使用LangChain的文本分割器
-        text_chunks = self.text_splitter.split_text(text)
+    async def iter_chunks(self, texts: AsyncIterator[str], source: str, doc_id: str) -> AsyncIterator[Document]:
+        """
+        将逐段产出的文本切分为文档块并逐个产出
         
-        documents = []
-        for i, chunk in enumerate(text_chunks):
-            doc = Document(
+        文本累积到若干个块大小后切分一次，最后一块可能被截断，留到与后续文本一起切分，
+        因此分块结果与整体切分一致，内存占用只与缓冲区大小有关，与文档大小无关。
+        """
+        file_type = Path(source).suffix.lower()
+        buffer = ""
+        # 上一个已产出块在 buffer 中的结束位置
+        previous_end = 0
+        chunk_index = 0
+        
+        def to_document(chunk: str) -> Document:
+            return Document(
                 page_content=chunk,
                 metadata={
                     "source": source,
+                    "file_type": file_type,
                     "document_id": doc_id,
-                    "chunk_index": i,
-                    "chunk_count": len(text_chunks),
+                    "chunk_index": chunk_index,
                     "chunk_size": len(chunk)
                 }
             )
-            documents.append(doc)
         
-        return documents
+        async for text in texts:
+            buffer += text
+            if len(buffer) < settings.chunk_size * SPLIT_BUFFER_CHUNKS:
+                continue
+            spans = self.text_splitter.split_spans(buffer[:self.text_splitter.stable_length(buffer)], previous_end)
+            if len(spans) < 2:
+                if len(buffer) < settings.chunk_size * SPLIT_BUFFER_CHUNKS * 2:
+                    continue
+                # 缓冲区内没有稳定的断点（如大段只有空白或标点），按整个缓冲区强制切分，
+                # 否则缓冲区会无限增长，每段文本都要重新扫描整个缓冲区
+                spans = self.text_splitter.split_spans(buffer, previous_end)
+                if len(spans) < 2:
+                    # 最后一块之后只剩空白：产出该块并丢弃空白，后续文本重新开始切分
+                    for start, end in spans:
+                        yield to_document(buffer[start:end])
+                        chunk_index += 1
+                    buffer, previous_end = "", 0
+                    continue
+            for start, end in spans[:-1]:
+                yield to_document(buffer[start:end])
+                chunk_index += 1
+            # 按偏移只保留最后一块起点之后的文本
+            carry_from = spans[-1][0]
+            previous_end = max(0, spans[-2][1] - carry_from)
+            buffer = buffer[carry_from:]
+        
+        for start, end in self.text_splitter.split_spans(buffer, previous_end):
+            yield to_document(buffer[start:end])
+            chunk_index += 1
+        
+        if chunk_index == 0:
+            raise ValueError("文档内容为空")
+        logger.info(f"成功处理文档: {source}, 生成 {chunk_index} 个文本块")
     
     def validate_file(self, filename: str, file_size: int) -> bool:
         """验证文件格式和大小"""
@@ -150,6 +157,111 @@ class DocumentProcessor:
         
         return True
     
+    async def save_multipart_upload(
+        self,
+        content_type: str,
+        content_length: Optional[int],
+        stream: AsyncIterator[bytes],
+        field_name: str = "file"
+    ) -> Tuple[str, str, int, str]:
+        """
+        边接收 multipart/form-data 请求体边解析，把 field_name 字段的文件直接写入上传目录，
+        返回 (文件名, 文件路径, 文件大小, sha256)
+        
+        不经过框架的表单解析（会先把整个请求体缓存到临时文件，再复制一次到上传目录）。
+        Content-Length 已超出大小限制时不读取请求体直接拒绝；文件格式在读到文件字段的
+        头部时验证；写入的字节数超出限制时立即停止接收并删除已写入的部分，抛出 FileTooLargeError。
+        """
+        if content_length is not None and content_length > settings.max_file_size + MULTIPART_OVERHEAD_BYTES:
+            raise FileTooLargeError(f"文件大小超出限制: 请求体 {content_length} bytes")
+        
+        mime_type, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if mime_type != b"multipart/form-data" or not boundary:
+            raise ValueError("请求必须是带 boundary 的 multipart/form-data")
+        
+        # 解析器在 write 中同步回调，事件先收集起来，再异步写入文件
+        events: List[Tuple[str, bytes]] = []
+        header_field = bytearray()
+        header_value = bytearray()
+        
+        def on_header_end():
+            events.append(("header", bytes(header_field).lower() + b":" + bytes(header_value)))
+            header_field.clear()
+            header_value.clear()
+        
+        parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": lambda: events.append(("begin", b"")),
+            "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+            "on_part_end": lambda: events.append(("end", b"")),
+            "on_header_field": lambda data, start, end: header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: header_value.extend(data[start:end]),
+            "on_header_end": on_header_end,
+            "on_headers_finished": lambda: events.append(("headers_finished", b"")),
+        })
+        
+        filename: Optional[str] = None
+        destination: Optional[str] = None
+        file = None
+        receiving = False
+        file_size = 0
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        disposition = b""
+        try:
+            async for body in stream:
+                parser.write(body)
+                for kind, data in events:
+                    if kind == "begin":
+                        disposition = b""
+                    elif kind == "header" and data.startswith(b"content-disposition:"):
+                        disposition = data.split(b":", 1)[1]
+                    elif kind == "headers_finished":
+                        _, part_options = parse_options_header(disposition)
+                        name = part_options.get(b"name", b"").decode("utf-8", "replace")
+                        if destination is None and name == field_name:
+                            filename = part_options.get(b"filename", b"").decode("utf-8", "replace")
+                            if not filename:
+                                raise ValueError("文件名不能为空")
+                            self.validate_file(filename, 0)
+                            destination = os.path.join(
+                                settings.upload_directory, f"{uuid.uuid4().hex}{Path(filename).suffix}"
+                            )
+                            file = await aiofiles.open(destination, 'wb')
+                            receiving = True
+                    elif kind == "data" and receiving:
+                        file_size += len(data)
+                        if file_size > settings.max_file_size:
+                            raise FileTooLargeError(f"文件大小超出限制: 超过 {settings.max_file_size} bytes")
+                        digest.update(data)
+                        buffer += data
+                        if len(buffer) >= settings.upload_chunk_size:
+                            await file.write(bytes(buffer))
+                            buffer.clear()
+                    elif kind == "end" and receiving:
+                        await file.write(bytes(buffer))
+                        buffer.clear()
+                        receiving = False
+                events.clear()
+            parser.finalize()
+            
+            if destination is None:
+                raise ValueError(f"请求中缺少文件字段: {field_name}")
+            if receiving:
+                raise ValueError("请求体不完整")
+        except BaseException:
+            if file is not None:
+                await file.close()
+                file = None
+            if destination is not None:
+                await self.cleanup_temp_file(destination)
+            raise
+        finally:
+            if file is not None:
+                await file.close()
+        
+        return filename, destination, file_size, digest.hexdigest()
+    
     async def cleanup_temp_file(self, file_path: str):
         """清理临时文件"""
         try:
@@ -157,4 +269,8 @@ class DocumentProcessor:
                 os.remove(file_path)
                 logger.info(f"已清理临时文件: {file_path}")
         except Exception as e:
-            logger.warning(f"清理临时文件失败 {file_path}: {str(e)}") 
\ No newline at end of file
+            logger.warning(f"清理临时文件失败 {file_path}: {str(e)}")
+    
+    def close(self):
+        """关闭解析进程池"""
+        self.extractor.close()
\ No newline at end of file
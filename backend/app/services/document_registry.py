@@ -0,0 +1,193 @@
+"""
+文档登记表
+
+入库时由 RAGService.add_document 写入每个文档的摘要信息（来源、类型、创建时间、
+块数、文件大小、内容预览），文档列表直接读取该表，无需从向量集合取回全部文本。
+"""
+
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 200
+
+
+def make_preview(content: str) -> str:
+    """生成内容预览，超出长度时截断并加省略号"""
+    return content[:PREVIEW_LENGTH] + "..." if len(content) > PREVIEW_LENGTH else content
+
+
+def encode_cursor(*values) -> str:
+    """把排序键编码为不透明的分页游标"""
+    return base64.urlsafe_b64encode(json.dumps(list(values), ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """解码分页游标，格式错误时抛出 ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return values
+
+
+class DocumentRegistry:
+    """SQLite 文档登记表"""
+    
+    _COLUMNS = ("id", "source", "file_type", "created_at", "chunk_count", "size", "preview")
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.document_registry_path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                file_type TEXT,
+                created_at TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL DEFAULT 0,
+                preview TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at)")
+        self._conn.commit()
+    
+    def register(
+        self,
+        document_id: str,
+        source: str,
+        file_type: str,
+        chunk_count: int,
+        size: int,
+        preview: str,
+        created_at: Optional[str] = None
+    ):
+        """登记（或覆盖）一个文档"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (id, source, file_type, created_at, chunk_count, size, preview) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (document_id, source, file_type, created_at or datetime.now().isoformat(), chunk_count, size, preview)
+            )
+            self._conn.commit()
+    
+    def remove(self, document_id: Optional[str]):
+        """删除登记，document_id 为 None 时清空"""
+        with self._lock:
+            if document_id is None:
+                self._conn.execute("DELETE FROM documents")
+            else:
+                self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            self._conn.commit()
+    
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM documents WHERE id = ?", (document_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """按创建时间倒序列出全部文档"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM documents ORDER BY created_at DESC, id"
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+    
+    def list_page(self, cursor: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        按 (created_at 倒序, id) 键集分页，返回 (本页文档, 下一页游标)
+        
+        游标记录上一页最后一条的排序键，翻页时不受前面页面增删的影响
+        """
+        query = f"SELECT {', '.join(self._COLUMNS)} FROM documents"
+        params: List[Any] = []
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 2:
+                raise ValueError(f"无效的分页游标: {cursor}")
+            query += " WHERE created_at < ? OR (created_at = ? AND id > ?)"
+            params.extend([values[0], values[0], values[1]])
+        query += " ORDER BY created_at DESC, id LIMIT ?"
+        params.append(limit + 1)
+        
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        
+        documents = [self._to_dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = documents[-1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        return documents, next_cursor
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    
+    def backfill(self, collection, page_size: int = 1000):
+        """登记表为空而集合中已有文档时（如升级前入库的数据），从块元数据补录一次"""
+        total = collection.count()
+        if total == 0 or self.count() > 0:
+            return
+        
+        logger.info(f"从向量集合补录文档登记表，共 {total} 个文档块")
+        documents: Dict[str, Dict[str, Any]] = {}
+        for offset in range(0, total, page_size):
+            results = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            for content, metadata in zip(results.get("documents") or [], results.get("metadatas") or []):
+                document_id = metadata.get("document_id") or metadata.get("source", "unknown")
+                entry = documents.setdefault(document_id, {
+                    "source": metadata.get("source", "未知文档"),
+                    "file_type": metadata.get("file_type") or os.path.splitext(metadata.get("source", ""))[1].lower(),
+                    "created_at": metadata.get("created_at") or datetime.now().isoformat(),
+                    "chunk_count": 0,
+                    "size": 0,
+                    "first_index": None,
+                    "preview": ""
+                })
+                entry["chunk_count"] += 1
+                entry["size"] += len((content or "").encode("utf-8"))
+                chunk_index = metadata.get("chunk_index", 0)
+                if entry["first_index"] is None or chunk_index < entry["first_index"]:
+                    entry["first_index"] = chunk_index
+                    entry["preview"] = make_preview(content or "")
+        
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (id, source, file_type, created_at, chunk_count, size, preview) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (document_id, entry["source"], entry["file_type"], entry["created_at"],
+                     entry["chunk_count"], entry["size"], entry["preview"])
+                    for document_id, entry in documents.items()
+                ]
+            )
+            self._conn.commit()
+    
+    def _to_dict(self, row) -> Dict[str, Any]:
+        document = dict(zip(self._COLUMNS, row))
+        # 列表接口沿用 content 字段作为预览
+        document["content"] = document["preview"]
+        return document
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
\ No newline at end of file
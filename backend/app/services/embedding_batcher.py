@@ -0,0 +1,117 @@
+"""
+查询向量请求合并器
+
+在短时间窗口内收集并发的单条编码请求，合并为一次批量 /embeddings 调用，
+再把结果逐行分发给各个调用方
+"""
+
+import asyncio
+import logging
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """嵌入请求合并器，位于 RemoteEmbeddingService 之前"""
+    
+    def __init__(self, embedding_service, window_ms: Optional[float] = None, max_batch_size: Optional[int] = None):
+        self.embedding_service = embedding_service
+        self.window = (settings.embedding_batch_window_ms if window_ms is None else window_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size or settings.embedding_batch_max_size)
+        
+        # 等待合并的请求: (文本, future, 入队时间)
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+        
+        # 统计指标
+        self._request_count = 0
+        self._batch_count = 0
+        self._max_batch_size_seen = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+    
+    async def encode_single(self, text: str) -> np.ndarray:
+        """编码单个文本，与并发请求合并后发送"""
+        if self.window <= 0:
+            return await self.embedding_service.encode_single(text)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """取出当前等待的请求并发起一次批量编码"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        if not self._pending:
+            return
+        
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+    
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        """执行批量编码并把结果分发给各调用方"""
+        now = time.perf_counter()
+        waits = [now - enqueued_at for _, _, enqueued_at in batch]
+        self._record_batch(len(batch), waits)
+        
+        # 同一批次内的重复文本只编码一次
+        unique_texts = list(dict.fromkeys(text for text, _, _ in batch))
+        
+        try:
+            embeddings = await self.embedding_service.encode(unique_texts, use_cache=False)
+            if len(embeddings) != len(unique_texts):
+                raise ValueError(f"嵌入结果数量不匹配: 期望 {len(unique_texts)}，实际 {len(embeddings)}")
+        except Exception as e:
+            logger.error(f"批量查询编码失败: {str(e)}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        rows = {text: embeddings[i] for i, text in enumerate(unique_texts)}
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(rows[text])
+        
+        logger.debug(f"合并 {len(batch)} 个查询编码请求为 1 次调用")
+    
+    def _record_batch(self, batch_size: int, waits: List[float]):
+        """记录批次指标"""
+        self._batch_count += 1
+        self._request_count += batch_size
+        self._max_batch_size_seen = max(self._max_batch_size_seen, batch_size)
+        self._total_wait += sum(waits)
+        self._max_wait = max(self._max_wait, max(waits))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并器统计信息"""
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "requests": self._request_count,
+            "batches": self._batch_count,
+            "avg_batch_size": self._request_count / self._batch_count if self._batch_count else 0.0,
+            "max_batch_size_seen": self._max_batch_size_seen,
+            "avg_queue_wait_ms": self._total_wait / self._request_count * 1000.0 if self._request_count else 0.0,
+            "max_queue_wait_ms": self._max_wait * 1000.0,
+            "pending": len(self._pending)
+        }
\ No newline at end of file
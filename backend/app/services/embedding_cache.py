@@ -0,0 +1,184 @@
+"""
+持久化嵌入缓存
+
+以 (模型名, 文本哈希) 为键把嵌入向量保存在 SQLite 中，
+超出容量上限时按最近访问时间淘汰（LRU）。命中时的访问时间批量写回，读取不触发磁盘写入。
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """基于 SQLite 的内容寻址嵌入缓存"""
+    
+    # SQLite 单条语句的参数数量有限，批量查询时分段
+    _QUERY_CHUNK = 500
+    # 命中后的访问时间先记在内存中，累计到该数量（或写入、淘汰、关闭时）再批量写回
+    _TOUCH_FLUSH = 1000
+    
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or settings.embedding_cache_path
+        self.max_bytes = max_bytes or settings.embedding_cache_max_mb * 1024 * 1024
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._entry_count, self._total_bytes = row[0], row[1]
+        
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        # (模型名, 文本哈希) -> 尚未写回的最近访问时间
+        self._pending_touches: Dict[Tuple[str, str], float] = {}
+        
+        logger.info(f"嵌入缓存已加载: {self.path}，{self._entry_count} 条，{self._total_bytes / 1024 / 1024:.1f}MB")
+    
+    @staticmethod
+    def _hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        """批量查询缓存，返回命中的 文本 -> 向量"""
+        hashes = {self._hash_text(text): text for text in texts}
+        found: Dict[str, np.ndarray] = {}
+        now = time.time()
+        
+        with self._lock:
+            keys = list(hashes.keys())
+            for i in range(0, len(keys), self._QUERY_CHUNK):
+                part = keys[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[hashes[text_hash]] = np.frombuffer(blob, dtype=np.float32)
+                    self._pending_touches[(model, text_hash)] = now
+            
+            if len(self._pending_touches) >= self._TOUCH_FLUSH:
+                self._flush_touches()
+                self._conn.commit()
+            
+            self._hits += len(found)
+            self._misses += len(hashes) - len(found)
+        
+        return found
+    
+    def _flush_touches(self):
+        """把内存中记录的访问时间写回（调用方持有锁并负责提交）"""
+        if not self._pending_touches:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+            [(last_access, model, text_hash) for (model, text_hash), last_access in self._pending_touches.items()]
+        )
+        self._pending_touches.clear()
+    
+    def put_many(self, model: str, texts: List[str], embeddings: np.ndarray):
+        """批量写入缓存，必要时淘汰最久未访问的条目"""
+        if not texts:
+            return
+        
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            rows.append((model, self._hash_text(text), vector.shape[0], vector.tobytes(), now))
+        
+        with self._lock:
+            for model_name, text_hash, _, blob, _ in rows:
+                existing = self._conn.execute(
+                    "SELECT LENGTH(vector) FROM embeddings WHERE model = ? AND text_hash = ?",
+                    (model_name, text_hash)
+                ).fetchone()
+                if existing:
+                    self._total_bytes -= existing[0]
+                    self._entry_count -= 1
+                self._total_bytes += len(blob)
+                self._entry_count += 1
+            
+            self._flush_touches()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _evict(self):
+        """按 LRU 淘汰，直到占用降到上限的 90%"""
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target and self._entry_count > 0:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            
+            evict_ids = []
+            for rowid, size in rows:
+                evict_ids.append((rowid,))
+                self._total_bytes -= size
+                self._entry_count -= 1
+                if self._total_bytes <= target:
+                    break
+            
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", evict_ids)
+            self._evictions += len(evict_ids)
+        
+        self._conn.commit()
+        logger.info(f"嵌入缓存淘汰完成，当前 {self._entry_count} 条，{self._total_bytes / 1024 / 1024:.1f}MB")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._hits + self._misses
+        return {
+            "entries": self._entry_count,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions
+        }
+    
+    def close(self):
+        """写回访问时间并关闭数据库连接"""
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+元数据过滤索引
+
+为 document_id / source / file_type 预先维护 取值 -> 文档ID集合 的倒排表，以及
+文档ID -> 文档块ID（含去重时跳过的重复块的别名ID）。查询带过滤条件时先解析出候选文档块子集，只在子集内检索，
+而不是先全库检索再丢弃不满足条件的结果。
+"""
+
+import logging
+import os
+import bisect
+import threading
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+FILTER_FIELDS = ("document_id", "source", "file_type")
+
+
+def normalize_file_type(value: str) -> str:
+    """统一为带点的小写扩展名，如 "PDF" -> ".pdf" """
+    value = value.strip().lower()
+    return value if value.startswith(".") else f".{value}"
+
+
+def metadata_filter_values(metadata: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """从文档块元数据中取出各过滤字段的值（旧数据没有 file_type 时由来源扩展名推断）"""
+    source = metadata.get("source")
+    file_type = metadata.get("file_type") or (os.path.splitext(source)[1] if source else "")
+    return {
+        "document_id": metadata.get("document_id"),
+        "source": source,
+        "file_type": normalize_file_type(file_type) if file_type else None
+    }
+
+
+class MetadataFilterIndex:
+    """文档级过滤字段的倒排索引"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 字段 -> 取值 -> document_id 集合
+        self._values: Dict[str, Dict[str, Set[str]]] = {field: {} for field in FILTER_FIELDS}
+        # document_id -> {文档块ID: chunk_index}
+        self._document_chunks: Dict[str, Dict[str, int]] = {}
+        # document_id -> 各字段取值，删除时用于清理倒排表
+        self._document_values: Dict[str, Dict[str, Optional[str]]] = {}
+    
+    def add(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        with self._lock:
+            for chunk_id, metadata in zip(ids, metadatas):
+                values = metadata_filter_values(metadata or {})
+                document_id = values["document_id"]
+                if not document_id:
+                    continue
+                
+                self._document_chunks.setdefault(document_id, {})[chunk_id] = (metadata or {}).get("chunk_index", 0)
+                if document_id not in self._document_values:
+                    self._document_values[document_id] = values
+                    for field, value in values.items():
+                        if value:
+                            self._values[field].setdefault(value, set()).add(document_id)
+    
+    def remove(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """移除文档块，文档的块全部移除后同时移除该文档"""
+        with self._lock:
+            for chunk_id, metadata in zip(ids, metadatas):
+                document_id = (metadata or {}).get("document_id")
+                chunk_ids = self._document_chunks.get(document_id)
+                if chunk_ids is None:
+                    continue
+                chunk_ids.pop(chunk_id, None)
+                if not chunk_ids:
+                    self._remove_document(document_id)
+    
+    def remove_document(self, document_id: str):
+        with self._lock:
+            self._remove_document(document_id)
+    
+    def _remove_document(self, document_id: str):
+        self._document_chunks.pop(document_id, None)
+        values = self._document_values.pop(document_id, None) or {}
+        for field, value in values.items():
+            documents = self._values[field].get(value)
+            if documents is None:
+                continue
+            documents.discard(document_id)
+            if not documents:
+                del self._values[field][value]
+    
+    def clear(self):
+        with self._lock:
+            for values in self._values.values():
+                values.clear()
+            self._document_chunks.clear()
+            self._document_values.clear()
+    
+    def rebuild(self, collection, page_size: int = 1000):
+        """从集合元数据全量构建"""
+        self.clear()
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            results = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+            self.add(results["ids"], results.get("metadatas") or [])
+        logger.info(f"过滤索引构建完成: {len(self._document_chunks)} 个文档")
+    
+    def resolve_documents(self, filters: Dict[str, List[str]]) -> Set[str]:
+        """解析过滤条件：同一字段内取并集，不同字段之间取交集"""
+        with self._lock:
+            result: Optional[Set[str]] = None
+            for field, values in filters.items():
+                if field not in self._values:
+                    raise ValueError(f"不支持的过滤字段: {field}")
+                matched: Set[str] = set()
+                for value in values:
+                    matched |= self._values[field].get(value, set())
+                result = matched if result is None else result & matched
+                if not result:
+                    return set()
+            return result if result is not None else set(self._document_chunks)
+    
+    def chunk_ids(self, document_ids: Set[str]) -> List[str]:
+        with self._lock:
+            return [
+                chunk_id
+                for document_id in document_ids
+                for chunk_id in self._document_chunks.get(document_id, ())
+            ]
+    
+    def chunk_count(self, document_id: str) -> int:
+        with self._lock:
+            return len(self._document_chunks.get(document_id, ()))
+    
+    def document_chunks(
+        self, document_id: str, after_index: Optional[int] = None, limit: Optional[int] = None
+    ) -> Tuple[int, List[Tuple[str, int]]]:
+        """
+        按块索引排序的文档块，返回 (块总数, [(块ID, chunk_index)])
+        
+        after_index 为键集分页游标（上一页最后一块的索引），只返回索引更大的块
+        """
+        with self._lock:
+            chunks = sorted(self._document_chunks.get(document_id, {}).items(), key=lambda item: item[1])
+        start = 0
+        if after_index is not None:
+            start = bisect.bisect_right([chunk_index for _, chunk_index in chunks], after_index)
+        end = len(chunks) if limit is None else start + limit
+        return len(chunks), chunks[start:end]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._document_chunks),
+            "values": {field: len(values) for field, values in self._values.items()}
+        }
\ No newline at end of file
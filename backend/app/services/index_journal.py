@@ -0,0 +1,88 @@
+"""
+索引增量日志
+
+BM25 倒排索引和去重指纹索引原先每次入库/删除后都把整个索引重新 pickle 写盘，写入量与
+语料规模成正比。改为“快照 + 增量日志”：每次 save 只把自上次保存以来的变更操作追加到
+SQLite 日志（一次事务），日志累计的操作数超过索引规模时才重写一次快照并截断日志，
+摊还后每次写入的持久化开销与变更量成正比。快照中记录其已包含的日志序号，加载时先读快照，
+再按序回放之后的日志。
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from typing import List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IndexJournal:
+    """SQLite 增量日志，每行是一次 save 追加的一组操作"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op_count INTEGER NOT NULL,
+                ops BLOB NOT NULL
+            )
+        """)
+        self._conn.commit()
+    
+    def append(self, ops: List[Any]) -> int:
+        """追加一组操作，返回其序号"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO journal (op_count, ops) VALUES (?, ?)",
+                (len(ops), pickle.dumps(ops, protocol=pickle.HIGHEST_PROTOCOL))
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+    
+    def last_seq(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(seq) FROM journal").fetchone()
+        return row[0] or 0
+    
+    def replay(self, after_seq: int) -> List[Tuple[int, List[Any]]]:
+        """序号大于 after_seq 的各组操作，按序号排序"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, ops FROM journal WHERE seq > ? ORDER BY seq", (after_seq,)
+            ).fetchall()
+        return [(seq, pickle.loads(ops)) for seq, ops in rows]
+    
+    def op_count(self, after_seq: int = 0) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT SUM(op_count) FROM journal WHERE seq > ?", (after_seq,)).fetchone()
+        return row[0] or 0
+    
+    def truncate(self, upto_seq: Optional[int] = None):
+        """删除已写入快照的日志（不指定时全部删除）"""
+        with self._lock:
+            if upto_seq is None:
+                self._conn.execute("DELETE FROM journal")
+            else:
+                self._conn.execute("DELETE FROM journal WHERE seq <= ?", (upto_seq,))
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def write_snapshot(path: str, state: bytes):
+    """写入快照（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(state)
+    os.replace(tmp_path, path)
\ No newline at end of file
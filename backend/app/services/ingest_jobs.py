@@ -0,0 +1,310 @@
+"""
+后台入库任务
+
+/upload 保存文件后只登记一个入库任务并立即返回任务ID，由固定数量的后台工作协程
+依次执行解析、分块、嵌入和写入。任务状态持久化在 SQLite 中：排队中的任务以及
+进程退出时仍在执行的任务（其部分写入由入库预写日志回滚）在重启后重新排队执行。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobStore:
+    """SQLite 入库任务表"""
+    
+    _COLUMNS = (
+        "id", "filename", "file_path", "file_size", "sha256", "status", "stage", "total_chunks",
+        "processed_chunks", "document_id", "result", "error", "created_at", "started_at", "finished_at"
+    )
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.ingest_job_db_path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                file_size INTEGER NOT NULL DEFAULT 0,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                total_chunks INTEGER NOT NULL DEFAULT 0,
+                processed_chunks INTEGER NOT NULL DEFAULT 0,
+                document_id TEXT,
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT
+            )
+        """)
+        # 早期版本的任务表没有 sha256 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "sha256" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN sha256 TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._conn.commit()
+    
+    def create(self, filename: str, file_path: str, file_size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "filename": filename,
+            "file_path": file_path,
+            "file_size": file_size,
+            "sha256": sha256,
+            "status": QUEUED,
+            "stage": QUEUED,
+            "total_chunks": 0,
+            "processed_chunks": 0,
+            "document_id": None,
+            "result": None,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None
+        }
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                [job[column] for column in self._COLUMNS]
+            )
+            self._conn.commit()
+        return job
+    
+    def update(self, job_id: str, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+            self._conn.commit()
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def list_jobs(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+    
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """排队中和执行中的任务，按创建时间排序"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+    
+    def _to_dict(self, row) -> Dict[str, Any]:
+        job = dict(zip(self._COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IngestJobManager:
+    """入库任务队列和工作协程池"""
+    
+    def __init__(self, rag_service, store: Optional[JobStore] = None, workers: Optional[int] = None):
+        self.rag_service = rag_service
+        self.store = store or JobStore()
+        self.worker_count = max(1, workers or settings.ingest_job_workers)
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # 执行中的任务: job_id -> 执行 add_document 的 task
+        self._running: Dict[str, asyncio.Task] = {}
+        # 执行中任务的实时进度，阶段变化时才写入数据库
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._closing = False
+    
+    async def start(self):
+        """启动工作协程，并把上次未完成的任务重新排队"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        
+        for job in await asyncio.to_thread(self.store.unfinished):
+            if job["status"] == RUNNING:
+                # 上次执行到一半，部分写入已在启动时由预写日志回滚
+                await asyncio.to_thread(
+                    self.store.update, job["id"], status=QUEUED, stage=QUEUED, processed_chunks=0, started_at=None
+                )
+            self._queue.put_nowait(job["id"])
+            logger.info(f"恢复入库任务 {job['id']}: {job['filename']}")
+        
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.worker_count)]
+    
+    async def submit(self, filename: str, file_path: str, file_size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """登记入库任务并排队"""
+        await self.start()
+        job = await asyncio.to_thread(self.store.create, filename, file_path, file_size, sha256)
+        self._queue.put_nowait(job["id"])
+        return self._with_metrics(job)
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        return self._with_metrics(job) if job else None
+    
+    async def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        jobs = await asyncio.to_thread(self.store.list_jobs, limit)
+        return [self._with_metrics(job) for job in jobs]
+    
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取消任务：排队中的任务直接标记为已取消，执行中的任务中断并回滚已写入的块
+        
+        已进入登记阶段（写入已完成）或已结束的任务不能取消，原样返回
+        """
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return None
+        
+        if job["status"] == QUEUED:
+            await asyncio.to_thread(
+                self.store.update, job_id, status=CANCELLED, stage=CANCELLED, finished_at=datetime.now().isoformat()
+            )
+            await self.rag_service.document_processor.cleanup_temp_file(job["file_path"])
+        elif job["status"] == RUNNING:
+            task = self._running.get(job_id)
+            stage = self._progress.get(job_id, {}).get("stage")
+            if task is not None and stage != "registering":
+                task.cancel()
+                try:
+                    await asyncio.shield(task)
+                except BaseException:
+                    pass
+        
+        return await self.get(job_id)
+    
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"入库任务 {job_id} 执行异常: {str(e)}")
+            finally:
+                self._queue.task_done()
+    
+    async def _run_job(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] != QUEUED:
+            # 排队期间已被取消
+            return
+        
+        started_at = datetime.now().isoformat()
+        await asyncio.to_thread(self.store.update, job_id, status=RUNNING, stage="extracting", started_at=started_at)
+        self._progress[job_id] = {"stage": "extracting", "processed_chunks": 0, "total_chunks": 0}
+        
+        def on_progress(stage: str, processed: int, total: int):
+            progress = self._progress[job_id]
+            stage_changed = stage != progress["stage"]
+            progress.update(stage=stage, processed_chunks=processed, total_chunks=total)
+            if stage_changed:
+                self.store.update(job_id, stage=stage, processed_chunks=processed, total_chunks=total)
+        
+        task = asyncio.ensure_future(self.rag_service.add_document(job["file_path"], job["filename"], progress=on_progress))
+        self._running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self._closing or not task.cancelled():
+                # 服务关闭，任务保持执行中状态，重启后重新排队
+                raise
+            progress = self._progress.get(job_id, {})
+            await asyncio.to_thread(
+                self.store.update, job_id, status=CANCELLED, stage=CANCELLED,
+                processed_chunks=progress.get("processed_chunks", 0), finished_at=datetime.now().isoformat()
+            )
+            await self.rag_service.document_processor.cleanup_temp_file(job["file_path"])
+            logger.info(f"入库任务 {job_id} 已取消")
+        except Exception as e:
+            progress = self._progress.get(job_id, {})
+            await asyncio.to_thread(
+                self.store.update, job_id, status=FAILED, stage=progress.get("stage", FAILED),
+                processed_chunks=progress.get("processed_chunks", 0), error=str(e),
+                finished_at=datetime.now().isoformat()
+            )
+            logger.error(f"入库任务 {job_id} 失败: {str(e)}")
+        else:
+            store_result = result.get("vector_store_result", {})
+            await asyncio.to_thread(
+                self.store.update, job_id, status=SUCCEEDED, stage="done", document_id=result["id"],
+                total_chunks=result["chunk_count"], processed_chunks=result["chunk_count"],
+                result={
+                    "chunk_count": result["chunk_count"],
+                    "duplicate_count": store_result.get("duplicate_count", 0),
+                    "dedup_ratio": store_result.get("dedup_ratio", 0.0)
+                },
+                finished_at=datetime.now().isoformat()
+            )
+        finally:
+            self._running.pop(job_id, None)
+            self._progress.pop(job_id, None)
+    
+    def _with_metrics(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """合并执行中任务的实时进度，并计算吞吐量"""
+        job = {**job, **self._progress.get(job["id"], {})}
+        job.pop("file_path", None)
+        
+        elapsed = None
+        if job["started_at"]:
+            end = datetime.fromisoformat(job["finished_at"]) if job["finished_at"] else datetime.now()
+            elapsed = (end - datetime.fromisoformat(job["started_at"])).total_seconds()
+        job["elapsed"] = elapsed
+        job["chunks_per_second"] = job["processed_chunks"] / elapsed if elapsed else 0.0
+        job["progress"] = job["processed_chunks"] / job["total_chunks"] if job["total_chunks"] else 0.0
+        return job
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.worker_count,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": len(self._running)
+        }
+    
+    async def close(self):
+        """停止工作协程；执行中的任务中断并回滚，重启后重新执行"""
+        self._closing = True
+        for task in list(self._running.values()):
+            task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.store.close()
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+入库预写日志
+
+add_documents 在写入任何文档块之前先把本次入库的文档ID登记到日志，所有索引
+（向量集合、BM25、去重指纹）落盘后再删除该条记录。进程在入库过程中崩溃时，
+日志中残留的记录即为只写入了一部分的文档，启动时按文档ID回滚，避免文档只入库一半。
+流式入库事先不知道全部块ID，块ID列表可以为空。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IngestLog:
+    """SQLite 入库预写日志"""
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.ingest_log_path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_log (
+                id TEXT PRIMARY KEY,
+                document_ids TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                started_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._replayed = 0
+    
+    def begin(self, document_ids: List[str], chunk_ids: List[str]) -> str:
+        """登记一次入库，返回日志记录ID"""
+        entry_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingest_log (id, document_ids, chunk_ids, started_at) VALUES (?, ?, ?, ?)",
+                (entry_id, json.dumps(document_ids), json.dumps(chunk_ids), datetime.now().isoformat())
+            )
+            self._conn.commit()
+        return entry_id
+    
+    def complete(self, entry_id: str):
+        """入库完成（或已回滚）后删除记录"""
+        with self._lock:
+            self._conn.execute("DELETE FROM ingest_log WHERE id = ?", (entry_id,))
+            self._conn.commit()
+    
+    def pending(self) -> List[Dict[str, Any]]:
+        """未完成的入库记录，按开始时间排序"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, document_ids, chunk_ids, started_at FROM ingest_log ORDER BY started_at"
+            ).fetchall()
+        return [
+            {
+                "id": entry_id,
+                "document_ids": json.loads(document_ids),
+                "chunk_ids": json.loads(chunk_ids),
+                "started_at": started_at
+            }
+            for entry_id, document_ids, chunk_ids, started_at in rows
+        ]
+    
+    def record_replayed(self, count: int):
+        self._replayed += count
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM ingest_log").fetchone()[0]
+        return {
+            "pending": pending,
+            "replayed": self._replayed
+        }
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+单写入者 + 组提交
+
+各上传请求嵌入完成的批次不再各自调用 collection.add，而是提交到写入队列，由单个写入
+任务按提交顺序执行：相邻的写入批次合并为一次 collection.add（组提交），删除/清空等
+操作作为独占操作排在队列中，保证与之前提交的写入严格有序。
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Deque, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (块ID, 向量, 文本, 元数据)
+WriteBatch = Tuple[List[str], np.ndarray, List[str], List[Dict[str, Any]]]
+
+
+class IngestWriter:
+    """串行化所有写操作的写入队列"""
+    
+    def __init__(self, write_batches: Callable[[List[WriteBatch]], None], max_group_rows: Optional[int] = None):
+        # 同步函数，在线程中执行，负责把一组批次写入集合及各索引
+        self.write_batches = write_batches
+        self.max_group_rows = max(1, max_group_rows or settings.ingest_group_commit_max_rows)
+        
+        # 待执行操作: ("write", 批次, future) 或 ("exclusive", 协程函数, future)
+        self._pending: Deque[Tuple[str, Any, asyncio.Future]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        
+        # 统计指标
+        self._batch_count = 0
+        self._commit_count = 0
+        self._max_group_size = 0
+        self._exclusive_count = 0
+    
+    async def write(self, batch: WriteBatch):
+        """提交一个写入批次，写入完成后返回"""
+        await self._submit("write", batch)
+    
+    async def run_exclusive(self, operation: Callable[[], Awaitable[Any]]) -> Any:
+        """在此前提交的全部写入完成后独占执行 operation（删除、清空等）"""
+        return await self._submit("exclusive", operation)
+    
+    async def _submit(self, kind: str, payload: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((kind, payload, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return await future
+    
+    async def _run(self):
+        while self._pending:
+            kind, payload, future = self._pending.popleft()
+            if kind == "exclusive":
+                self._exclusive_count += 1
+                try:
+                    result = await payload()
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                continue
+            
+            # 合并队列头部连续的写入批次
+            group = [(payload, future)]
+            rows = len(payload[0])
+            while self._pending and self._pending[0][0] == "write" and rows + len(self._pending[0][1][0]) <= self.max_group_rows:
+                _, next_payload, next_future = self._pending.popleft()
+                group.append((next_payload, next_future))
+                rows += len(next_payload[0])
+            
+            await self._commit(group)
+    
+    async def _commit(self, group: List[Tuple[WriteBatch, asyncio.Future]]):
+        """写入一组批次；组写入失败时逐批重试，只让失败的批次报错"""
+        try:
+            await asyncio.to_thread(self.write_batches, [batch for batch, _ in group])
+        except Exception as e:
+            if len(group) == 1:
+                if not group[0][1].done():
+                    group[0][1].set_exception(e)
+                return
+            logger.warning(f"组提交失败（{len(group)} 个批次），逐批重试: {str(e)}")
+            for item in group:
+                await self._commit([item])
+            return
+        
+        self._batch_count += len(group)
+        self._commit_count += 1
+        self._max_group_size = max(self._max_group_size, len(group))
+        for _, future in group:
+            if not future.done():
+                future.set_result(None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_group_rows": self.max_group_rows,
+            "batches": self._batch_count,
+            "commits": self._commit_count,
+            "avg_group_size": self._batch_count / self._commit_count if self._commit_count else 0.0,
+            "max_group_size": self._max_group_size,
+            "exclusive_operations": self._exclusive_count,
+            "pending": len(self._pending)
+        }
\ No newline at end of file
@@ -0,0 +1,405 @@
+"""
+近似重复文档块检测
+
+同一手册的多个修订版会切出大量几乎相同的文档块。入库时为每个块计算 64 位 SimHash
+（基于字符 n-gram），与已入库块的指纹比较海明距离，不超过阈值的块视为近似重复，
+不再嵌入和写入，只记录为已有块的别名（连同重复块自己的元数据，用于按文档过滤、列出文档块，
+以及来源块被删除时由别名接替）。保留的块在写入提交之前只对同一次入库可见，
+提交后才对其他入库可见，避免别名指向可能被回滚的未写入块。指纹按海明阈值分段建立分桶：距离不超过 t 的
+两个指纹在 t+1 段中至少有一段完全相同，查找时只需比较同桶候选。索引以快照 + 增量日志
+的形式持久化。
+"""
+
+import hashlib
+import itertools
+import logging
+import os
+import pickle
+import re
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .index_journal import IndexJournal, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """计算文本的 64 位 SimHash（空白归一化后按字符 n-gram 取特征）"""
+    text = _WHITESPACE_RE.sub(" ", text).strip().lower()
+    if len(text) <= shingle_size:
+        shingles = [text]
+    else:
+        shingles = [text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)]
+    
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles],
+        dtype=">u8"
+    )
+    # 逐位统计：某一位为1的特征多于一半时指纹该位为1
+    bits = np.unpackbits(hashes.view(np.uint8)).reshape(-1, FINGERPRINT_BITS)
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """SimHash 指纹索引，记录每个已入库块的指纹和近似重复块的别名"""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: Optional[int] = None,
+        shingle_size: Optional[int] = None,
+        min_length: Optional[int] = None
+    ):
+        self.path = path or settings.dedup_index_path
+        self.threshold = settings.dedup_hamming_threshold if threshold is None else threshold
+        self.shingle_size = shingle_size or settings.dedup_shingle_size
+        self.min_length = settings.dedup_min_chunk_length if min_length is None else min_length
+        
+        # 距离不超过阈值时至少一段相同
+        self._band_count = self.threshold + 1
+        self._band_bits = FINGERPRINT_BITS // self._band_count
+        
+        self._lock = threading.Lock()
+        # chunk_id -> (指纹, document_id)
+        self._fingerprints: Dict[str, Tuple[int, Optional[str]]] = {}
+        # (段序号, 段值) -> chunk_id 列表
+        self._buckets: Dict[Tuple[int, int], List[str]] = {}
+        # 被跳过的重复块ID -> (已入库的块ID, 重复块所属 document_id, 重复块元数据)
+        self._aliases: Dict[str, Tuple[str, Optional[str], Dict[str, Any]]] = {}
+        # 已保留但尚未写入提交的块ID -> (指纹, document_id, 入库会话)，只在内存中，同样登记在分桶中
+        self._pending: Dict[str, Tuple[int, Optional[str], int]] = {}
+        self._sessions = itertools.count(1)
+        self._checked = 0
+        self._skipped = 0
+        
+        # 自上次保存以来的变更操作，save 时追加到增量日志
+        self._ops: List[Tuple] = []
+        self._save_lock = threading.Lock()
+        self._journal: Optional[IndexJournal] = None
+        self._journal_ops = 0
+        
+        self._load()
+    
+    def _reset(self):
+        self._fingerprints, self._buckets, self._aliases, self._pending = {}, {}, {}, {}
+    
+    def _load(self):
+        """加载快照，再回放快照之后的增量日志"""
+        if not self.path:
+            return
+        self._journal = IndexJournal(self.path + ".journal")
+        snapshot_seq = 0
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    state = pickle.load(f)
+                if state.get("threshold") != self.threshold or state.get("shingle_size") != self.shingle_size:
+                    logger.info("去重参数已变化，重新构建指纹索引")
+                    self._journal.truncate()
+                    return
+                for chunk_id, (fingerprint, document_id) in state["fingerprints"].items():
+                    self._insert(chunk_id, fingerprint, document_id)
+                # 旧版本快照中的别名没有元数据
+                self._aliases = {
+                    alias: (entry[0], entry[1], entry[2] if len(entry) > 2 else {})
+                    for alias, entry in state["aliases"].items()
+                }
+                snapshot_seq = state.get("journal_seq", 0)
+            for _, ops in self._journal.replay(snapshot_seq):
+                for op in ops:
+                    self._apply(op)
+            self._journal_ops = self._journal.op_count(snapshot_seq)
+            if self._fingerprints:
+                logger.info(f"去重指纹索引已加载: {len(self._fingerprints)} 个文档块")
+        except Exception as e:
+            logger.error(f"加载去重指纹索引失败，将重新构建: {str(e)}")
+            self._reset()
+            self._journal.truncate()
+    
+    def save(self):
+        """
+        持久化自上次保存以来的变更：通常只追加到增量日志，日志累计的操作数超过索引
+        规模时重写快照并截断日志
+        """
+        if self._journal is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._ops:
+                    return
+                ops, self._ops = self._ops, []
+                size = len(self._fingerprints) + len(self._aliases)
+                compact = self._journal_ops + len(ops) >= max(settings.index_journal_compact_min_ops, size)
+                if compact:
+                    snapshot_seq = self._journal.last_seq()
+                    state = pickle.dumps({
+                        "threshold": self.threshold,
+                        "shingle_size": self.shingle_size,
+                        "fingerprints": self._fingerprints,
+                        "aliases": self._aliases,
+                        "journal_seq": snapshot_seq
+                    }, protocol=pickle.HIGHEST_PROTOCOL)
+            
+            try:
+                if compact:
+                    write_snapshot(self.path, state)
+                    self._journal.truncate(snapshot_seq)
+                    self._journal_ops = 0
+                else:
+                    self._journal.append(ops)
+                    self._journal_ops += len(ops)
+            except Exception:
+                # 未写入的变更留到下次保存
+                with self._lock:
+                    self._ops[:0] = ops
+                raise
+    
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+    
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+    
+    def _bands(self, fingerprint: int):
+        mask = (1 << self._band_bits) - 1
+        for band in range(self._band_count):
+            yield band, (fingerprint >> (band * self._band_bits)) & mask
+    
+    def _insert(self, chunk_id: str, fingerprint: int, document_id: Optional[str]):
+        self._fingerprints[chunk_id] = (fingerprint, document_id)
+        for key in self._bands(fingerprint):
+            self._buckets.setdefault(key, []).append(chunk_id)
+    
+    def _delete(self, chunk_id: str):
+        fingerprint, _ = self._fingerprints.pop(chunk_id)
+        self._unbucket(chunk_id, fingerprint)
+    
+    def _unbucket(self, chunk_id: str, fingerprint: int):
+        for key in self._bands(fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            if chunk_id in bucket:
+                bucket.remove(chunk_id)
+            if not bucket:
+                del self._buckets[key]
+    
+    def _find(self, fingerprint: int, session: Optional[int] = None) -> Optional[str]:
+        """查找最相近的已提交块，或同一入库会话中尚未提交的块"""
+        best_id, best_distance = None, self.threshold + 1
+        for key in self._bands(fingerprint):
+            for chunk_id in self._buckets.get(key, ()):
+                entry = self._fingerprints.get(chunk_id)
+                if entry is None:
+                    pending = self._pending.get(chunk_id)
+                    if pending is None or pending[2] != session:
+                        continue
+                    entry = pending
+                distance = hamming_distance(fingerprint, entry[0])
+                if distance < best_distance:
+                    best_id, best_distance = chunk_id, distance
+        return best_id
+    
+    def begin(self) -> int:
+        """开始一次入库，返回入库会话，用于 deduplicate / publish / discard"""
+        return next(self._sessions)
+    
+    def deduplicate(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        session: Optional[int] = None
+    ) -> List[int]:
+        """
+        检查一组待入库的块，返回需要入库的块下标
+        
+        保留的块立即登记为该会话的待提交指纹（同一次入库中后续的重复块也会被识别），
+        写入提交后由 publish 登记为已入库块；重复块记录为别名。未给出会话时保留的块直接登记。
+        """
+        keep: List[int] = []
+        with self._lock:
+            for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                self._checked += 1
+                document_id = (metadata or {}).get("document_id")
+                if chunk_id in self._fingerprints:
+                    self._record(("delete", chunk_id))
+                
+                if len(text.strip()) < self.min_length:
+                    # 过短的块指纹区分度不够，直接入库
+                    keep.append(i)
+                    continue
+                
+                fingerprint = simhash(text, self.shingle_size)
+                original_id = self._find(fingerprint, session)
+                if original_id is not None:
+                    self._record(("alias", chunk_id, original_id, document_id, dict(metadata or {})))
+                    self._skipped += 1
+                    continue
+                
+                if session is None:
+                    self._record(("insert", chunk_id, fingerprint, document_id))
+                else:
+                    self._drop_pending(chunk_id)
+                    self._pending[chunk_id] = (fingerprint, document_id, session)
+                    for key in self._bands(fingerprint):
+                        self._buckets.setdefault(key, []).append(chunk_id)
+                keep.append(i)
+        return keep
+    
+    def _drop_pending(self, chunk_id: str):
+        entry = self._pending.pop(chunk_id, None)
+        if entry is not None:
+            self._unbucket(chunk_id, entry[0])
+    
+    def publish(self, ids: List[str]):
+        """这些块已写入提交：待提交指纹登记为已入库块，此后对其他入库可见"""
+        with self._lock:
+            for chunk_id in ids:
+                entry = self._pending.get(chunk_id)
+                if entry is None:
+                    continue
+                self._drop_pending(chunk_id)
+                self._record(("insert", chunk_id, entry[0], entry[1]))
+    
+    def discard(self, session: int):
+        """入库结束：丢弃该会话未提交的指纹（失败或取消时这些块不会写入）"""
+        with self._lock:
+            for chunk_id in [chunk_id for chunk_id, entry in self._pending.items() if entry[2] == session]:
+                self._drop_pending(chunk_id)
+    
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """直接登记已入库块的指纹（用于从集合重建）"""
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                if chunk_id in self._fingerprints:
+                    self._record(("delete", chunk_id))
+                if len((text or "").strip()) >= self.min_length:
+                    self._record(("insert", chunk_id, simhash(text, self.shingle_size), (metadata or {}).get("document_id")))
+    
+    def remove(self, ids: List[str]):
+        """移除块的指纹和以这些块为来源或目标的别名"""
+        with self._lock:
+            removed = set(ids)
+            for chunk_id in ids:
+                if chunk_id in self._fingerprints:
+                    self._record(("delete", chunk_id))
+            for alias, entry in list(self._aliases.items()):
+                if alias in removed or entry[0] in removed:
+                    self._record(("unalias", alias))
+    
+    def remove_document(self, document_id: str) -> int:
+        """
+        移除文档的指纹和别名，返回因此失去来源块的其他文档的别名数量
+        
+        其他文档指向本文档块的别名应先通过 promote 接替来源块，这里剩下的只能丢弃。
+        """
+        with self._lock:
+            chunk_ids = {
+                chunk_id for chunk_id, (_, owner) in self._fingerprints.items() if owner == document_id
+            }
+            for chunk_id in chunk_ids:
+                self._record(("delete", chunk_id))
+            
+            orphaned = 0
+            for alias, (original_id, owner, _) in list(self._aliases.items()):
+                if owner == document_id:
+                    self._record(("unalias", alias))
+                elif original_id in chunk_ids:
+                    orphaned += 1
+                    self._record(("unalias", alias))
+            return orphaned
+    
+    def dependent_aliases(self, document_id: str, chunk_ids: List[str]) -> Dict[str, List[str]]:
+        """其他文档中以这些块为来源的别名，按来源块分组"""
+        chunk_ids = set(chunk_ids)
+        dependents: Dict[str, List[str]] = {}
+        with self._lock:
+            for alias, (original_id, owner, _) in self._aliases.items():
+                if original_id in chunk_ids and owner != document_id:
+                    dependents.setdefault(original_id, []).append(alias)
+        return dependents
+    
+    def promote(self, alias_id: str, text: str, redirect_ids: List[str]):
+        """
+        别名接替被删除的来源块：登记为已入库块（调用方已按别名ID写入来源块的向量和文本），
+        指向同一来源块的其他别名改为指向它
+        """
+        with self._lock:
+            _, document_id, _ = self._aliases[alias_id]
+            self._record(("unalias", alias_id))
+            self._record(("insert", alias_id, simhash(text, self.shingle_size), document_id))
+            for alias in redirect_ids:
+                _, owner, metadata = self._aliases[alias]
+                self._record(("alias", alias, alias_id, owner, metadata))
+    
+    def clear(self):
+        with self._lock:
+            self._record(("clear",))
+    
+    def _record(self, op: Tuple):
+        """执行一个变更操作并记录，等待下次 save 写入日志"""
+        self._apply(op)
+        self._ops.append(op)
+    
+    def _apply(self, op: Tuple):
+        kind = op[0]
+        if kind == "insert":
+            _, chunk_id, fingerprint, document_id = op
+            if chunk_id in self._fingerprints:
+                self._delete(chunk_id)
+            self._insert(chunk_id, fingerprint, document_id)
+        elif kind == "delete":
+            if op[1] in self._fingerprints:
+                self._delete(op[1])
+        elif kind == "alias":
+            _, alias, original_id, document_id, *metadata = op
+            self._aliases[alias] = (original_id, document_id, metadata[0] if metadata else {})
+        elif kind == "unalias":
+            self._aliases.pop(op[1], None)
+        elif kind == "clear":
+            self._reset()
+    
+    def resolve(self, chunk_id: str) -> str:
+        """返回被跳过的重复块对应的已入库块ID，非重复块原样返回"""
+        entry = self._aliases.get(chunk_id)
+        return entry[0] if entry else chunk_id
+    
+    def alias_metadata(self, chunk_id: str) -> Optional[Dict[str, Any]]:
+        """别名（被跳过的重复块）自己的元数据，不是别名时返回 None"""
+        entry = self._aliases.get(chunk_id)
+        return entry[2] if entry else None
+    
+    def document_aliases(self, document_id: str) -> List[str]:
+        with self._lock:
+            return [alias for alias, (_, owner, _) in self._aliases.items() if owner == document_id]
+    
+    def alias_entries(self) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """全部别名的 (ID列表, 元数据列表)，用于重建过滤索引"""
+        with self._lock:
+            return list(self._aliases), [metadata for _, _, metadata in self._aliases.values()]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "fingerprints": len(self._fingerprints),
+            "pending_fingerprints": len(self._pending),
+            "aliases": len(self._aliases),
+            "threshold": self.threshold,
+            "checked": self._checked,
+            "skipped": self._skipped,
+            "dedup_ratio": self._skipped / self._checked if self._checked else 0.0
+        }
\ No newline at end of file
@@ -0,0 +1,527 @@
+"""
+NumPy 平铺向量索引
+
+作为 Chroma 之外的可选向量存储后端：float32 向量保存在内存映射的 .npy 矩阵中，
+文本和元数据保存在旁路 SQLite 中。检索时对全部向量做一次批量矩阵乘法并用
+argpartition 取 top-k；删除采用墓碑标记，墓碑比例过高时自动压缩。
+
+可选 int8 标量量化（numpy_index_quantization="int8"）：内存中只保留每个向量的
+int8 编码和缩放系数（约为 float32 的 1/4），先用编码计算近似距离选出候选，
+再从磁盘上的全精度向量精确计算距离并重排。
+
+对外接口与 Chroma Collection 的 add/upsert/get/query/delete/count 保持一致，
+VectorStore 可以无差别地使用两种后端。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 分块计算时每块的行数，避免一次性把整个矩阵转换为 float32
+_BLOCK_ROWS = 65536
+
+
+def quantize_int8(vectors: np.ndarray):
+    """逐向量对称 int8 量化，返回 (编码, 缩放系数)，还原为 codes * scale / 127"""
+    scales = np.abs(vectors).max(axis=1).astype(np.float32)
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None] * 127.0).astype(np.int8)
+    return codes, scales
+
+
+def match_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """按 Chroma where 语法匹配元数据，支持 $and/$or 以及 $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte"""
+    if not where:
+        return True
+    
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(match_where(metadata, sub) for sub in condition):
+                return False
+            continue
+        
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        
+        for operator, operand in condition.items():
+            if operator == "$eq" and value != operand:
+                return False
+            if operator == "$ne" and value == operand:
+                return False
+            if operator == "$in" and value not in operand:
+                return False
+            if operator == "$nin" and value in operand:
+                return False
+            if operator in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if operator == "$gt" and not value > operand:
+                    return False
+                if operator == "$gte" and not value >= operand:
+                    return False
+                if operator == "$lt" and not value < operand:
+                    return False
+                if operator == "$lte" and not value <= operand:
+                    return False
+    
+    return True
+
+
+class NumpyCollection:
+    """基于内存映射 NumPy 矩阵的向量集合，接口兼容 Chroma Collection"""
+    
+    _MATRIX_FILE = "embeddings.npy"
+    _META_FILE = "metadata.db"
+    _INITIAL_CAPACITY = 1024
+    # 按行号查询文本时每条 SQL 的最大行数
+    _QUERY_CHUNK = 900
+    
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        compact_ratio: Optional[float] = None,
+        quantization: Optional[str] = None,
+        rescore_factor: Optional[int] = None
+    ):
+        self.directory = directory or settings.numpy_index_directory
+        self.compact_ratio = compact_ratio if compact_ratio is not None else settings.numpy_index_compact_ratio
+        self.quantization = quantization or settings.numpy_index_quantization
+        if self.quantization not in ("none", "int8"):
+            raise ValueError(f"不支持的量化方式: {self.quantization}")
+        self.rescore_factor = max(1, rescore_factor or settings.numpy_index_rescore_factor)
+        os.makedirs(self.directory, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.directory, self._META_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_id ON chunks(id)")
+        self._conn.commit()
+        
+        self._matrix: Optional[np.memmap] = None
+        self._load()
+    
+    # ------------------------------------------------------------------
+    # 加载与存储
+    # ------------------------------------------------------------------
+    
+    @property
+    def _matrix_path(self) -> str:
+        return os.path.join(self.directory, self._MATRIX_FILE)
+    
+    def _load(self):
+        """从磁盘加载行映射、元数据和墓碑标记"""
+        rows = self._conn.execute("SELECT row, id, metadata, deleted FROM chunks ORDER BY row").fetchall()
+        self._size = rows[-1][0] + 1 if rows else 0
+        
+        self._id_to_row: Dict[str, int] = {}
+        self._row_ids: List[Optional[str]] = [None] * self._size
+        self._metadatas: List[Optional[Dict[str, Any]]] = [None] * self._size
+        self._alive = np.zeros(self._size, dtype=bool)
+        
+        for row, chunk_id, metadata, deleted in rows:
+            self._row_ids[row] = chunk_id
+            self._metadatas[row] = json.loads(metadata) if metadata else {}
+            if not deleted:
+                self._alive[row] = True
+                self._id_to_row[chunk_id] = row
+        
+        self._norms = np.zeros(self._size, dtype=np.float32)
+        self._codes: Optional[np.ndarray] = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._code_norms = np.zeros(0, dtype=np.float32)
+        
+        if os.path.exists(self._matrix_path):
+            self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+            if self.quantized:
+                self._codes = np.zeros((self._size, self._matrix.shape[1]), dtype=np.int8)
+                self._scales = np.zeros(self._size, dtype=np.float32)
+                self._code_norms = np.zeros(self._size, dtype=np.float32)
+            
+            # 分块读取全精度向量，计算范数（和量化编码）
+            for start in range(0, self._size, _BLOCK_ROWS):
+                end = min(start + _BLOCK_ROWS, self._size)
+                block = np.asarray(self._matrix[start:end], dtype=np.float32)
+                self._norms[start:end] = np.einsum("ij,ij->i", block, block)
+                if self.quantized:
+                    codes, scales = quantize_int8(block)
+                    self._codes[start:end] = codes
+                    self._scales[start:end] = scales
+                    self._code_norms[start:end] = self._dequantized_norms(codes, scales)
+        else:
+            self._matrix = None
+        
+        logger.info(f"NumPy向量索引已加载: {len(self._id_to_row)} 个向量，{self._size - len(self._id_to_row)} 个墓碑")
+    
+    @property
+    def quantized(self) -> bool:
+        return self.quantization == "int8"
+    
+    @staticmethod
+    def _dequantized_norms(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        squared = np.einsum("ij,ij->i", codes.astype(np.float32), codes.astype(np.float32))
+        return squared * (scales / 127.0) ** 2
+    
+    def _ensure_capacity(self, required: int, dim: int):
+        """确保矩阵容量足够，不足时按倍数扩容（重新写出内存映射文件）"""
+        if self._matrix is not None and self._matrix.shape[1] != dim:
+            raise ValueError(f"向量维度不一致: 索引为 {self._matrix.shape[1]}，输入为 {dim}")
+        
+        capacity = self._matrix.shape[0] if self._matrix is not None else 0
+        if required <= capacity:
+            return
+        
+        new_capacity = max(self._INITIAL_CAPACITY, capacity * 2)
+        while new_capacity < required:
+            new_capacity *= 2
+        
+        tmp_path = self._matrix_path + ".tmp"
+        new_matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, dim))
+        if self._matrix is not None and self._size:
+            new_matrix[:self._size] = self._matrix[:self._size]
+        new_matrix.flush()
+        del new_matrix
+        
+        self._matrix = None
+        os.replace(tmp_path, self._matrix_path)
+        self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+    
+    # ------------------------------------------------------------------
+    # Chroma 兼容接口
+    # ------------------------------------------------------------------
+    
+    def count(self) -> int:
+        return len(self._id_to_row)
+    
+    def add(
+        self,
+        ids: List[str],
+        embeddings: Sequence,
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ):
+        """追加向量；已存在的ID先标记为墓碑再追加（与 upsert 相同）"""
+        if not ids:
+            return
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError(f"向量数量与ID数量不一致: {vectors.shape} vs {len(ids)}")
+        
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        
+        with self._lock:
+            existing = [chunk_id for chunk_id in ids if chunk_id in self._id_to_row]
+            if existing:
+                self._tombstone(existing)
+            
+            start = self._size
+            end = start + len(ids)
+            self._ensure_capacity(end, vectors.shape[1])
+            
+            # 先落盘向量，再提交元数据；元数据决定有效行数，保证崩溃后不会读到半写的行
+            self._matrix[start:end] = vectors
+            self._matrix.flush()
+            
+            self._conn.executemany(
+                "INSERT INTO chunks (row, id, document, metadata, deleted) VALUES (?, ?, ?, ?, 0)",
+                [
+                    (start + i, chunk_id, documents[i], json.dumps(metadatas[i] or {}, ensure_ascii=False))
+                    for i, chunk_id in enumerate(ids)
+                ]
+            )
+            self._conn.commit()
+            
+            self._size = end
+            self._row_ids.extend(ids)
+            self._metadatas.extend(dict(m or {}) for m in metadatas)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._norms = np.concatenate([self._norms, np.einsum("ij,ij->i", vectors, vectors)])
+            if self.quantized:
+                codes, scales = quantize_int8(vectors)
+                self._codes = codes if self._codes is None else np.concatenate([self._codes, codes])
+                self._scales = np.concatenate([self._scales, scales])
+                self._code_norms = np.concatenate([self._code_norms, self._dequantized_norms(codes, scales)])
+            for i, chunk_id in enumerate(ids):
+                self._id_to_row[chunk_id] = start + i
+    
+    def upsert(self, ids: List[str], embeddings: Sequence, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict[str, Any]]] = None):
+        self.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """按ID或元数据条件删除（墓碑标记），墓碑过多时自动压缩"""
+        with self._lock:
+            targets = list(ids or [])
+            if where:
+                targets.extend(self._row_ids[row] for row in self._filter_rows(where))
+            self._tombstone([chunk_id for chunk_id in targets if chunk_id in self._id_to_row])
+            
+            if self._size and (self._size - len(self._id_to_row)) / self._size > self.compact_ratio:
+                self.compact()
+    
+    def _tombstone(self, ids: List[str]):
+        if not ids:
+            return
+        rows = [self._id_to_row.pop(chunk_id) for chunk_id in ids]
+        self._alive[rows] = False
+        self._conn.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+        self._conn.commit()
+    
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """按ID和/或元数据条件读取"""
+        include = ["documents", "metadatas"] if include is None else include
+        
+        with self._lock:
+            if ids is not None:
+                rows = [self._id_to_row[chunk_id] for chunk_id in ids if chunk_id in self._id_to_row]
+                if where:
+                    rows = [row for row in rows if match_where(self._metadatas[row], where)]
+            else:
+                rows = self._filter_rows(where)
+            
+            if offset:
+                rows = rows[offset:]
+            if limit is not None:
+                rows = rows[:limit]
+            
+            return self._build_result(rows, include)
+    
+    def query(
+        self,
+        query_embeddings: Sequence,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None,
+        ids: Optional[Sequence[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        批量查询：一次矩阵乘法计算全部距离，argpartition 选出每个查询的 top-k
+        
+        ids 为 Chroma 之外的扩展参数，只在给定的文档块子集内检索
+        """
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        
+        result: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        
+        with self._lock:
+            if ids is not None:
+                candidate_mask = np.zeros(self._size, dtype=bool)
+                candidate_mask[[self._id_to_row[chunk_id] for chunk_id in ids if chunk_id in self._id_to_row]] = True
+            else:
+                candidate_mask = self._alive.copy()
+            if where:
+                where_mask = np.zeros(self._size, dtype=bool)
+                where_mask[self._filter_rows(where)] = True
+                candidate_mask &= where_mask
+            
+            candidates = np.flatnonzero(candidate_mask)
+            if candidates.size == 0 or self._matrix is None:
+                for _ in range(len(queries)):
+                    for key in result:
+                        result[key].append([])
+                return self._strip_result(result, include)
+            
+            query_norms = np.einsum("ij,ij->i", queries, queries)
+            k = min(n_results, candidates.size)
+            if self.quantized:
+                # 量化编码上的近似距离只用于选出候选，候选数为 k 的 rescore_factor 倍
+                distances = self._approximate_distances(candidates, queries, query_norms)
+                shortlist = min(candidates.size, k * self.rescore_factor)
+            else:
+                distances = self._exact_distances(candidates, queries, query_norms)
+                shortlist = k
+            
+            for column in range(queries.shape[0]):
+                top = self._smallest(distances[:, column], shortlist)
+                rows = candidates[top]
+                if self.quantized:
+                    # 从磁盘读取候选的全精度向量精确重排
+                    column_distances = self._exact_distances(rows, queries[column:column + 1], query_norms[column:column + 1])[:, 0]
+                    order = self._smallest(column_distances, k)
+                    rows = rows[order]
+                    column_distances = column_distances[order]
+                else:
+                    column_distances = distances[top, column]
+                
+                partial = self._build_result(rows.tolist(), include)
+                for key in ("ids", "documents", "metadatas", "embeddings"):
+                    result[key].append(partial.get(key) or [])
+                result["distances"].append([float(max(d, 0.0)) for d in column_distances])
+        
+        return self._strip_result(result, include)
+    
+    # ------------------------------------------------------------------
+    # 维护
+    # ------------------------------------------------------------------
+    
+    def compact(self):
+        """压缩索引：移除墓碑行并重新编号"""
+        with self._lock:
+            alive_rows = np.flatnonzero(self._alive)
+            if alive_rows.size == self._size:
+                return
+            
+            logger.info(f"压缩NumPy向量索引: {self._size} 行 -> {alive_rows.size} 行")
+            
+            records = dict(self._conn.execute("SELECT row, document FROM chunks WHERE deleted = 0"))
+            
+            dim = self._matrix.shape[1] if self._matrix is not None else 0
+            tmp_path = self._matrix_path + ".tmp"
+            capacity = max(self._INITIAL_CAPACITY, int(alive_rows.size * 1.5))
+            new_matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, dim))
+            if alive_rows.size:
+                new_matrix[:alive_rows.size] = self._matrix[alive_rows]
+            new_matrix.flush()
+            del new_matrix
+            
+            new_rows = [
+                (new_row, self._row_ids[old_row], records.get(int(old_row)), json.dumps(self._metadatas[old_row], ensure_ascii=False))
+                for new_row, old_row in enumerate(alive_rows.tolist())
+            ]
+            
+            # 元数据先在事务内重写，矩阵文件随后替换；两者都完成后重新加载
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.executemany(
+                "INSERT INTO chunks (row, id, document, metadata, deleted) VALUES (?, ?, ?, ?, 0)",
+                new_rows
+            )
+            self._conn.commit()
+            
+            self._matrix = None
+            os.replace(tmp_path, self._matrix_path)
+            self._load()
+    
+    def reset(self):
+        """清空索引"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+            self._matrix = None
+            if os.path.exists(self._matrix_path):
+                os.remove(self._matrix_path)
+            self._load()
+    
+    def close(self):
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+            self._conn.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """索引规模与内存占用"""
+        dim = self._matrix.shape[1] if self._matrix is not None else 0
+        full_precision_bytes = self._size * dim * 4
+        if self.quantized and self._codes is not None:
+            resident_bytes = self._codes.nbytes + self._scales.nbytes + self._code_norms.nbytes + self._norms.nbytes
+        else:
+            resident_bytes = full_precision_bytes + self._norms.nbytes
+        return {
+            "vectors": len(self._id_to_row),
+            "tombstones": self._size - len(self._id_to_row),
+            "dimension": dim,
+            "quantization": self.quantization,
+            "rescore_factor": self.rescore_factor if self.quantized else None,
+            "full_precision_bytes": full_precision_bytes,
+            "search_bytes": resident_bytes
+        }
+    
+    # ------------------------------------------------------------------
+    # 内部工具
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _smallest(values: np.ndarray, k: int) -> np.ndarray:
+        """返回最小的 k 个值的下标（升序）"""
+        if k < values.size:
+            top = np.argpartition(values, k - 1)[:k]
+        else:
+            top = np.arange(values.size)
+        return top[np.argsort(values[top])]
+    
+    def _exact_distances(self, rows: np.ndarray, queries: np.ndarray, query_norms: np.ndarray) -> np.ndarray:
+        """全精度平方L2距离 = |x|^2 - 2 x·q + |q|^2，与 Chroma 默认的 l2 空间一致"""
+        if rows.size == self._size and np.all(rows[1:] > rows[:-1]):
+            # 全部行且有序时直接使用连续切片，避免花式索引复制整个矩阵
+            vectors = self._matrix[:self._size]
+        else:
+            vectors = self._matrix[rows]
+        return self._norms[rows][:, None] - 2.0 * (vectors @ queries.T) + query_norms[None, :]
+    
+    def _approximate_distances(self, rows: np.ndarray, queries: np.ndarray, query_norms: np.ndarray) -> np.ndarray:
+        """基于 int8 编码的近似平方L2距离，分块反量化以限制临时内存"""
+        distances = np.empty((rows.size, queries.shape[0]), dtype=np.float32)
+        for start in range(0, rows.size, _BLOCK_ROWS):
+            block = rows[start:start + _BLOCK_ROWS]
+            dots = self._codes[block].astype(np.float32) @ queries.T
+            dots *= (self._scales[block] / 127.0)[:, None]
+            distances[start:start + block.size] = self._code_norms[block][:, None] - 2.0 * dots + query_norms[None, :]
+        return distances
+    
+    def _filter_rows(self, where: Optional[Dict[str, Any]]) -> List[int]:
+        return [
+            row for row in np.flatnonzero(self._alive).tolist()
+            if match_where(self._metadatas[row], where)
+        ]
+    
+    def _build_result(self, rows: List[int], include: List[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"ids": [self._row_ids[row] for row in rows]}
+        
+        if "documents" in include:
+            documents: Dict[int, str] = {}
+            # 分批查询，绑定变量数不超过 SQLite 的上限
+            for i in range(0, len(rows), self._QUERY_CHUNK):
+                part = rows[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                for row, document in self._conn.execute(
+                    f"SELECT row, document FROM chunks WHERE row IN ({placeholders})", part
+                ):
+                    documents[row] = document
+            result["documents"] = [documents.get(row) for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [dict(self._metadatas[row]) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.asarray(self._matrix[row]) for row in rows] if rows else []
+        
+        return result
+    
+    @staticmethod
+    def _strip_result(result: Dict[str, Any], include: List[str]) -> Dict[str, Any]:
+        return {
+            key: value if key == "ids" or key in include else None
+            for key, value in result.items()
+        }
\ No newline at end of file
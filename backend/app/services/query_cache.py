@@ -0,0 +1,117 @@
+"""
+查询向量内存缓存
+
+对查询文本做规范化（全角/半角、空白）后作为键，缓存其嵌入向量，
+同时受条目数、内存字节数和 TTL 约束
+"""
+
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本：全角转半角、合并空白并去除首尾空白"""
+    # NFKC 会把全角字母、数字和标点（如 ？，：）折叠为对应的半角字符
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def query_hash(text: str) -> str:
+    """规范化后的查询哈希"""
+    return hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """进程内查询向量 LRU 缓存，支持 TTL"""
+    
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None
+    ):
+        self.max_entries = max_entries or settings.query_cache_max_entries
+        self.max_bytes = max_bytes or settings.query_cache_max_mb * 1024 * 1024
+        self.ttl = ttl if ttl is not None else settings.query_cache_ttl
+        
+        # 键 -> (向量, 过期时间)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._total_bytes = 0
+        
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+    
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """查询缓存，命中时刷新 LRU 位置"""
+        key = query_hash(text)
+        entry = self._entries.get(key)
+        
+        if entry is None:
+            self._misses += 1
+            return None
+        
+        embedding, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self._expirations += 1
+            self._misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return embedding
+    
+    def put(self, text: str, embedding: np.ndarray):
+        """写入缓存，超出条目数或字节上限时淘汰最久未使用的条目"""
+        key = query_hash(text)
+        if key in self._entries:
+            self._remove(key)
+        
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._entries[key] = (embedding, time.monotonic() + self.ttl)
+        self._total_bytes += embedding.nbytes
+        
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._evictions += 1
+    
+    def _remove(self, key: str):
+        embedding, _ = self._entries.pop(key)
+        self._total_bytes -= embedding.nbytes
+    
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._total_bytes = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "expirations": self._expirations
+        }
\ No newline at end of file
@@ -1,13 +1,23 @@
+import asyncio
 import logging
+import os
 import time
-from typing import List, Dict, Any, Optional
+import uuid
+from pathlib import Path
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple
+
+import numpy as np
 
 from .vector_store import VectorStore
 from .document_processor import DocumentProcessor
-from .remote_llm import RemoteLLMService
+from .remote_llm import RemoteLLMService, LLMOverloadedError
 from .reranker_service import RerankerService
+from .answer_cache import SemanticAnswerCache
+from .document_registry import DocumentRegistry, make_preview
+from .filter_index import normalize_file_type
 from ..models.schemas import QueryRequest, QueryResponse, RetrievedChunk
 from ..core.config import settings
+from ..core.deadline import DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +29,21 @@ class RAGService:
         self.document_processor = DocumentProcessor()
         self.llm_service = None
         self.reranker_service = None
+        self.answer_cache = SemanticAnswerCache() if settings.answer_cache_enabled else None
+        self.document_registry = DocumentRegistry()
         self._initialize_services()
+        
+        # 文档删除/知识库清空时同步登记表
+        self.document_registry.backfill(self.vector_store.collection)
+        self.vector_store.add_invalidation_listener(self.document_registry.remove)
+        # 上次运行中登记后未完成的入库已被回滚，登记一并撤销
+        for document_id in self.vector_store.rolled_back_document_ids:
+            self.document_registry.remove(document_id)
+        
+        if self.answer_cache is not None:
+            self.vector_store.add_invalidation_listener(self.answer_cache.invalidate_document)
+        if self.reranker_service and self.reranker_service.score_cache is not None:
+            self.vector_store.add_invalidation_listener(self.reranker_service.score_cache.invalidate_document)
     
     def _initialize_services(self):
         """初始化各种服务"""
@@ -55,94 +79,385 @@ class RAGService:
         start_time = time.time()
         
         try:
-            # 1. 向量检索相关文档（如果启用重排序，使用更大的top_k进行初步检索）
-            if self.reranker_service and self.reranker_service.is_enabled():
-                initial_top_k = int(request.top_k * settings.rerank_initial_top_k_multiplier)
-                logger.info(f"启用重排序，初始检索数量: {initial_top_k}")
+            # 0. 生成查询向量并查询语义答案缓存
+            query_embedding = await self.vector_store.embed_query(request.question)
+            cached_response = self._lookup_answer_cache(request, query_embedding)
+            if cached_response is not None:
+                return cached_response.model_copy(update={
+                    "question": request.question,
+                    "response_time": time.time() - start_time
+                })
+            
+            # 1-2. 检索并重排序
+            retrieved_docs = await self._retrieve(request, query_embedding)
+            
+            return await self._answer(request, query_embedding, retrieved_docs, start_time)
+            
+        except (LLMOverloadedError, DeadlineExceeded):
+            # 过载和超时交由接口层返回 503/504
+            raise
+        except Exception as e:
+            logger.error(f"查询处理失败: {str(e)}")
+            return self._error_response(request, e, start_time)
+    
+    async def batch_query(self, questions: List[str], top_k: int) -> List[QueryResponse]:
+        """
+        批量查询：一次嵌入调用、一次向量检索，随后并发重排序和生成（受并发上限约束），
+        结果按输入顺序返回
+        """
+        start_time = time.time()
+        requests = [QueryRequest(question=question, top_k=top_k) for question in questions]
+        results: List[Optional[QueryResponse]] = [None] * len(requests)
+        
+        # 0. 一次性生成全部查询向量，并逐个查询语义答案缓存
+        try:
+            query_embeddings = await self.vector_store.embed_queries(questions)
+        except (LLMOverloadedError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            # 与单个查询一致：失败时每个问题返回错误答案，而不是整个请求报错
+            logger.error(f"批量查询生成查询向量失败: {str(e)}")
+            return [self._error_response(request, e, start_time) for request in requests]
+        
+        pending = []
+        for i, request in enumerate(requests):
+            cached_response = self._lookup_answer_cache(request, query_embeddings[i])
+            if cached_response is not None:
+                results[i] = cached_response.model_copy(update={
+                    "question": request.question,
+                    "response_time": time.time() - start_time
+                })
             else:
-                initial_top_k = request.top_k
-                logger.info(f"未启用重排序，检索数量: {initial_top_k}")
-                
-            retrieved_docs = await self.vector_store.similarity_search(
-                query=request.question,
-                top_k=initial_top_k
+                pending.append(i)
+        
+        if pending:
+            # 1. 一次检索调用取回全部未命中缓存问题的候选
+            search_batch = (
+                self.vector_store.hybrid_search_batch if settings.hybrid_search_enabled
+                else self.vector_store.similarity_search_batch
             )
-            
-            if not retrieved_docs:
-                return QueryResponse(
-                    question=request.question,
-                    answer="抱歉，没有找到相关信息来回答您的问题。请尝试重新表述或上传相关文档。",
-                    retrieved_chunks=[],
-                    response_time=time.time() - start_time,
-                    confidence=0.0
+            try:
+                candidates = await search_batch(
+                    queries=[questions[i] for i in pending],
+                    top_k=self._initial_top_k(requests[pending[0]]),
+                    query_embeddings=query_embeddings[pending]
                 )
+            except (LLMOverloadedError, DeadlineExceeded):
+                raise
+            except Exception as e:
+                logger.error(f"批量查询检索失败: {str(e)}")
+                for i in pending:
+                    results[i] = self._error_response(requests[i], e, start_time)
+                return results
             
-            # 2. 重排序（如果服务可用且启用）
-            if self.reranker_service and self.reranker_service.is_enabled():
-                logger.info(f"使用重排序服务对 {len(retrieved_docs)} 个文档进行重新排序")
-                
-                # 保存原始文档用于性能分析
-                original_docs = retrieved_docs.copy()
-                
-                retrieved_docs = await self.reranker_service.rerank_documents(
-                    query=request.question,
-                    documents=retrieved_docs,
-                    top_k=request.top_k
-                )
-                logger.info(f"重排序完成，最终使用 {len(retrieved_docs)} 个文档")
-                
-                # 可选：分析重排序性能（在调试模式下）
-                if settings.debug:
-                    performance_analysis = self.reranker_service.analyze_rerank_performance(
-                        original_docs, retrieved_docs
-                    )
-                    logger.debug(f"重排序性能分析: {performance_analysis}")
-            else:
-                # 如果没有重排序服务，直接截取前top_k个文档
-                retrieved_docs = retrieved_docs[:request.top_k]
-                logger.info(f"跳过重排序，使用前 {len(retrieved_docs)} 个文档")
+            # 2-3. 并发重排序和生成
+            semaphore = asyncio.Semaphore(max(1, settings.batch_query_concurrency))
             
-            # 3. 构建上下文
-            context = self._build_context(retrieved_docs)
+            async def run(i: int, retrieved_docs: List[Dict[str, Any]]):
+                async with semaphore:
+                    try:
+                        retrieved_docs = await self._rerank(requests[i], retrieved_docs)
+                        results[i] = await self._answer(requests[i], query_embeddings[i], retrieved_docs, start_time)
+                    except (LLMOverloadedError, DeadlineExceeded):
+                        raise
+                    except Exception as e:
+                        logger.error(f"批量查询中的问题处理失败: {str(e)}")
+                        results[i] = self._error_response(requests[i], e, start_time)
             
-            # 4. 生成回答
-            answer = await self._generate_answer(request.question, context)
+            tasks = [asyncio.ensure_future(run(i, docs)) for i, docs in zip(pending, candidates)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # 过载/超时使整个批次返回 503/504，取消其余问题的重排序和生成，释放占用的 LLM 并发名额
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        
+        logger.info(f"批量查询完成: {len(requests)} 个问题，耗时: {time.time() - start_time:.2f}秒")
+        return results
+    
+    async def _answer(
+        self,
+        request: QueryRequest,
+        query_embedding: np.ndarray,
+        retrieved_docs: List[Dict[str, Any]],
+        start_time: float
+    ) -> QueryResponse:
+        """基于检索结果构建上下文、生成答案并写入答案缓存"""
+        if not retrieved_docs:
+            return QueryResponse(
+                question=request.question,
+                answer=self._no_result_answer(),
+                retrieved_chunks=[],
+                response_time=time.time() - start_time,
+                confidence=0.0
+            )
+        
+        # 3. 构建上下文
+        context = self._build_context(retrieved_docs)
+        
+        # 4. 生成回答
+        answer, generated_by_llm = await self._generate_answer(request.question, context)
+        
+        # 5. 计算置信度
+        confidence = self._calculate_confidence(retrieved_docs, answer)
+        
+        # 6. 构建响应
+        retrieved_chunks = self._to_retrieved_chunks(retrieved_docs)
+        
+        response_time = time.time() - start_time
+        
+        logger.info(f"查询处理完成，耗时: {response_time:.2f}秒")
+        
+        response = QueryResponse(
+            question=request.question,
+            answer=answer,
+            retrieved_chunks=retrieved_chunks,
+            response_time=response_time,
+            confidence=confidence
+        )
+        
+        # 7. 仅缓存由LLM生成的答案，避免降级答案被复用
+        if generated_by_llm:
+            self._store_answer_cache(request, query_embedding, response, retrieved_docs)
+        
+        return response
+    
+    def _error_response(self, request: QueryRequest, error: Exception, start_time: float) -> QueryResponse:
+        return QueryResponse(
+            question=request.question,
+            answer=f"抱歉，处理您的查询时发生错误: {str(error)}",
+            retrieved_chunks=[],
+            response_time=time.time() - start_time,
+            confidence=0.0
+        )
+    
+    async def query_stream(self, request: QueryRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理用户查询
+        
+        依次产出事件: chunks（检索结果）、token（增量答案）、done（置信度与耗时），
+        出错时产出 error 事件
+        """
+        start_time = time.time()
+        
+        try:
+            query_embedding = await self.vector_store.embed_query(request.question)
+            cached_response = self._lookup_answer_cache(request, query_embedding)
+            if cached_response is not None:
+                response_time = time.time() - start_time
+                yield {
+                    "event": "chunks",
+                    "data": {
+                        "question": request.question,
+                        "retrieved_chunks": [chunk.model_dump() for chunk in cached_response.retrieved_chunks],
+                        "retrieval_time": response_time
+                    }
+                }
+                yield {"event": "token", "data": {"content": cached_response.answer}}
+                yield {
+                    "event": "done",
+                    "data": {
+                        "answer": cached_response.answer,
+                        "confidence": cached_response.confidence,
+                        "response_time": response_time,
+                        "cached": True,
+                        "timings": {"retrieval": response_time, "first_token": response_time, "generation": 0.0}
+                    }
+                }
+                return
             
-            # 5. 计算置信度
-            confidence = self._calculate_confidence(retrieved_docs, answer)
+            retrieved_docs = await self._retrieve(request, query_embedding)
+            retrieval_time = time.time() - start_time
             
-            # 6. 构建响应
-            retrieved_chunks = [
-                RetrievedChunk(
-                    content=doc["content"],
-                    source=doc["source"],
-                    score=doc["score"],
-                    metadata=doc["metadata"]
-                )
-                for doc in retrieved_docs
-            ]
+            yield {
+                "event": "chunks",
+                "data": {
+                    "question": request.question,
+                    "retrieved_chunks": [chunk.model_dump() for chunk in self._to_retrieved_chunks(retrieved_docs)],
+                    "retrieval_time": retrieval_time
+                }
+            }
+            
+            first_token_time = None
+            answer_parts = []
+            
+            if not retrieved_docs:
+                answer_parts.append(self._no_result_answer())
+                first_token_time = time.time() - start_time
+                yield {"event": "token", "data": {"content": answer_parts[0]}}
+            else:
+                context = self._build_context(retrieved_docs)
+                async for content in self._generate_answer_stream(request.question, context):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    answer_parts.append(content)
+                    yield {"event": "token", "data": {"content": content}}
             
+            answer = "".join(answer_parts).strip()
+            confidence = self._calculate_confidence(retrieved_docs, answer) if retrieved_docs else 0.0
             response_time = time.time() - start_time
             
-            logger.info(f"查询处理完成，耗时: {response_time:.2f}秒")
+            logger.info(f"流式查询处理完成，耗时: {response_time:.2f}秒")
             
-            return QueryResponse(
-                question=request.question,
-                answer=answer,
-                retrieved_chunks=retrieved_chunks,
-                response_time=response_time,
-                confidence=confidence
-            )
+            yield {
+                "event": "done",
+                "data": {
+                    "answer": answer,
+                    "confidence": confidence,
+                    "response_time": response_time,
+                    "timings": {
+                        "retrieval": retrieval_time,
+                        "first_token": first_token_time,
+                        "generation": response_time - retrieval_time
+                    }
+                }
+            }
             
+        except (LLMOverloadedError, DeadlineExceeded) as e:
+            logger.warning(f"流式查询中止: {str(e)}")
+            yield {
+                "event": "error",
+                "data": {
+                    "message": str(e),
+                    "status": 503 if isinstance(e, LLMOverloadedError) else 504,
+                    "response_time": time.time() - start_time
+                }
+            }
         except Exception as e:
-            logger.error(f"查询处理失败: {str(e)}")
-            return QueryResponse(
-                question=request.question,
-                answer=f"抱歉，处理您的查询时发生错误: {str(e)}",
-                retrieved_chunks=[],
-                response_time=time.time() - start_time,
-                confidence=0.0
+            logger.error(f"流式查询处理失败: {str(e)}")
+            yield {
+                "event": "error",
+                "data": {
+                    "message": f"抱歉，处理您的查询时发生错误: {str(e)}",
+                    "status": 500,
+                    "response_time": time.time() - start_time
+                }
+            }
+    
+    def _answer_cache_params(self, request: QueryRequest) -> Tuple:
+        """影响答案内容的查询参数，只有参数相同的缓存条目才可复用"""
+        filters = tuple(sorted((field, tuple(sorted(values))) for field, values in self._request_filters(request).items()))
+        return (request.top_k, bool(self.reranker_service and self.reranker_service.is_enabled()), filters)
+    
+    @staticmethod
+    def _request_filters(request: QueryRequest) -> Dict[str, List[str]]:
+        """QueryRequest 中的 document_id / source / file_type 过滤条件"""
+        filters = {}
+        if request.document_id:
+            filters["document_id"] = list(request.document_id)
+        if request.source:
+            filters["source"] = list(request.source)
+        if request.file_type:
+            filters["file_type"] = [normalize_file_type(value) for value in request.file_type]
+        return filters
+    
+    def _lookup_answer_cache(self, request: QueryRequest, query_embedding: np.ndarray) -> Optional[QueryResponse]:
+        """查询语义答案缓存，引用的文档块已不存在时丢弃该条目"""
+        if self.answer_cache is None or len(query_embedding) == 0:
+            return None
+        
+        entry = self.answer_cache.lookup(query_embedding, self._answer_cache_params(request))
+        if entry is None:
+            return None
+        
+        if not self.vector_store.chunks_exist(entry.chunk_ids):
+            self.answer_cache.discard(entry)
+            return None
+        
+        return entry.response
+    
+    def _store_answer_cache(
+        self,
+        request: QueryRequest,
+        query_embedding: np.ndarray,
+        response: QueryResponse,
+        retrieved_docs: List[Dict[str, Any]]
+    ):
+        """写入语义答案缓存"""
+        if self.answer_cache is None or len(query_embedding) == 0:
+            return
+        
+        self.answer_cache.put(
+            query_embedding,
+            self._answer_cache_params(request),
+            response,
+            chunk_ids=[doc["id"] for doc in retrieved_docs if doc.get("id")],
+            document_ids={doc["document_id"] for doc in retrieved_docs if doc.get("document_id")}
+        )
+    
+    async def _retrieve(self, request: QueryRequest, query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """向量（或混合）检索并按需重排序，返回最终用于生成的文档"""
+        search = self.vector_store.hybrid_search if settings.hybrid_search_enabled else self.vector_store.similarity_search
+        retrieved_docs = await search(
+            query=request.question,
+            top_k=self._initial_top_k(request),
+            query_embedding=query_embedding,
+            filters=self._request_filters(request) or None
+        )
+        
+        return await self._rerank(request, retrieved_docs)
+    
+    def _initial_top_k(self, request: QueryRequest) -> int:
+        """初步检索数量：启用重排序时使用更大的top_k；混合检索召回更准，倍数更小"""
+        if self.reranker_service and self.reranker_service.is_enabled():
+            multiplier = (
+                settings.hybrid_rerank_top_k_multiplier if settings.hybrid_search_enabled
+                else settings.rerank_initial_top_k_multiplier
             )
+            initial_top_k = max(request.top_k, int(request.top_k * multiplier))
+            logger.info(f"启用重排序，初始检索数量: {initial_top_k}")
+        else:
+            initial_top_k = request.top_k
+            logger.info(f"未启用重排序，检索数量: {initial_top_k}")
+        return initial_top_k
+    
+    async def _rerank(self, request: QueryRequest, retrieved_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """重排序（如果服务可用且启用），否则截取前top_k个文档"""
+        if not retrieved_docs:
+            return []
+        
+        if self.reranker_service and self.reranker_service.is_enabled():
+            logger.info(f"使用重排序服务对 {len(retrieved_docs)} 个文档进行重新排序")
+            
+            # 保存原始文档用于性能分析
+            original_docs = retrieved_docs.copy()
+            
+            retrieved_docs = await self.reranker_service.rerank_documents(
+                query=request.question,
+                documents=retrieved_docs,
+                top_k=request.top_k
+            )
+            logger.info(f"重排序完成，最终使用 {len(retrieved_docs)} 个文档")
+            
+            # 可选：分析重排序性能（在调试模式下）
+            if settings.debug:
+                performance_analysis = self.reranker_service.analyze_rerank_performance(
+                    original_docs, retrieved_docs
+                )
+                logger.debug(f"重排序性能分析: {performance_analysis}")
+        else:
+            # 如果没有重排序服务，直接截取前top_k个文档
+            retrieved_docs = retrieved_docs[:request.top_k]
+            logger.info(f"跳过重排序，使用前 {len(retrieved_docs)} 个文档")
+        
+        return retrieved_docs
+    
+    def _to_retrieved_chunks(self, retrieved_docs: List[Dict[str, Any]]) -> List[RetrievedChunk]:
+        """转换为响应中的文档片段模型"""
+        return [
+            RetrievedChunk(
+                content=doc["content"],
+                source=doc["source"],
+                score=doc["score"],
+                metadata=doc["metadata"]
+            )
+            for doc in retrieved_docs
+        ]
+    
+    def _no_result_answer(self) -> str:
+        return "抱歉，没有找到相关信息来回答您的问题。请尝试重新表述或上传相关文档。"
     
     def _build_context(self, retrieved_docs: List[Dict[str, Any]]) -> str:
         """构建上下文信息"""
@@ -158,20 +473,41 @@ class RAGService:
         
         return "\n".join(context_parts)
     
-    async def _generate_answer(self, question: str, context: str) -> str:
-        """生成答案"""
+    async def _generate_answer(self, question: str, context: str) -> Tuple[str, bool]:
+        """生成答案，返回 (答案, 是否由LLM生成)"""
         if self.llm_service is None:
             # 简单的基于检索的回答
-            return self._simple_retrieval_answer(question, context)
+            return self._simple_retrieval_answer(question, context), False
         
         try:
             # 使用远程LLM生成回答
             answer = await self.llm_service.generate_with_context(question, context)
-            return answer
+            return answer, True
             
+        except (LLMOverloadedError, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.error(f"LLM生成失败: {str(e)}")
-            return self._simple_retrieval_answer(question, context)
+            return self._simple_retrieval_answer(question, context), False
+    
+    async def _generate_answer_stream(self, question: str, context: str) -> AsyncIterator[str]:
+        """流式生成答案，LLM不可用或尚未输出内容即失败时回退到检索式回答"""
+        if self.llm_service is None:
+            yield self._simple_retrieval_answer(question, context)
+            return
+        
+        has_output = False
+        try:
+            async for content in self.llm_service.generate_with_context_stream(question, context):
+                has_output = True
+                yield content
+        except (LLMOverloadedError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            logger.error(f"LLM流式生成失败: {str(e)}")
+            if has_output:
+                raise
+            yield self._simple_retrieval_answer(question, context)
     
     def _simple_retrieval_answer(self, question: str, context: str) -> str:
         """基于检索的简单回答生成"""
@@ -222,25 +558,78 @@ class RAGService:
         
         return min(confidence, 0.95)  # 最高置信度不超过95%
     
-    async def add_document(self, file_path: str, filename: str) -> Dict[str, Any]:
-        """添加文档到知识库"""
+    async def add_document(
+        self,
+        file_path: str,
+        filename: str,
+        progress: Optional[Callable[[str, int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """添加文档到知识库，progress(阶段, 已处理块数, 总块数) 报告处理进度"""
+        def report(stage: str, processed: int = 0, total: int = 0):
+            if progress:
+                progress(stage, processed, total)
+        
+        doc_id = str(uuid.uuid4())
+        file_type = Path(filename).suffix.lower()
+        first_chunk: List[str] = []
+        chunk_count = 0
+        
+        async def chunks():
+            """边解析边分块，记录块数和首块（用于预览）"""
+            nonlocal chunk_count
+            texts = self.document_processor.iter_text(file_path, filename)
+            async for chunk in self.document_processor.iter_chunks(texts, filename, doc_id):
+                if not first_chunk:
+                    first_chunk.append(chunk.page_content)
+                chunk_count += 1
+                yield chunk
+        
+        async def register(store_result: Dict[str, Any]):
+            """在入库的预写日志记录删除前写入文档登记表，登记失败时入库回滚"""
+            nonlocal chunk_count
+            report("registering", chunk_count, chunk_count)
+            # 登记实际入库的块数（写入的块加上作为别名记录的重复块），与文档块列表的分页范围一致
+            chunk_count = self.vector_store.filter_index.chunk_count(doc_id)
+            await asyncio.to_thread(
+                self.document_registry.register,
+                doc_id,
+                filename,
+                file_type,
+                chunk_count,
+                os.path.getsize(file_path),
+                make_preview(first_chunk[0] if first_chunk else "")
+            )
+        
         try:
-            # 处理文档
-            doc_info = await self.document_processor.process_file(file_path, filename)
-            
-            # 添加到向量存储
-            store_result = await self.vector_store.add_documents(doc_info["chunks"])
+            # 解析、分块、嵌入、写入和登记流水线执行，总块数随解析进度增长
+            report("extracting")
+            try:
+                store_result = await self.vector_store.add_documents(
+                    chunks(),
+                    progress=lambda processed, total: report("embedding", processed, total),
+                    document_ids=[doc_id],
+                    before_complete=register
+                )
+            except BaseException:
+                # 登记之后的步骤失败时块已回滚，登记一并撤销
+                await asyncio.to_thread(self.document_registry.remove, doc_id)
+                raise
             
             # 清理临时文件
             await self.document_processor.cleanup_temp_file(file_path)
             
             return {
-                **doc_info,
+                "id": doc_id,
+                "title": filename,
+                "file_type": file_type,
+                "source": filename,
+                "chunk_count": chunk_count,
                 "vector_store_result": store_result
             }
             
         except Exception as e:
             # 确保清理临时文件
+            logger.error(f"处理文档失败 {filename}: {str(e)}")
             await self.document_processor.cleanup_temp_file(file_path)
             raise
     
@@ -264,6 +653,29 @@ class RAGService:
                 "model_status": model_status,
                 "memory_usage": 0.0,  # 远程服务不占用本地内存
                 "vector_store_stats": vector_stats,
+                "service_metrics": {
+                    "embedding_batcher": self.vector_store.embedding_batcher.get_stats(),
+                    "ingest_batching": self.vector_store.ingest_sizer.get_stats(),
+                    "embedding_cache": self.vector_store.embedding_service.cache.get_stats()
+                    if self.vector_store.embedding_service.cache else {"enabled": False},
+                    "query_cache": self.vector_store.query_cache.get_stats()
+                    if self.vector_store.query_cache else {"enabled": False},
+                    "llm": self.llm_service.get_stats() if self.llm_service else {"enabled": False},
+                    "answer_cache": self.answer_cache.get_stats() if self.answer_cache else {"enabled": False},
+                    "rerank_cache": self.reranker_service.score_cache.get_stats()
+                    if (self.reranker_service and self.reranker_service.score_cache) else {"enabled": False},
+                    "bm25_index": self.vector_store.bm25_index.get_stats()
+                    if self.vector_store.bm25_index else {"enabled": False},
+                    "collection_stats": self.vector_store.stats.get_stats(),
+                    "filter_index": self.vector_store.filter_index.get_stats(),
+                    "text_extraction": self.document_processor.extractor.get_stats(),
+                    "ingest_writer": self.vector_store.writer.get_stats(),
+                    "ingest_log": self.vector_store.ingest_log.get_stats(),
+                    "dedup_index": self.vector_store.dedup_index.get_stats()
+                    if self.vector_store.dedup_index else {"enabled": False},
+                    "vector_index": self.vector_store.collection.get_stats()
+                    if self.vector_store.uses_numpy_backend else {"backend": settings.vector_store_backend}
+                },
                 "rerank_enabled": self.reranker_service and self.reranker_service.is_enabled()
             }
             
@@ -294,9 +706,19 @@ class RAGService:
         
         # 测试重排序服务
         try:
-            results["reranker"] = self.reranker_service.test_connection() if (self.reranker_service and self.reranker_service.is_enabled()) else False
+            results["reranker"] = await self.reranker_service.test_connection() if (self.reranker_service and self.reranker_service.is_enabled()) else False
         except Exception as e:
             logger.error(f"重排序服务测试失败: {str(e)}")
             results["reranker"] = False
         
-        return results 
\ No newline at end of file
+        return results
+    
+    async def close(self):
+        """关闭各服务持有的连接"""
+        await self.vector_store.close()
+        if self.llm_service:
+            await self.llm_service.close()
+        if self.reranker_service:
+            await self.reranker_service.close()
+        self.document_registry.close()
+        self.document_processor.close()
\ No newline at end of file
@@ -1,10 +1,12 @@
+import asyncio
 import logging
-import requests
+import httpx
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import time
 
 from ..core.config import settings
+from .embedding_cache import EmbeddingCache
 
 logger = logging.getLogger(__name__)
 
@@ -15,31 +17,80 @@ class RemoteEmbeddingService:
         self.config = settings.ai_config["embedding"]
         self.base_url = self.config["base_url"]
         self.model_name = self.config["model_name"]
-        self.session = requests.Session()
-        self.session.timeout = 30
+        
+        # 连接池与超时配置，客户端在首次请求时创建
+        self.timeout = httpx.Timeout(
+            settings.embedding_timeout,
+            connect=settings.embedding_connect_timeout
+        )
+        self.limits = httpx.Limits(
+            max_connections=settings.embedding_max_connections,
+            max_keepalive_connections=settings.embedding_max_keepalive_connections,
+            keepalive_expiry=settings.embedding_keepalive_expiry
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
+        
+        # 持久化嵌入缓存
+        self.cache: Optional[EmbeddingCache] = None
+        if settings.embedding_cache_enabled:
+            try:
+                self.cache = EmbeddingCache()
+            except Exception as e:
+                logger.error(f"嵌入缓存初始化失败，将不使用缓存: {str(e)}")
         
         logger.info(f"初始化远程嵌入服务: {self.model_name}")
         logger.info(f"服务地址: {self.base_url}")
     
-    async def encode(self, texts: List[str]) -> np.ndarray:
-        """编码文本为向量"""
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的异步HTTP客户端"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                headers={"Content-Type": "application/json"}
+            )
+        return self._client
+    
+    async def encode(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        """
+        编码文本为向量，优先读取持久化缓存，仅对未命中的文本发起远程请求
+        
+        持久化缓存只用于入库时的文档块；查询文本大多只出现一次，由 use_cache=False 跳过，
+        避免每次查询都读写磁盘、把文档块的嵌入挤出缓存（查询另有内存缓存）
+        """
+        if not texts:
+            return np.array([])
+        
+        if self.cache is None or not use_cache:
+            return await self._request_embeddings(texts)
+        
+        found = await asyncio.to_thread(self.cache.get_many, self.model_name, texts)
+        missing = [text for text in dict.fromkeys(texts) if text not in found]
+        
+        if missing:
+            embeddings = await self._request_embeddings(missing)
+            if len(embeddings) != len(missing):
+                raise ValueError(f"嵌入结果数量不匹配: 期望 {len(missing)}，实际 {len(embeddings)}")
+            await asyncio.to_thread(self.cache.put_many, self.model_name, missing, embeddings)
+            found.update(zip(missing, np.asarray(embeddings, dtype=np.float32)))
+        
+        return np.array([found[text] for text in texts], dtype=np.float32)
+    
+    async def _request_embeddings(self, texts: List[str]) -> np.ndarray:
+        """调用远程 /embeddings 接口"""
         try:
-            if not texts:
-                return np.array([])
-            
             # 构建请求数据
             payload = {
                 "input": texts,
                 "model": self.model_name
             }
             
-            # 发送请求
+            # 发送请求（受并发上限约束）
             start_time = time.time()
-            response = self.session.post(
-                f"{self.base_url}/embeddings",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
+            async with self._semaphore:
+                response = await self._get_client().post("/embeddings", json=payload)
             response.raise_for_status()
             
             # 解析响应
@@ -56,8 +107,8 @@ class RemoteEmbeddingService:
             logger.info(f"编码 {len(texts)} 个文本，耗时: {elapsed_time:.2f}秒")
             
             return embeddings_array
-            
-        except requests.exceptions.RequestException as e:
+        
+        except httpx.HTTPError as e:
             logger.error(f"远程嵌入请求失败: {str(e)}")
             raise
         except Exception as e:
@@ -75,11 +126,21 @@ class RemoteEmbeddingService:
         return 1024
     
     async def test_connection(self) -> bool:
-        """测试连接"""
+        """测试连接（绕过嵌入缓存，每次都请求服务端）"""
         try:
             test_text = "测试文本"
-            embedding = await self.encode_single(test_text)
-            return len(embedding) > 0
+            embeddings = await self._request_embeddings([test_text])
+            return len(embeddings) > 0 and len(embeddings[0]) > 0
         except Exception as e:
             logger.error(f"连接测试失败: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+    
+    async def close(self):
+        """关闭连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
\ No newline at end of file
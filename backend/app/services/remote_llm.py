@@ -1,13 +1,20 @@
+import asyncio
 import logging
-import requests
+import httpx
 import json
-from typing import List, Dict, Any, Optional
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, AsyncIterator
 import time
 
 from ..core.config import settings
+from ..core.deadline import DeadlineExceeded, remaining_time, check_deadline
 
 logger = logging.getLogger(__name__)
 
+class LLMOverloadedError(Exception):
+    """LLM并发已满且等待队列已满"""
+    pass
+
 class RemoteLLMService:
     """远程语言模型服务"""
     
@@ -19,39 +26,106 @@ class RemoteLLMService:
         self.temperature = self.config.get("temperature", 0.7)
         self.max_tokens = self.config.get("max_tokens", 30000)
         
-        self.session = requests.Session()
-        self.session.timeout = 60
-        self.session.headers.update({
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        })
+        # 共享连接池的异步客户端；流式请求中 read 超时为相邻两个数据块之间的最长等待
+        self.client = httpx.AsyncClient(
+            base_url=self.api_base,
+            timeout=httpx.Timeout(settings.llm_timeout, connect=settings.llm_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_connections
+            ),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+        
+        # 在途生成请求上限与有界等待队列
+        self.max_concurrency = settings.llm_max_concurrency
+        self.max_queue_size = settings.llm_max_queue_size
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        self._rejected = 0
+        self._deadline_exceeded = 0
         
         logger.info(f"初始化远程LLM服务: {self.model_name}")
         logger.info(f"服务地址: {self.api_base}")
     
+    def is_overloaded(self) -> bool:
+        """并发槽位与等待队列均已占满"""
+        return self._in_flight >= self.max_concurrency and self._waiting >= self.max_queue_size
+    
+    @asynccontextmanager
+    async def _acquire_slot(self):
+        """获取生成槽位；队列已满时立即拒绝，排队时间受请求截止时间约束"""
+        if self.is_overloaded():
+            self._rejected += 1
+            raise LLMOverloadedError(f"LLM服务繁忙: {self._in_flight} 个请求进行中，{self._waiting} 个排队")
+        
+        self._waiting += 1
+        try:
+            timeout = remaining_time()
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded("请求已超过截止时间（等待LLM）")
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._deadline_exceeded += 1
+            raise DeadlineExceeded("等待LLM并发槽位超过请求截止时间")
+        finally:
+            self._waiting -= 1
+        
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+    
+    def _request_options(self) -> Dict[str, Any]:
+        """根据剩余截止时间计算本次调用的超时，并把截止时间传递给下游"""
+        remaining = remaining_time()
+        if remaining is None:
+            return {}
+        
+        if remaining <= 0:
+            self._deadline_exceeded += 1
+            raise DeadlineExceeded("请求已超过截止时间（调用LLM前）")
+        
+        timeout = min(settings.llm_timeout, remaining)
+        return {
+            "timeout": httpx.Timeout(timeout, connect=min(settings.llm_connect_timeout, timeout)),
+            "headers": {"X-Request-Timeout": f"{remaining:.3f}"}
+        }
+    
+    def _build_payload(self, prompt: str, stream: bool, **kwargs) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+            "stream": stream
+        }
+    
     async def generate(self, prompt: str, **kwargs) -> str:
         """生成文本"""
         try:
             # 构建请求数据
-            payload = {
-                "model": self.model_name,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": kwargs.get("temperature", self.temperature),
-                "max_tokens": kwargs.get("max_tokens", self.max_tokens),
-                "stream": False
-            }
+            payload = self._build_payload(prompt, stream=False, **kwargs)
             
             # 发送请求
-            start_time = time.time()
-            response = self.session.post(
-                f"{self.api_base}/chat/completions",
-                json=payload
-            )
+            async with self._acquire_slot():
+                start_time = time.time()
+                response = await self.client.post(
+                    "/chat/completions",
+                    json=payload,
+                    **self._request_options()
+                )
             response.raise_for_status()
             
             # 解析响应
@@ -63,16 +137,74 @@ class RemoteLLMService:
             
             return content.strip()
             
-        except requests.exceptions.RequestException as e:
+        except (LLMOverloadedError, DeadlineExceeded) as e:
+            logger.warning(f"LLM请求未执行: {str(e)}")
+            raise
+        except httpx.TimeoutException as e:
+            if remaining_time() is not None and remaining_time() <= 0:
+                self._deadline_exceeded += 1
+                raise DeadlineExceeded("LLM生成超过请求截止时间") from e
+            logger.error(f"远程LLM请求超时: {str(e)}")
+            raise
+        except httpx.HTTPError as e:
             logger.error(f"远程LLM请求失败: {str(e)}")
             raise
         except Exception as e:
             logger.error(f"文本生成失败: {str(e)}")
             raise
     
-    async def generate_with_context(self, question: str, context: str) -> str:
-        """基于上下文生成回答"""
-        prompt = f"""基于以下信息，请回答用户的问题。请确保回答准确、简洁且有帮助。
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """流式生成文本，逐个返回增量内容"""
+        payload = self._build_payload(prompt, stream=True, **kwargs)
+        
+        try:
+            async with self._acquire_slot():
+                start_time = time.time()
+                async with self.client.stream(
+                    "POST",
+                    "/chat/completions",
+                    json=payload,
+                    **self._request_options()
+                ) as response:
+                    response.raise_for_status()
+                    
+                    # 解析 SSE 数据行: "data: {...}"，以 "data: [DONE]" 结束
+                    async for line in response.aiter_lines():
+                        check_deadline("LLM流式生成")
+                        
+                        line = line.strip()
+                        if not line.startswith("data:"):
+                            continue
+                        
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        
+                        chunk = json.loads(data)
+                        choices = chunk.get("choices") or []
+                        if not choices:
+                            continue
+                        
+                        content = (choices[0].get("delta") or {}).get("content")
+                        if content:
+                            yield content
+            
+            elapsed_time = time.time() - start_time
+            logger.info(f"流式生成回答，耗时: {elapsed_time:.2f}秒")
+            
+        except (LLMOverloadedError, DeadlineExceeded) as e:
+            logger.warning(f"LLM流式请求中止: {str(e)}")
+            raise
+        except httpx.HTTPError as e:
+            logger.error(f"远程LLM流式请求失败: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"流式文本生成失败: {str(e)}")
+            raise
+    
+    def _build_context_prompt(self, question: str, context: str) -> str:
+        """构建基于上下文的问答提示词"""
+        return f"""基于以下信息，请回答用户的问题。请确保回答准确、简洁且有帮助。
 
 上下文信息：
 {context}
@@ -80,8 +212,15 @@ class RemoteLLMService:
 用户问题：{question}
 
 回答："""
-        
-        return await self.generate(prompt)
+    
+    async def generate_with_context(self, question: str, context: str) -> str:
+        """基于上下文生成回答"""
+        return await self.generate(self._build_context_prompt(question, context))
+    
+    async def generate_with_context_stream(self, question: str, context: str) -> AsyncIterator[str]:
+        """基于上下文流式生成回答"""
+        async for content in self.generate_stream(self._build_context_prompt(question, context)):
+            yield content
     
     async def test_connection(self) -> bool:
         """测试连接"""
@@ -91,4 +230,19 @@ class RemoteLLMService:
             return len(response) > 0
         except Exception as e:
             logger.error(f"连接测试失败: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发与排队统计信息"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "rejected": self._rejected,
+            "deadline_exceeded": self._deadline_exceeded
+        }
+    
+    async def close(self):
+        """关闭异步客户端连接池"""
+        await self.client.aclose()
\ No newline at end of file
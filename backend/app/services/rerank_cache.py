@@ -0,0 +1,92 @@
+"""
+重排序分数缓存
+
+按 (规范化查询哈希, 文档块ID, 模型名) 缓存重排序相关度分数，
+热门问题在相同候选块上重复查询时只需对未缓存的候选调用重排序服务
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str]
+
+
+class RerankScoreCache:
+    """重排序分数 LRU 缓存，支持按文档失效"""
+    
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.rerank_cache_max_entries
+        
+        # 键 -> (分数, document_id)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Optional[str]]]" = OrderedDict()
+        # document_id -> 该文档相关的缓存键
+        self._document_keys: Dict[str, Set[CacheKey]] = {}
+        
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+    
+    def get(self, query_hash: str, chunk_id: str, model_name: str) -> Optional[float]:
+        """查询缓存的分数"""
+        key = (query_hash, chunk_id, model_name)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry[0]
+    
+    def put(self, query_hash: str, chunk_id: str, model_name: str, score: float, document_id: Optional[str] = None):
+        """写入分数，超出上限时淘汰最久未使用的条目"""
+        key = (query_hash, chunk_id, model_name)
+        if key in self._entries:
+            self._remove(key)
+        
+        self._entries[key] = (float(score), document_id)
+        if document_id:
+            self._document_keys.setdefault(document_id, set()).add(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+    
+    def _remove(self, key: CacheKey):
+        _, document_id = self._entries.pop(key)
+        if document_id and document_id in self._document_keys:
+            keys = self._document_keys[document_id]
+            keys.discard(key)
+            if not keys:
+                del self._document_keys[document_id]
+    
+    def invalidate_document(self, document_id: Optional[str]):
+        """删除指定文档相关的分数，document_id 为 None 时清空全部"""
+        if document_id is None:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            self._document_keys.clear()
+            return
+        
+        for key in list(self._document_keys.get(document_id, ())):
+            self._remove(key)
+            self._invalidations += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations
+        }
\ No newline at end of file
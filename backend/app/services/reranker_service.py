@@ -5,12 +5,14 @@
 参考通用重排序模型实现，提供多种格式兼容性
 """
 
+import asyncio
 import logging
-import time
-import requests
-from typing import List, Dict, Any, Optional
+import httpx
+from typing import List, Dict, Any, Optional, ClassVar
 from dataclasses import dataclass
 from ..core.config import settings
+from .query_cache import query_hash
+from .rerank_cache import RerankScoreCache
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +29,10 @@ class RerankResult:
 class RerankerService:
     """重排序服务，用于对检索结果进行重新排序"""
     
+    # 各 api_base 上已验证可用的请求格式序号，避免每次查询重新探测
+    _working_formats: ClassVar[Dict[str, int]] = {}
+    _FORMAT_COUNT = 4
+    
     def __init__(self):
         self.config = settings.ai_config["rerank"]
         self.enabled = self.config.get("enabled", True) and settings.rerank_enabled
@@ -39,6 +45,14 @@ class RerankerService:
         self.model_name = self.config["model_name"]
         self.top_k = self.config["top_k"]
         self.timeout = self.config.get("timeout", 60)
+        self.latency_budget = settings.rerank_latency_budget
+        self.score_cache = RerankScoreCache() if settings.rerank_cache_enabled else None
+        
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+            limits=httpx.Limits(max_connections=settings.rerank_max_connections),
+            headers={"Content-Type": "application/json"}
+        )
         
     def is_enabled(self) -> bool:
         """检查重排序服务是否启用"""
@@ -72,33 +86,72 @@ class RerankerService:
             return documents
             
         try:
-            # 提取文档内容
-            doc_texts = [doc["content"] for doc in documents]
+            # 先读取缓存的分数，只对未缓存的候选调用重排序服务
+            scores: Dict[int, float] = {}
+            normalized_hash = query_hash(query) if self.score_cache is not None else None
+            uncached_indexes = []
+            for i, doc in enumerate(documents):
+                chunk_id = doc.get("id")
+                cached_score = None
+                if normalized_hash and chunk_id:
+                    cached_score = self.score_cache.get(normalized_hash, chunk_id, self.model_name)
+                if cached_score is None:
+                    uncached_indexes.append(i)
+                else:
+                    scores[i] = cached_score
+            
+            if uncached_indexes:
+                # 提取文档内容
+                doc_texts = [documents[i]["content"] for i in uncached_indexes]
+                # 与缓存分数合并需要每个候选的分数，因此启用缓存时请求全部未缓存候选的分数
+                request_top_k = len(doc_texts) if self.score_cache is not None else top_k
+                
+                # 调用重排序，超出延迟预算时直接使用向量检索顺序
+                try:
+                    rerank_results = await asyncio.wait_for(
+                        self._http_rerank(query, doc_texts, request_top_k, fallback=False),
+                        timeout=self.latency_budget
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"重排序超出延迟预算({self.latency_budget}秒)，使用向量检索顺序")
+                    return documents[:top_k]
+                
+                for result in rerank_results:
+                    if 0 <= result.index < len(uncached_indexes):
+                        original_index = uncached_indexes[result.index]
+                        scores[original_index] = result.score
+                        
+                        chunk_id = documents[original_index].get("id")
+                        if normalized_hash and chunk_id:
+                            self.score_cache.put(
+                                normalized_hash, chunk_id, self.model_name, result.score,
+                                document_id=documents[original_index].get("document_id")
+                            )
             
-            # 调用重排序
-            rerank_results = self._http_rerank(query, doc_texts, top_k)
+            logger.info(f"重排序候选 {len(documents)} 个，缓存命中 {len(documents) - len(uncached_indexes)} 个")
+            
+            # 合并缓存分数与新分数后截取top_k
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
             
             # 转换回原始文档格式
             reranked_documents = []
-            for result in rerank_results:
-                if 0 <= result.index < len(documents):
-                    doc = documents[result.index].copy()
-                    original_score = doc.get("score", 0.0)
-                    rerank_score = result.score
-                    
-                    # 保存原始分数和重排序分数
-                    doc["rerank_score"] = rerank_score
-                    doc["original_score"] = original_score
-                    
-                    # 使用加权组合分数而不是完全替换
-                    # 这样既保留了初检的语义信息，又利用了重排序的优势
-                    rerank_weight = settings.rerank_score_weight
-                    original_weight = settings.original_score_weight
-                    combined_score = rerank_weight * rerank_score + original_weight * original_score
-                    doc["score"] = combined_score
-                    doc["score_type"] = "rerank_combined"
-                    
-                    reranked_documents.append(doc)
+            for index, rerank_score in ranked:
+                doc = documents[index].copy()
+                original_score = doc.get("score", 0.0)
+                
+                # 保存原始分数和重排序分数
+                doc["rerank_score"] = rerank_score
+                doc["original_score"] = original_score
+                
+                # 使用加权组合分数而不是完全替换
+                # 这样既保留了初检的语义信息，又利用了重排序的优势
+                rerank_weight = settings.rerank_score_weight
+                original_weight = settings.original_score_weight
+                combined_score = rerank_weight * rerank_score + original_weight * original_score
+                doc["score"] = combined_score
+                doc["score_type"] = "rerank_combined"
+                
+                reranked_documents.append(doc)
                     
             if reranked_documents:
                 logger.info(f"重排序成功，返回 {len(reranked_documents)} 个文档")
@@ -111,112 +164,89 @@ class RerankerService:
             logger.error(f"重排序过程中发生错误: {str(e)}")
             return documents[:top_k]  # 发生错误时返回原始排序的前top_k个文档
     
-    def _http_rerank(self, query: str, documents: List[str], top_k: int) -> List[RerankResult]:
-        """
-        使用 HTTP API 重排序
-        参考通用HTTPRerank实现，支持多种请求格式
-        """
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        # 优先使用兼容性最好的请求格式
-        request_formats = [
+    def _build_request(self, format_index: int, query: str, documents: List[str], top_k: int) -> Dict[str, Any]:
+        """按序号构建请求体，优先使用兼容性最好的请求格式"""
+        if format_index == 0:
             # 格式1: 标准格式，包含model
-            {
-                "model": self.model_name,
-                "query": query,
-                "documents": documents,
-                "top_n": top_k
-            },
+            return {"model": self.model_name, "query": query, "documents": documents, "top_n": top_k}
+        if format_index == 1:
             # 格式2: 使用top_k而不是top_n
-            {
-                "model": self.model_name,
-                "query": query,
-                "documents": documents,
-                "top_k": top_k
-            },
+            return {"model": self.model_name, "query": query, "documents": documents, "top_k": top_k}
+        if format_index == 2:
             # 格式3: 不包含model参数
-            {
-                "query": query,
-                "documents": documents,
-                "top_n": top_k
-            },
-            # 格式4: 最简格式
-            {
-                "query": query,
-                "documents": documents
-            }
-        ]
+            return {"query": query, "documents": documents, "top_n": top_k}
+        # 格式4: 最简格式
+        return {"query": query, "documents": documents}
+    
+    async def _http_rerank(self, query: str, documents: List[str], top_k: int, fallback: bool = True) -> List[RerankResult]:
+        """
+        使用 HTTP API 重排序
+        首次调用时依次探测请求格式，成功后按 api_base 记住该格式，之后直接使用；
+        全部格式失败时，fallback 为 True 返回按原顺序递减的默认分数，否则抛出异常
+        """
+        cached_format = self._working_formats.get(self.api_base)
+        if cached_format is not None:
+            format_order = [cached_format] + [i for i in range(self._FORMAT_COUNT) if i != cached_format]
+        else:
+            format_order = list(range(self._FORMAT_COUNT))
         
         last_error = None
         max_retries = 2
-        retry_delay = 1  # seconds
+        retry_delay = 0.2  # seconds，指数退避基数
         
-        for i, data in enumerate(request_formats):
+        for i in format_order:
+            data = self._build_request(i, query, documents, top_k)
             for attempt in range(1, max_retries + 1):
                 try:
                     logger.debug(f"尝试请求格式 {i+1}（第{attempt}次）: {list(data.keys())}")
                     
-                    response = requests.post(
-                        self.api_base,
-                        headers=headers,
-                        json=data,
-                        timeout=self.timeout
-                    )
+                    response = await self.client.post(self.api_base, json=data)
                     
                     logger.debug(f"响应状态码: {response.status_code}")
                     
-                    if response.status_code == 500:
+                    if response.status_code in (400, 422, 500):
+                        # 请求体不被接受，换下一种格式
                         try:
                             error_info = response.json()
-                            logger.warning(f"格式 {i+1} 服务器错误: {error_info}")
                         except Exception:
-                            logger.warning(f"格式 {i+1} 服务器错误: {response.text}")
-                        
-                        # 500错误，尝试下一个格式或重试
-                        if i < len(request_formats) - 1:
-                            break
-                        elif attempt < max_retries:
-                            logger.info(f"500错误，等待{retry_delay}秒后重试...")
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            break
+                            error_info = response.text
+                        logger.warning(f"格式 {i+1} 请求被拒绝({response.status_code}): {error_info}")
+                        break
                     
                     response.raise_for_status()
                     result_data = response.json()
-                    logger.debug(f"响应数据结构: {type(result_data)}")
                     
                     # 解析响应结果
                     results = self._parse_rerank_response(result_data, documents, top_k)
                     
                     if results:
-                        logger.info(f"使用格式 {i+1} 成功获取 {len(results)} 个重排序结果")
+                        if self._working_formats.get(self.api_base) != i:
+                            self._working_formats[self.api_base] = i
+                            logger.info(f"记住重排序请求格式 {i+1}: {self.api_base}")
                         return results
                     else:
                         logger.warning(f"格式 {i+1} 返回空结果")
                         break
                         
-                except requests.exceptions.RequestException as e:
+                except httpx.HTTPError as e:
                     last_error = e
                     logger.warning(f"请求格式 {i+1} 网络请求失败（第{attempt}次）: {e}")
                 except Exception as e:
                     last_error = e
                     logger.warning(f"处理格式 {i+1} 响应时出错（第{attempt}次）: {e}")
                 
-                # 重试或切换格式
+                # 网络错误时退避重试同一格式
                 if attempt < max_retries:
-                    logger.info(f"等待{retry_delay}秒后重试...")
-                    time.sleep(retry_delay)
-                elif i < len(request_formats) - 1:
-                    logger.info(f"尝试下一种请求格式...")
-                    break
-                else:
-                    break
+                    await asyncio.sleep(retry_delay * (2 ** (attempt - 1)))
+            
+            # 已记住的格式失效时重新探测
+            if self._working_formats.get(self.api_base) == i:
+                del self._working_formats[self.api_base]
         
         # 全部失败，返回降序默认分数
         logger.error(f"所有请求格式都失败，最后一个错误: {last_error}")
+        if not fallback:
+            raise RuntimeError(f"重排序服务不可用: {last_error}")
         return [
             RerankResult(index=i, score=1.0/(i+1), text=doc)
             for i, doc in enumerate(documents[:top_k])
@@ -364,7 +394,7 @@ class RerankerService:
         try:
             # 使用简单的测试调用
             test_docs = ["这是一个测试文档"]
-            results = self._http_rerank("测试查询", test_docs, 1)
+            results = await self._http_rerank("测试查询", test_docs, 1, fallback=False)
             
             if results and len(results) > 0:
                 logger.info("重排序服务连接测试成功")
@@ -375,4 +405,9 @@ class RerankerService:
                 
         except Exception as e:
             logger.error(f"重排序服务连接测试失败: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+    
+    async def close(self):
+        """关闭异步客户端连接池"""
+        if self.enabled:
+            await self.client.aclose()
\ No newline at end of file
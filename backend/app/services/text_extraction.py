@@ -0,0 +1,171 @@
+"""
+进程池文档解析
+
+PyPDF2 / python-docx 解析是纯 CPU 计算，在事件循环中同步执行会阻塞同一进程内的
+所有查询。解析改为在常驻进程池中执行：大 PDF 按页范围拆成多个子任务并行解析，每个解析
+进程限制新增的地址空间，异常文件不会拖垮主进程。进程池使用 forkserver（不支持时用 spawn）
+启动，子进程只导入精简的 app.workers.extraction；文件解析超时时终止并重建进程池，
+其他文件在途的子任务自动重新提交。
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, AsyncIterator, Deque, Tuple
+
+from ..core.config import settings
+from ..workers import extraction
+
+logger = logging.getLogger(__name__)
+
+
+def page_ranges(page_count: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    pages_per_task = max(1, pages_per_task)
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+class TextExtractor:
+    """在常驻进程池中解析 PDF / DOCX"""
+    
+    # 子任务因进程池被终止（其他文件超时或解析进程异常退出）而失败时的最多提交次数
+    _SUBMIT_ATTEMPTS = 3
+    
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        timeout: Optional[float] = None,
+        memory_limit_mb: Optional[int] = None,
+        pages_per_task: Optional[int] = None
+    ):
+        self.workers = workers or settings.extraction_workers or os.cpu_count() or 1
+        self.timeout = settings.extraction_timeout if timeout is None else timeout
+        self.memory_limit_mb = settings.extraction_memory_limit_mb if memory_limit_mb is None else memory_limit_mb
+        self.pages_per_task = pages_per_task or settings.extraction_pdf_pages_per_task
+        
+        # 不使用 fork：主进程有多个线程，fork 出的子进程可能继承被其他线程持有的锁而死锁
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._running = 0
+        self._timeouts = 0
+        self._recycles = 0
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            if self._context.get_start_method() == "forkserver":
+                # 在 forkserver 中预先导入解析依赖，之后每个解析进程直接从它 fork
+                self._context.set_forkserver_preload([extraction.__name__])
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._context,
+                initializer=extraction.init_worker,
+                initargs=(self.memory_limit_mb,)
+            )
+        return self._pool
+    
+    def _recycle(self, pool: ProcessPoolExecutor):
+        """终止进程池的全部解析进程，下次提交时重建；已被重建过的旧进程池直接忽略"""
+        if pool is not self._pool:
+            return
+        self._pool = None
+        self._recycles += 1
+        # ProcessPoolExecutor 没有公开终止工作进程的接口，shutdown 会等待正在执行的子任务完成
+        for process in list((pool._processes or {}).values()):
+            if process.is_alive():
+                process.terminate()
+        pool.shutdown(wait=False)
+    
+    def _submit(self, deadline: float, func, *args) -> asyncio.Future:
+        return asyncio.ensure_future(self._run(deadline, func, *args))
+    
+    async def _run(self, deadline: float, func, *args):
+        """
+        在进程池中执行一个子任务
+        
+        超过所属文件的截止时间时，未开始的子任务直接取消，已在执行的终止并重建进程池；
+        因进程池被终止而失败的子任务重新提交到新的进程池
+        """
+        loop = asyncio.get_running_loop()
+        self._running += 1
+        try:
+            for _ in range(self._SUBMIT_ATTEMPTS):
+                pool = self._get_pool()
+                try:
+                    future = pool.submit(func, *args)
+                except BrokenProcessPool:
+                    self._recycle(pool)
+                    continue
+                timeout = None if deadline == float("inf") else max(0.0, deadline - loop.time())
+                try:
+                    return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+                except asyncio.TimeoutError:
+                    if not future.cancel():
+                        self._recycle(pool)
+                    raise
+                except BrokenProcessPool:
+                    # 解析进程异常退出（如被系统因内存终止），或其他文件超时终止了进程池
+                    self._recycle(pool)
+            raise ValueError("解析进程异常退出")
+        finally:
+            self._running -= 1
+    
+    async def _wait(self, awaitable):
+        try:
+            return await awaitable
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise ValueError(f"解析超时（超过 {self.timeout:.0f} 秒）")
+        except MemoryError:
+            raise ValueError(f"解析超出内存限制（{self.memory_limit_mb}MB）")
+    
+    def _deadline(self) -> float:
+        return asyncio.get_running_loop().time() + self.timeout if self.timeout > 0 else float("inf")
+    
+    async def iter_pdf(self, file_path: str) -> AsyncIterator[str]:
+        """
+        按页范围拆分后并行提取，按页序逐段产出文本
+        
+        同时在途的页范围不超过进程数，消费方处理较慢时不会提前解析出整份文档
+        """
+        deadline = self._deadline()
+        page_count = await self._wait(self._submit(deadline, extraction.pdf_page_count, file_path))
+        ranges = page_ranges(page_count, self.pages_per_task)
+        if len(ranges) > 1:
+            logger.info(f"PDF 共 {page_count} 页，拆分为 {len(ranges)} 个解析任务")
+        
+        pending: Deque[asyncio.Future] = deque()
+        try:
+            for start, end in ranges:
+                pending.append(self._submit(deadline, extraction.extract_pdf_pages, file_path, start, end))
+                if len(pending) >= self.workers:
+                    yield await self._wait(pending.popleft())
+            while pending:
+                yield await self._wait(pending.popleft())
+        finally:
+            for future in pending:
+                if future.done() and not future.cancelled():
+                    # 同一文件的其他子任务可能同时超时，取走异常避免未处理告警
+                    future.exception()
+                future.cancel()
+    
+    async def extract_pdf(self, file_path: str) -> str:
+        return "".join([part async for part in self.iter_pdf(file_path)])
+    
+    async def extract_docx(self, file_path: str) -> str:
+        return await self._wait(self._submit(self._deadline(), extraction.extract_docx, file_path))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "timeouts": self._timeouts,
+            "pool_restarts": self._recycles
+        }
+    
+    def close(self):
+        if self._pool is not None:
+            self._recycle(self._pool)
\ No newline at end of file
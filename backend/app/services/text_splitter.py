@@ -0,0 +1,136 @@
+"""
+中文友好的线性时间文本分割器
+
+替代 LangChain 的 RecursiveCharacterTextSplitter：后者按分隔符逐级递归切分再合并，长文本上
+反复复制子串，且中文文本空格很少，找不到 "\n\n"/"\n"/" " 时退化为逐字符切分。这里按优先级
+（段落、换行、句末标点、分句标点、空白）在每个 chunk_size 窗口内从窗口末尾向前查找断点
+（str.rfind，C 实现），取最高优先级中最靠后的断点结束本块，相邻块的重叠部分从边界处开始。
+每个窗口只查找一次，总耗时与文本长度成线性。分割结果是 (起始, 结束) 偏移，需要文本时才切片。
+"""
+
+import re
+from typing import List, Tuple
+
+# 按优先级排列的分隔符，断点位于分隔符之后（分隔符留在前一块末尾）
+_SEPARATORS: List[Tuple[str, ...]] = [
+    ("\n\n",),
+    ("\n",),
+    ("。", "！", "？", "；", "…", "!", "?", ";", ". "),
+    ("，", "、", ",", "：", ":"),
+    (" ", "\t", "\u3000"),
+]
+# 任一级分隔符（较短的在前，同一位置取最靠前的断点）
+_ANY_SEPARATOR_RE = re.compile("|".join(
+    re.escape(separator) for separator in sorted(
+        (separator for separators in _SEPARATORS for separator in separators), key=len
+    )
+))
+_MAX_SEPARATOR_LENGTH = max(len(separator) for separators in _SEPARATORS for separator in separators)
+# 句末标点之后紧跟的引号/括号归入前一句
+_CLOSERS = frozenset("”’\"'」』）)")
+# 断点可能涉及的非空白字符
+_BREAK_CHARS = frozenset("。！？；…!?;.，、,：:") | _CLOSERS
+
+
+class TextSplitter:
+    """按 chunk_size / chunk_overlap 切分文本，接口与 LangChain 分割器的 split_text 一致"""
+    
+    def __init__(self, chunk_size: int, chunk_overlap: int = 0):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size 必须大于 0")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap 必须不小于 0 且小于 chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+    
+    def _break_after(self, text: str, index: int, separator: str, limit: int) -> int:
+        """位于 index 的分隔符之后的断点位置（句末标点后紧跟的引号/括号一并计入，不超过 limit）"""
+        position = index + len(separator)
+        if separator in _SEPARATORS[2]:
+            while position < limit and text[position] in _CLOSERS:
+                position += 1
+        return position
+    
+    def _last_break(self, text: str, floor: int, limit: int) -> int:
+        """(floor, limit] 内优先级最高的一级断点中最靠后的一个，没有时返回 -1"""
+        for separators in _SEPARATORS:
+            best = -1
+            for separator in separators:
+                index = text.rfind(separator, max(0, floor - len(separator) + 1), limit)
+                if index >= 0:
+                    best = max(best, self._break_after(text, index, separator, limit))
+            if best > floor:
+                return best
+        return -1
+    
+    def split_spans(self, text: str, previous_end: int = 0) -> List[Tuple[int, int]]:
+        """
+        返回各块在 text 中的 (起始, 结束) 偏移，块首尾空白已去除
+        
+        previous_end 为 text 之前已切出的上一块在 text 中的结束位置（流式切分时，text 从
+        上一段未完成的块开始，而该块与更早的块重叠），第一块必须越过该位置。
+        """
+        spans: List[Tuple[int, int]] = []
+        length = len(text)
+        start = 0
+        
+        while True:
+            # 块首空白不计入块大小
+            while start < length and text[start].isspace():
+                start += 1
+            if start >= length:
+                break
+            # 新块必须包含上一块结束后的第一个非空白字符
+            while previous_end < length and text[previous_end].isspace():
+                previous_end += 1
+            
+            limit = start + self.chunk_size
+            if limit >= length:
+                end = length
+            else:
+                # 断点须越过上一块的结束位置，窗口内没有断点时按字符截断
+                end = self._last_break(text, max(start, previous_end), limit)
+                if end < 0:
+                    end = limit
+            
+            span_end = end
+            while text[span_end - 1].isspace():
+                span_end -= 1
+            spans.append((start, span_end))
+            
+            if end >= length:
+                break
+            start = self._next_start(text, start, end)
+            previous_end = span_end
+        
+        return spans
+    
+    def _next_start(self, text: str, start: int, end: int) -> int:
+        """下一块的起点：重叠不超过 chunk_overlap，并尽量从重叠范围内最靠前的断点开始"""
+        if self.chunk_overlap == 0:
+            return end
+        earliest = max(end - self.chunk_overlap, start + 1)
+        for match in _ANY_SEPARATOR_RE.finditer(text, max(start, earliest - _MAX_SEPARATOR_LENGTH), end):
+            position = self._break_after(text, match.start(), match.group(), end)
+            if position >= end:
+                break
+            if position >= earliest:
+                return position
+        # 重叠范围内没有断点（如无标点的长文本），按字符重叠
+        return earliest
+    
+    @staticmethod
+    def stable_length(text: str) -> int:
+        """
+        text 中断点不受后续文本影响的前缀长度
+        
+        末尾的空白/标点可能与后续文本组成不同的断点（如 "\n" 与后续的 "\n" 组成段落断点），
+        流式切分时只切分到最后一个普通字符为止。
+        """
+        end = len(text)
+        while end > 0 and (text[end - 1].isspace() or text[end - 1] in _BREAK_CHARS):
+            end -= 1
+        return end
+    
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
\ No newline at end of file
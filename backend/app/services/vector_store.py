@@ -1,5 +1,7 @@
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Callable, Set, Tuple, Union, AsyncIterable, Awaitable
 import chromadb
 from chromadb.config import Settings as ChromaSettings
 from langchain.schema import Document
@@ -7,6 +9,16 @@ import numpy as np
 
 from ..core.config import settings
 from .remote_embedding import RemoteEmbeddingService
+from .embedding_batcher import EmbeddingBatcher
+from .adaptive_batcher import AdaptiveBatchSizer
+from .query_cache import QueryEmbeddingCache
+from .numpy_index import NumpyCollection, match_where
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .collection_stats import CollectionStats
+from .filter_index import MetadataFilterIndex
+from .near_duplicate import NearDuplicateIndex
+from .ingest_log import IngestLog
+from .ingest_writer import IngestWriter, WriteBatch
 
 logger = logging.getLogger(__name__)
 
@@ -15,180 +27,826 @@ class VectorStore:
     
     def __init__(self):
         self.embedding_service = None
+        self.embedding_batcher = None
+        self.ingest_sizer = AdaptiveBatchSizer()
+        self.query_cache = QueryEmbeddingCache() if settings.query_cache_enabled else None
+        self.bm25_index = BM25Index() if settings.hybrid_search_enabled else None
+        self.stats = CollectionStats()
+        self.filter_index = MetadataFilterIndex()
+        self.dedup_index = NearDuplicateIndex() if settings.dedup_enabled else None
+        self.ingest_log = IngestLog()
+        self.writer = IngestWriter(self._write_batches)
+        # 正在入库的文档: document_id -> 入库结束时完成的 future
+        self._ingesting: Dict[str, asyncio.Future] = {}
         self.chroma_client = None
         self.collection = None
+        # 文档删除/集合清空时的回调，参数为 document_id（清空时为 None）
+        self._invalidation_listeners: List[Callable[[Optional[str]], None]] = []
+        # 启动时回滚的未完成入库涉及的文档，由 RAGService 同步清理文档登记表
+        self.rolled_back_document_ids: List[str] = []
         self._initialize_store()
     
+    def _ensure_bm25_index(self):
+        """BM25索引文件缺失（首次启用或损坏）而集合非空时，从集合全量重建一次"""
+        if self.bm25_index is None or len(self.bm25_index) > 0:
+            return
+        
+        total = self.collection.count()
+        if total == 0:
+            return
+        
+        logger.info(f"从向量集合重建BM25索引，共 {total} 个文档块")
+        page_size = 1000
+        for offset in range(0, total, page_size):
+            results = self.collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            self.bm25_index.add(results["ids"], results["documents"], results["metadatas"])
+        self.bm25_index.save()
+    
+    def _ensure_dedup_index(self):
+        """去重指纹索引缺失而集合非空时，从已入库的块重建一次"""
+        if self.dedup_index is None or len(self.dedup_index) > 0:
+            return
+        
+        total = self.collection.count()
+        if total == 0:
+            return
+        
+        logger.info(f"从向量集合重建去重指纹索引，共 {total} 个文档块")
+        page_size = 1000
+        for offset in range(0, total, page_size):
+            results = self.collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            self.dedup_index.add(results["ids"], results["documents"], results["metadatas"])
+        self.dedup_index.save()
+    
+    @property
+    def uses_numpy_backend(self) -> bool:
+        return settings.vector_store_backend == "numpy"
+    
+    def _to_backend_embeddings(self, embeddings: np.ndarray):
+        """Chroma 需要 Python 列表，NumPy 后端直接使用数组避免转换开销"""
+        if self.uses_numpy_backend:
+            return np.asarray(embeddings, dtype=np.float32)
+        return np.asarray(embeddings).tolist()
+    
     def _initialize_store(self):
         """初始化向量存储"""
         try:
             # 初始化远程嵌入服务
             logger.info("初始化远程嵌入服务...")
             self.embedding_service = RemoteEmbeddingService()
+            self.embedding_batcher = EmbeddingBatcher(self.embedding_service)
             
-            # 初始化Chroma客户端
-            self.chroma_client = chromadb.PersistentClient(
-                path=settings.chroma_persist_directory,
-                settings=ChromaSettings(anonymized_telemetry=False)
-            )
+            if self.uses_numpy_backend:
+                # NumPy 内存映射索引，接口与 Chroma 集合一致
+                self.collection = NumpyCollection(settings.numpy_index_directory)
+            else:
+                # 初始化Chroma客户端
+                self.chroma_client = chromadb.PersistentClient(
+                    path=settings.chroma_persist_directory,
+                    settings=ChromaSettings(anonymized_telemetry=False)
+                )
+                
+                # 获取或创建集合
+                self.collection = self.chroma_client.get_or_create_collection(
+                    name=settings.chroma_collection_name,
+                    metadata={"description": "RAG Knowledge Base Collection"}
+                )
             
-            # 获取或创建集合
-            self.collection = self.chroma_client.get_or_create_collection(
-                name=settings.chroma_collection_name,
-                metadata={"description": "RAG Knowledge Base Collection"}
-            )
+            self._replay_ingest_log()
+            self._ensure_bm25_index()
+            self._ensure_dedup_index()
+            self.filter_index.rebuild(self.collection)
+            if self.dedup_index is not None:
+                self.filter_index.add(*self.dedup_index.alias_entries())
+            
+            # 统计文件缺失、上次写入未正常结束或与集合块数不一致时全量重建
+            if self.stats.needs_rebuild(self.collection.count()):
+                self.stats.rebuild(self.collection)
             
-            logger.info("向量存储初始化成功")
+            logger.info(f"向量存储初始化成功，后端: {settings.vector_store_backend}")
             
         except Exception as e:
             logger.error(f"向量存储初始化失败: {str(e)}")
             raise
     
-    async def add_documents(self, documents: List[Document]) -> Dict[str, Any]:
-        """添加文档到向量存储"""
-        try:
+    async def add_documents(
+        self,
+        documents: Union[List[Document], AsyncIterable[Document]],
+        progress: Optional[Callable[[int, int], None]] = None,
+        document_ids: Optional[List[str]] = None,
+        before_complete: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        添加文档到向量存储
+        
+        documents 可以是列表，也可以是边解析边产出文档块的异步迭代器（此时需给出 document_ids）。
+        入库按流水线执行：读取文档块 → 去重并按字符预算组批 → 并行嵌入 → 提交给单写入者组提交，
+        各阶段之间是有界队列，下游处理不过来时上游暂停，内存占用与文档大小无关，
+        解析、嵌入和写入在时间上重叠。
+        
+        启用去重时，与已入库块近似重复的块不再嵌入和写入，只记录为别名；本次保留的块在所属批次
+        写入提交后才能被其他入库作为别名的来源，失败回滚时不会留下指向未写入块的别名。写入前先登记
+        预写日志，全部索引落盘后才删除日志记录，崩溃后重启时回滚未完成的入库。
+        progress(已处理块数, 已读取块数) 在每批去重和每批写入后调用，已处理块数包含跳过的重复块。
+        before_complete(入库结果) 在删除日志记录之前调用（如写入文档登记表），失败时与入库一起回滚。
+        """
+        if isinstance(documents, list):
             if not documents:
                 return {"added_count": 0}
+            if document_ids is None:
+                document_ids = list(dict.fromkeys(doc.metadata.get("document_id", "unknown") for doc in documents))
+        elif document_ids is None:
+            raise ValueError("流式入库需要指定 document_ids")
+        
+        log_entry = await asyncio.to_thread(self.ingest_log.begin, document_ids, [])
+        # 删除同一文档时等待本次入库结束
+        ingest_done = asyncio.get_running_loop().create_future()
+        for document_id in document_ids:
+            self._ingesting[document_id] = ingest_done
+        
+        dedup_session = self.dedup_index.begin() if self.dedup_index is not None else None
+        await asyncio.to_thread(self.stats.begin_write)
+        worker_count = max(1, settings.embedding_ingest_concurrency)
+        chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.ingest_pipeline_queue_size))
+        batch_queue: asyncio.Queue = asyncio.Queue(maxsize=worker_count)
+        total_count = 0
+        added_count = 0
+        processed_count = 0
+        batch_count = 0
+        
+        def report():
+            if progress:
+                progress(processed_count, total_count)
+        
+        async def read_chunks():
+            """读取阶段：文档块逐个放入有界队列，结束时放入 None"""
+            if isinstance(documents, list):
+                for doc in documents:
+                    await chunk_queue.put(doc)
+            else:
+                async for doc in documents:
+                    await chunk_queue.put(doc)
+            await chunk_queue.put(None)
+        
+        async def make_batches():
+            """组批阶段：分配块ID并去重，按当前预算组成嵌入批次"""
+            nonlocal total_count, processed_count, batch_count
+            ids: List[str] = []
+            texts: List[str] = []
+            metadatas: List[Dict[str, Any]] = []
+            finished = False
+            while not finished:
+                # 取出队列中已有的全部块，一起去重
+                group = [await chunk_queue.get()]
+                while not chunk_queue.empty():
+                    group.append(chunk_queue.get_nowait())
+                if group[-1] is None:
+                    group.pop()
+                    finished = True
+                
+                group_ids = [
+                    f"{doc.metadata.get('document_id', 'unknown')}_{doc.metadata.get('chunk_index', total_count + i)}"
+                    for i, doc in enumerate(group)
+                ]
+                group_texts = [doc.page_content for doc in group]
+                group_metadatas = [doc.metadata for doc in group]
+                total_count += len(group)
+                keep = range(len(group))
+                if self.dedup_index is not None and group:
+                    keep = await asyncio.to_thread(
+                        self.dedup_index.deduplicate, group_ids, group_texts, group_metadatas, dedup_session
+                    )
+                    processed_count += len(group) - len(keep)
+                    # 重复块以别名ID登记到过滤索引，按文档过滤和列出文档块时解析为已入库块
+                    kept = set(keep)
+                    skipped = [i for i in range(len(group)) if i not in kept]
+                    self.filter_index.add([group_ids[i] for i in skipped], [group_metadatas[i] for i in skipped])
+                ids.extend(group_ids[i] for i in keep)
+                texts.extend(group_texts[i] for i in keep)
+                metadatas.extend(group_metadatas[i] for i in keep)
+                report()
+                
+                # 缓冲区不足一整批时等待更多块，读取结束后全部发出
+                start = 0
+                while start < len(texts):
+                    end = self.ingest_sizer.next_batch_end(texts, start)
+                    if end == len(texts) and end - start < self.ingest_sizer.max_items and not finished:
+                        break
+                    batch_count += 1
+                    await batch_queue.put((ids[start:end], texts[start:end], metadatas[start:end]))
+                    start = end
+                del ids[:start], texts[:start], metadatas[:start]
             
-            # 提取文本内容
-            texts = [doc.page_content for doc in documents]
-            metadatas = [doc.metadata for doc in documents]
-            
-            # 生成唯一ID
-            ids = [f"{doc.metadata.get('document_id', 'unknown')}_{doc.metadata.get('chunk_index', i)}" 
-                   for i, doc in enumerate(documents)]
-            
-            # 生成嵌入向量
-            logger.info(f"生成 {len(texts)} 个文档块的嵌入向量")
-            embeddings = await self.embedding_service.encode(texts)
-            embeddings_list = embeddings.tolist()
-            
-            # 添加到Chroma
-            self.collection.add(
-                embeddings=embeddings_list,
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids
-            )
+            for _ in range(worker_count):
+                await batch_queue.put(None)
+        
+        async def embed_and_write():
+            """嵌入阶段：嵌入完成的批次提交给写入队列，与其他上传的批次合并写入"""
+            nonlocal added_count, processed_count
+            while True:
+                batch = await batch_queue.get()
+                if batch is None:
+                    return
+                batch_ids, batch_texts, batch_metadatas = batch
+                embeddings = await self._embed_batch(batch_texts)
+                await self.writer.write((batch_ids, embeddings, batch_texts, batch_metadatas))
+                if self.dedup_index is not None:
+                    self.dedup_index.publish(batch_ids)
+                added_count += len(batch_ids)
+                processed_count += len(batch_ids)
+                report()
+        
+        try:
+            tasks = [
+                asyncio.ensure_future(read_chunks()),
+                asyncio.ensure_future(make_batches()),
+                *[asyncio.ensure_future(embed_and_write()) for _ in range(worker_count)]
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # 任一阶段失败（解析出错、批次最终嵌入失败）时停止整条流水线
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
             
-            logger.info(f"成功添加 {len(documents)} 个文档块到向量存储")
+            if self.bm25_index is not None:
+                await asyncio.to_thread(self.bm25_index.save)
+            if self.dedup_index is not None:
+                await asyncio.to_thread(self.dedup_index.save)
             
-            return {
-                "added_count": len(documents),
+            duplicate_count = total_count - added_count
+            result = {
+                "added_count": added_count,
+                "duplicate_count": duplicate_count,
+                "dedup_ratio": duplicate_count / total_count if total_count else 0.0,
+                "batch_count": batch_count,
                 "collection_size": self.collection.count()
             }
+            if before_complete is not None:
+                await before_complete(result)
+            await asyncio.to_thread(self.ingest_log.complete, log_entry)
             
-        except Exception as e:
-            logger.error(f"添加文档到向量存储失败: {str(e)}")
+            if duplicate_count:
+                logger.info(f"跳过 {duplicate_count} 个近似重复的文档块")
+            logger.info(f"成功添加 {added_count} 个文档块到向量存储，共 {batch_count} 批")
+            return result
+            
+        except (Exception, asyncio.CancelledError) as e:
+            # 取消（如入库任务被取消）同样需要回滚
+            logger.error(f"添加文档到向量存储失败: {str(e) or type(e).__name__}")
+            # 回滚已写入的批次，避免文档只入库一部分；排在已提交的写入之后执行
+            try:
+                await self.writer.run_exclusive(lambda: asyncio.to_thread(self._rollback_documents, document_ids))
+                await asyncio.to_thread(self.ingest_log.complete, log_entry)
+            except Exception as rollback_error:
+                # 日志记录保留，重启时再回滚
+                logger.error(f"回滚已写入的文档块失败: {str(rollback_error)}")
             raise
+        finally:
+            if self.dedup_index is not None:
+                self.dedup_index.discard(dedup_session)
+            await asyncio.to_thread(self.stats.end_write)
+            ingest_done.set_result(None)
+            for document_id in document_ids:
+                if self._ingesting.get(document_id) is ingest_done:
+                    del self._ingesting[document_id]
+    
+    def _write_batches(self, batches: List[WriteBatch]):
+        """写入一组批次（写入任务在线程中调用）：一次 collection.add，再更新各内存索引"""
+        ids = [chunk_id for batch in batches for chunk_id in batch[0]]
+        embeddings = np.vstack([np.asarray(batch[1], dtype=np.float32) for batch in batches])
+        texts = [text for batch in batches for text in batch[2]]
+        metadatas = [metadata for batch in batches for metadata in batch[3]]
+        
+        self.collection.add(
+            embeddings=self._to_backend_embeddings(embeddings),
+            documents=texts,
+            metadatas=metadatas,
+            ids=ids
+        )
+        self.stats.record_added(metadatas)
+        self.filter_index.add(ids, metadatas)
+        if self.bm25_index is not None:
+            self.bm25_index.add(ids, texts, metadatas)
+    
+    def _rollback_documents(self, document_ids: List[str]):
+        """撤销一次入库：删除这些文档已写入的块，并从各索引移除（流式入库事先不知道全部块ID）"""
+        for document_id in document_ids:
+            existing = self.collection.get(where={"document_id": document_id}, include=["metadatas"])
+            if existing["ids"]:
+                self._detach_aliases(document_id, existing["ids"])
+                self.collection.delete(ids=existing["ids"])
+                self.stats.record_removed(existing["metadatas"])
+            self.filter_index.remove_document(document_id)
+            if self.bm25_index is not None:
+                self.bm25_index.remove_document(document_id)
+            if self.dedup_index is not None:
+                self.dedup_index.remove_document(document_id)
+    
+    def _detach_aliases(self, document_id: str, chunk_ids: List[str]) -> int:
+        """
+        删除文档块前，由其他文档中指向这些块的别名接替：来源块的向量和文本按第一个别名的ID
+        和元数据重新写入，其余别名改为指向它。返回接替的块数
+        """
+        if self.dedup_index is None:
+            return 0
+        dependents = self.dedup_index.dependent_aliases(document_id, chunk_ids)
+        if not dependents:
+            return 0
+        
+        originals = self.collection.get(ids=list(dependents), include=["embeddings", "documents"])
+        ids: List[str] = []
+        texts: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        for original_id, text in zip(originals["ids"], originals["documents"]):
+            alias_id = dependents[original_id][0]
+            ids.append(alias_id)
+            texts.append(text)
+            metadatas.append(self.dedup_index.alias_metadata(alias_id))
+        if not ids:
+            return 0
+        
+        self.collection.add(
+            embeddings=self._to_backend_embeddings(np.asarray(originals["embeddings"], dtype=np.float32)),
+            documents=texts,
+            metadatas=metadatas,
+            ids=ids
+        )
+        self.stats.record_added(metadatas)
+        self.filter_index.add(ids, metadatas)
+        if self.bm25_index is not None:
+            self.bm25_index.add(ids, texts, metadatas)
+        for original_id, alias_id, text in zip(originals["ids"], ids, texts):
+            self.dedup_index.promote(alias_id, text, dependents[original_id][1:])
+        logger.info(f"文档 {document_id} 的 {len(ids)} 个块由其他文档的重复块接替")
+        return len(ids)
+    
+    def _replay_ingest_log(self):
+        """回滚上次运行中未完成的入库"""
+        entries = self.ingest_log.pending()
+        if not entries:
+            return
+        
+        for entry in entries:
+            logger.warning(f"回滚未完成的入库: 文档 {', '.join(entry['document_ids'])}")
+            self._rollback_documents(entry["document_ids"])
+            self.ingest_log.complete(entry["id"])
+            self.rolled_back_document_ids.extend(entry["document_ids"])
+        
+        if self.bm25_index is not None:
+            self.bm25_index.save()
+        if self.dedup_index is not None:
+            self.dedup_index.save()
+        # 统计计数在崩溃时可能已不准确，强制重建
+        self.stats.loaded_clean = False
+        self.ingest_log.record_replayed(len(entries))
+    
+    async def _embed_batch(self, texts: List[str], attempt: int = 0) -> np.ndarray:
+        """嵌入一个批次，失败时收缩预算、拆分批次并退避重试"""
+        start_time = time.perf_counter()
+        try:
+            embeddings = await self.embedding_service.encode(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"嵌入结果数量不匹配: 期望 {len(texts)}，实际 {len(embeddings)}")
+        except Exception as e:
+            self.ingest_sizer.record_failure()
+            if attempt >= settings.embedding_ingest_max_retries:
+                raise
+            
+            delay = 0.5 * (2 ** attempt)
+            logger.warning(f"嵌入批次失败（{len(texts)} 个文本，第{attempt + 1}次），{delay:.1f}秒后重试: {str(e)}")
+            await asyncio.sleep(delay)
+            
+            if len(texts) > 1:
+                mid = len(texts) // 2
+                left = await self._embed_batch(texts[:mid], attempt + 1)
+                right = await self._embed_batch(texts[mid:], attempt + 1)
+                return np.vstack([left, right])
+            return await self._embed_batch(texts, attempt + 1)
+        
+        self.ingest_sizer.record_success(time.perf_counter() - start_time)
+        return embeddings
+    
+    async def embed_query(self, query: str) -> np.ndarray:
+        """生成查询向量，优先读取内存缓存，未命中时与并发查询合并为批量请求"""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        
+        query_embedding = await self.embedding_batcher.encode_single(query)
+        
+        if self.query_cache is not None and len(query_embedding) > 0:
+            self.query_cache.put(query, query_embedding)
+        return query_embedding
+    
+    async def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """批量生成查询向量：缓存未命中的查询合并为一次嵌入调用"""
+        embeddings: List[Optional[np.ndarray]] = [None] * len(queries)
+        missing: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            cached = self.query_cache.get(query) if self.query_cache is not None else None
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                missing.setdefault(query, []).append(i)
+        
+        if missing:
+            texts = list(missing)
+            encoded = await self.embedding_service.encode(texts, use_cache=False)
+            for text, embedding in zip(texts, encoded):
+                for i in missing[text]:
+                    embeddings[i] = embedding
+                if self.query_cache is not None:
+                    self.query_cache.put(text, embedding)
+        
+        return np.stack(embeddings)
     
     async def similarity_search(
         self, 
         query: str, 
         top_k: int = None,
-        filter_metadata: Optional[Dict[str, Any]] = None
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        filters: Optional[Dict[str, List[str]]] = None
     ) -> List[Dict[str, Any]]:
         """相似性检索"""
+        # 生成查询向量（调用方已生成时直接复用）
+        if query_embedding is None:
+            query_embedding = await self.embed_query(query)
+        
+        results = await self.similarity_search_batch([query], top_k, filter_metadata, query_embedding[None, :], filters)
+        return results[0]
+    
+    async def similarity_search_batch(
+        self,
+        queries: List[str],
+        top_k: int = None,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        query_embeddings: Optional[np.ndarray] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量相似性检索：多个查询向量通过一次 collection.query 检索，结果与输入顺序一致
+        
+        filters 为 document_id / source / file_type 过滤条件，通过过滤索引解析为文档块子集后只在子集内检索
+        """
         try:
             top_k = top_k or settings.top_k
             
-            # 生成查询向量
-            query_embedding = await self.embedding_service.encode_single(query)
-            query_embedding_list = query_embedding.tolist()
+            if query_embeddings is None:
+                query_embeddings = await self.embed_queries(queries)
+            
+            subset = self._resolve_filters(filters)
+            batch_docs = self._dense_search_batch(queries, top_k, filter_metadata, query_embeddings, subset)
+            return [self._relabel_aliases(docs, subset[2]) for docs in batch_docs]
             
+        except Exception as e:
+            logger.error(f"相似性检索失败: {str(e)}")
+            raise
+    
+    def _dense_search_batch(
+        self,
+        queries: List[str],
+        top_k: int,
+        filter_metadata: Optional[Dict[str, Any]],
+        query_embeddings: np.ndarray,
+        subset: Tuple[Optional[Set[str]], Optional[List[str]], Dict[str, str]]
+    ) -> List[List[Dict[str, Any]]]:
+        """在 _resolve_filters 解析出的子集上做向量检索，结果使用已入库块的ID"""
+        document_ids, subset_ids, aliases = subset
+        if subset_ids is not None and not subset_ids:
+            return [[] for _ in queries]
+        
+        if subset_ids is not None and not self.uses_numpy_backend and (
+            aliases or len(subset_ids) <= settings.filter_bruteforce_max_chunks
+        ):
+            # 子集较小，或子集中有别名指向其他文档的块（按 document_id 过滤会漏掉）时，
+            # 直接取出子集向量精确计算，不经过全库索引
+            results = self._query_subset(subset_ids, query_embeddings, top_k, filter_metadata)
+        else:
             # 构建查询参数
             query_params = {
-                "query_embeddings": [query_embedding_list],
+                "query_embeddings": self._to_backend_embeddings(query_embeddings),
                 "n_results": top_k,
                 "include": ["documents", "metadatas", "distances"]
             }
             
+            if subset_ids is not None:
+                if self.uses_numpy_backend:
+                    query_params["ids"] = subset_ids
+                else:
+                    subset_where = {"document_id": {"$in": sorted(document_ids)}}
+                    filter_metadata = {"$and": [filter_metadata, subset_where]} if filter_metadata else subset_where
+            
             # 添加过滤条件
             if filter_metadata:
                 query_params["where"] = filter_metadata
             
             # 执行检索
             results = self.collection.query(**query_params)
-            
-            # 处理结果
+        
+        # 处理结果
+        batch_docs = []
+        for q in range(len(queries)):
             retrieved_docs = []
-            if results["documents"] and results["documents"][0]:
-                for i, (doc, metadata, distance) in enumerate(zip(
-                    results["documents"][0],
-                    results["metadatas"][0], 
-                    results["distances"][0]
-                )):
+            if results["documents"] and results["documents"][q]:
+                for chunk_id, doc, metadata, distance in zip(
+                    results["ids"][q],
+                    results["documents"][q],
+                    results["metadatas"][q],
+                    results["distances"][q]
+                ):
                     # 转换距离为相似度分数 (距离越小，相似度越高)
                     similarity_score = 1 / (1 + distance)
                     
                     # 过滤低相似度结果
                     if similarity_score >= settings.similarity_threshold:
-                        retrieved_docs.append({
-                            "content": doc,
-                            "metadata": metadata,
-                            "score": float(similarity_score),
-                            "source": metadata.get("source", "unknown"),
-                            "document_id": metadata.get("document_id"),
-                            "chunk_index": metadata.get("chunk_index")
-                        })
-            
-            logger.info(f"检索到 {len(retrieved_docs)} 个相关文档块")
-            return retrieved_docs
-            
-        except Exception as e:
-            logger.error(f"相似性检索失败: {str(e)}")
-            raise
+                        retrieved_docs.append(self._to_search_result(chunk_id, doc, metadata, similarity_score))
+            batch_docs.append(retrieved_docs)
+        
+        logger.info(f"检索到 {sum(len(docs) for docs in batch_docs)} 个相关文档块（{len(queries)} 个查询）")
+        return batch_docs
     
-    async def delete_document(self, document_id: str) -> bool:
-        """删除指定文档的所有块"""
+    def _resolve_filters(
+        self, filters: Optional[Dict[str, List[str]]]
+    ) -> Tuple[Optional[Set[str]], Optional[List[str]], Dict[str, str]]:
+        """
+        解析过滤条件为 (文档ID集合, 已入库块ID列表, 别名映射)，未指定过滤条件时前两项为 None
+        
+        子集中的别名（去重时跳过的重复块）解析为其已入库块；只因别名进入子集的已入库块
+        记录在别名映射 {已入库块ID: 别名ID} 中，检索结果中换回别名，显示为所过滤文档的块。
+        """
+        if not filters:
+            return None, None, {}
+        document_ids = self.filter_index.resolve_documents(filters)
+        chunk_ids = self.filter_index.chunk_ids(document_ids)
+        if self.dedup_index is None:
+            return document_ids, chunk_ids, {}
+        
+        stored_ids: Dict[str, None] = {}
+        aliases: Dict[str, str] = {}
+        for chunk_id in chunk_ids:
+            stored_id = self.dedup_index.resolve(chunk_id)
+            stored_ids[stored_id] = None
+            if stored_id != chunk_id:
+                aliases.setdefault(stored_id, chunk_id)
+        for chunk_id in chunk_ids:
+            aliases.pop(chunk_id, None)
+        return document_ids, list(stored_ids), aliases
+    
+    def _relabel_aliases(self, docs: List[Dict[str, Any]], aliases: Dict[str, str]) -> List[Dict[str, Any]]:
+        """把只因别名进入过滤子集的检索结果换成别名的ID和元数据"""
+        if not aliases:
+            return docs
+        relabeled = []
+        for doc in docs:
+            alias_id = aliases.get(doc["id"])
+            metadata = self.dedup_index.alias_metadata(alias_id) if alias_id else None
+            if metadata is not None:
+                doc = {**doc, **self._to_search_result(alias_id, doc["content"], metadata, doc["score"])}
+            relabeled.append(doc)
+        return relabeled
+    
+    def _query_subset(
+        self,
+        chunk_ids: List[str],
+        query_embeddings: np.ndarray,
+        top_k: int,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """在给定的文档块子集上精确检索，返回与 collection.query 相同的结构"""
+        subset = self.collection.get(ids=chunk_ids, include=["embeddings", "documents", "metadatas"])
+        keep = [
+            i for i, metadata in enumerate(subset["metadatas"])
+            if not filter_metadata or match_where(metadata, filter_metadata)
+        ]
+        results: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not keep:
+            for key in results:
+                results[key] = [[] for _ in range(len(query_embeddings))]
+            return results
+        
+        vectors = np.asarray([subset["embeddings"][i] for i in keep], dtype=np.float32)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        distances = (
+            np.einsum("ij,ij->i", vectors, vectors)[:, None]
+            - 2.0 * (vectors @ queries.T)
+            + np.einsum("ij,ij->i", queries, queries)[None, :]
+        )
+        
+        k = min(top_k, len(keep))
+        for column in range(queries.shape[0]):
+            column_distances = distances[:, column]
+            top = np.argpartition(column_distances, k - 1)[:k] if k < len(keep) else np.arange(len(keep))
+            top = top[np.argsort(column_distances[top])]
+            results["ids"].append([subset["ids"][keep[i]] for i in top])
+            results["documents"].append([subset["documents"][keep[i]] for i in top])
+            results["metadatas"].append([subset["metadatas"][keep[i]] for i in top])
+            results["distances"].append([float(max(column_distances[i], 0.0)) for i in top])
+        return results
+    
+    @staticmethod
+    def _to_search_result(chunk_id: str, doc: str, metadata: Dict[str, Any], score: float) -> Dict[str, Any]:
+        return {
+            "id": chunk_id,
+            "content": doc,
+            "metadata": metadata,
+            "score": float(score),
+            "source": metadata.get("source", "unknown"),
+            "document_id": metadata.get("document_id"),
+            "chunk_index": metadata.get("chunk_index")
+        }
+    
+    async def hybrid_search(
+        self,
+        query: str,
+        top_k: int = None,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """混合检索：BM25 与向量检索并行执行，按倒数排名融合（RRF）排序"""
+        if query_embedding is None:
+            query_embedding = await self.embed_query(query)
+        
+        results = await self.hybrid_search_batch([query], top_k, filter_metadata, query_embedding[None, :], filters)
+        return results[0]
+    
+    async def hybrid_search_batch(
+        self,
+        queries: List[str],
+        top_k: int = None,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        query_embeddings: Optional[np.ndarray] = None,
+        filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """批量混合检索：一次向量检索 + 并行的BM25检索，逐个查询做RRF融合"""
+        top_k = top_k or settings.top_k
+        if self.bm25_index is None:
+            return await self.similarity_search_batch(queries, top_k, filter_metadata, query_embeddings, filters)
+        
+        if query_embeddings is None:
+            query_embeddings = await self.embed_queries(queries)
+        
+        subset = self._resolve_filters(filters)
+        allowed_ids = set(subset[1]) if subset[1] is not None else None
+        
+        candidate_k = max(top_k, settings.hybrid_candidate_k)
+        # BM25 在线程中执行，与向量检索同时进行
+        keyword_task = asyncio.ensure_future(asyncio.gather(*(
+            asyncio.to_thread(self.bm25_index.search, query, candidate_k, allowed_ids) for query in queries
+        )))
         try:
-            # 查找该文档的所有块
-            results = self.collection.get(
-                where={"document_id": document_id},
-                include=["metadatas"]
+            dense_batch = self._dense_search_batch(queries, candidate_k, filter_metadata, query_embeddings, subset)
+        finally:
+            keyword_batch = await keyword_task
+        
+        return [
+            self._relabel_aliases(
+                self._fuse(query_embeddings[i], dense_batch[i], keyword_batch[i], top_k, filter_metadata),
+                subset[2]
             )
-            
-            if results["ids"]:
-                # 删除所有相关块
-                self.collection.delete(ids=results["ids"])
-                logger.info(f"成功删除文档 {document_id} 的 {len(results['ids'])} 个块")
-                return True
-            else:
-                logger.warning(f"未找到文档 {document_id}")
-                return False
-                
+            for i in range(len(queries))
+        ]
+    
+    def _fuse(
+        self,
+        query_embedding: np.ndarray,
+        dense_docs: List[Dict[str, Any]],
+        keyword_hits: List[Tuple[str, float]],
+        top_k: int,
+        filter_metadata: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """融合一个查询的向量结果和BM25结果"""
+        docs_by_id = {doc["id"]: doc for doc in dense_docs}
+        bm25_scores = dict(keyword_hits)
+        
+        # 仅由BM25召回的文档块需要补充内容，并计算向量分数以保持 score 含义一致
+        missing_ids = [chunk_id for chunk_id, _ in keyword_hits if chunk_id not in docs_by_id]
+        if missing_ids:
+            results = self.collection.get(ids=missing_ids, include=["documents", "metadatas", "embeddings"])
+            for chunk_id, doc, metadata, embedding in zip(
+                results["ids"], results["documents"], results["metadatas"], results["embeddings"]
+            ):
+                if filter_metadata and not match_where(metadata, filter_metadata):
+                    continue
+                distance = float(np.sum((np.asarray(embedding, dtype=np.float32) - query_embedding) ** 2))
+                docs_by_id[chunk_id] = self._to_search_result(chunk_id, doc, metadata, 1 / (1 + distance))
+        
+        fused = reciprocal_rank_fusion(
+            [[doc["id"] for doc in dense_docs], [chunk_id for chunk_id, _ in keyword_hits if chunk_id in docs_by_id]],
+            k=settings.hybrid_rrf_k
+        )
+        
+        hybrid_docs = []
+        for chunk_id, fusion_score in fused[:top_k]:
+            doc = docs_by_id[chunk_id]
+            doc["fusion_score"] = fusion_score
+            doc["bm25_score"] = bm25_scores.get(chunk_id, 0.0)
+            hybrid_docs.append(doc)
+        
+        logger.info(f"混合检索: 向量 {len(dense_docs)} 个，BM25 {len(keyword_hits)} 个，融合后 {len(hybrid_docs)} 个")
+        return hybrid_docs
+    
+    async def delete_document(self, document_id: str) -> bool:
+        """删除指定文档的所有块：等待该文档正在进行的入库结束，并排在已提交的写入之后执行"""
+        try:
+            ingest = self._ingesting.get(document_id)
+            if ingest is not None:
+                await asyncio.shield(ingest)
+            return await self.writer.run_exclusive(lambda: self._delete_document(document_id))
         except Exception as e:
             logger.error(f"删除文档失败 {document_id}: {str(e)}")
             raise
     
+    async def _delete_document(self, document_id: str) -> bool:
+        """删除文档（在写入队列中独占执行），包括全部块都是重复块、只有别名的文档"""
+        # 查找该文档的所有块
+        results = self.collection.get(
+            where={"document_id": document_id},
+            include=["metadatas"]
+        )
+        aliases = self.dedup_index.document_aliases(document_id) if self.dedup_index is not None else []
+        
+        if not results["ids"] and not aliases:
+            logger.warning(f"未找到文档 {document_id}")
+            return False
+        
+        await asyncio.to_thread(self.stats.begin_write)
+        try:
+            if results["ids"]:
+                # 其他文档的重复块先接替本文档的块，再删除所有相关块
+                self._detach_aliases(document_id, results["ids"])
+                self.collection.delete(ids=results["ids"])
+                self.stats.record_removed(results["metadatas"])
+            self.filter_index.remove_document(document_id)
+        finally:
+            await asyncio.to_thread(self.stats.end_write)
+        if self.bm25_index is not None:
+            self.bm25_index.remove(results["ids"])
+            await asyncio.to_thread(self.bm25_index.save)
+        if self.dedup_index is not None:
+            orphaned = self.dedup_index.remove_document(document_id)
+            if orphaned:
+                logger.warning(f"文档 {document_id} 被删除后，其他文档有 {orphaned} 个重复块失去对应的已入库块")
+            await asyncio.to_thread(self.dedup_index.save)
+        logger.info(f"成功删除文档 {document_id} 的 {len(results['ids'])} 个块和 {len(aliases)} 个重复块别名")
+        self._notify_invalidation(document_id)
+        return True
+    
+    def get_chunks(self, chunk_ids: List[str], include_content: bool = True) -> List[Tuple[str, Optional[str], Dict[str, Any]]]:
+        """
+        按给定顺序取出文档块 (块ID, 正文, 元数据)，不存在的块跳过
+        
+        别名（去重时跳过的重复块）返回其已入库块的正文和别名自己的元数据
+        """
+        stored_ids = [self.dedup_index.resolve(chunk_id) if self.dedup_index is not None else chunk_id for chunk_id in chunk_ids]
+        results = self.collection.get(
+            ids=list(dict.fromkeys(stored_ids)),
+            include=["metadatas", "documents"] if include_content else ["metadatas"]
+        )
+        contents = results.get("documents") or [None] * len(results["ids"])
+        stored = {
+            chunk_id: (content, metadata)
+            for chunk_id, content, metadata in zip(results["ids"], contents, results.get("metadatas") or [])
+        }
+        
+        chunks = []
+        for chunk_id, stored_id in zip(chunk_ids, stored_ids):
+            if stored_id not in stored:
+                continue
+            content, metadata = stored[stored_id]
+            if stored_id != chunk_id:
+                metadata = self.dedup_index.alias_metadata(chunk_id) or metadata
+            chunks.append((chunk_id, content, metadata))
+        return chunks
+    
+    def chunks_exist(self, chunk_ids: List[str]) -> bool:
+        """检查指定的文档块是否仍全部存在"""
+        if not chunk_ids:
+            return True
+        results = self.collection.get(ids=list(set(chunk_ids)), include=[])
+        return len(results["ids"]) == len(set(chunk_ids))
+    
+    def add_invalidation_listener(self, listener: Callable[[Optional[str]], None]):
+        """注册文档删除/集合清空回调，用于使依赖文档内容的缓存失效"""
+        self._invalidation_listeners.append(listener)
+    
+    def _notify_invalidation(self, document_id: Optional[str]):
+        for listener in self._invalidation_listeners:
+            try:
+                listener(document_id)
+            except Exception as e:
+                logger.error(f"缓存失效回调执行失败: {str(e)}")
+    
     def get_collection_stats(self) -> Dict[str, Any]:
-        """获取集合统计信息"""
+        """获取集合统计信息（增量维护的计数器，无需扫描集合）"""
         try:
-            total_count = self.collection.count()
-            
-            # 如果集合为空，返回默认值
-            if total_count == 0:
-                return {
-                    "total_chunks": 0,
-                    "total_documents": 0,
-                    "sources": {},
-                    "embedding_model": settings.ai_config["embedding"]["model_name"]
-                }
-            
-            # 获取文档源统计
-            results = self.collection.get(include=["metadatas"])
-            sources = {}
-            document_ids = set()
-            
-            for metadata in results.get("metadatas", []):
-                source = metadata.get("source", "unknown")
-                sources[source] = sources.get(source, 0) + 1
-                document_ids.add(metadata.get("document_id", metadata.get("source", "unknown")))
-            
             return {
-                "total_chunks": total_count,
-                "total_documents": len(document_ids),
-                "sources": sources,
+                **self.stats.snapshot(),
                 "embedding_model": settings.ai_config["embedding"]["model_name"]
             }
             
@@ -202,24 +860,63 @@ class VectorStore:
                 "error": str(e)
             }
     
-    async def clear_collection(self) -> bool:
-        """清空整个集合"""
-        try:
-            # 删除并重新创建集合
+    async def rebuild_collection_stats(self) -> Dict[str, Any]:
+        """全量扫描集合重建统计计数器"""
+        await asyncio.to_thread(self.stats.rebuild, self.collection)
+        return self.get_collection_stats()
+    
+    def _reset_collection(self):
+        """删除并重新创建集合"""
+        if self.uses_numpy_backend:
+            self.collection.reset()
+        else:
             self.chroma_client.delete_collection(settings.chroma_collection_name)
             self.collection = self.chroma_client.create_collection(
                 name=settings.chroma_collection_name,
                 metadata={"description": "RAG Knowledge Base Collection"}
             )
-            logger.info("成功清空向量存储集合")
-            return True
-            
+    
+    async def clear_collection(self) -> bool:
+        """清空整个集合（排在已提交的写入之后执行）"""
+        try:
+            return await self.writer.run_exclusive(self._clear_collection)
         except Exception as e:
             logger.error(f"清空集合失败: {str(e)}")
             raise
     
+    async def _clear_collection(self) -> bool:
+        """清空集合（在写入队列中独占执行）"""
+        await asyncio.to_thread(self.stats.begin_write)
+        try:
+            self._reset_collection()
+            self.stats.reset()
+            self.filter_index.clear()
+        finally:
+            await asyncio.to_thread(self.stats.end_write)
+        if self.bm25_index is not None:
+            self.bm25_index.clear()
+            await asyncio.to_thread(self.bm25_index.save)
+        if self.dedup_index is not None:
+            self.dedup_index.clear()
+            await asyncio.to_thread(self.dedup_index.save)
+        logger.info("成功清空向量存储集合")
+        self._notify_invalidation(None)
+        return True
+    
     async def test_embedding_service(self) -> bool:
         """测试嵌入服务连接"""
         if self.embedding_service:
             return await self.embedding_service.test_connection()
-        return False 
\ No newline at end of file
+        return False
+    
+    async def close(self):
+        """释放嵌入服务连接池和本地索引"""
+        if self.embedding_service:
+            await self.embedding_service.close()
+        if self.uses_numpy_backend and self.collection is not None:
+            self.collection.close()
+        if self.bm25_index is not None:
+            self.bm25_index.close()
+        if self.dedup_index is not None:
+            self.dedup_index.close()
+        self.ingest_log.close() 
\ No newline at end of file
@@ -0,0 +1 @@
+# Worker Processes Package 
\ No newline at end of file
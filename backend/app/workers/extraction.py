@@ -0,0 +1,84 @@
+"""
+解析进程入口
+
+供 TextExtractor 的进程池（forkserver/spawn）在子进程中导入，只依赖 PyPDF2 / python-docx，
+不导入配置和服务层，避免每个解析进程都加载整个服务。
+"""
+
+import os
+from typing import Optional, Tuple, Any
+
+from PyPDF2 import PdfReader
+from docx import Document as DocxDocument
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 当前进程最近打开的 PDF：(路径, 大小, 修改时间), 文件对象, PdfReader
+_open_pdf: Optional[Tuple[Tuple[str, int, int], Any, PdfReader]] = None
+
+
+def _current_address_space() -> int:
+    """当前进程的虚拟地址空间大小（字节），无法读取时返回 0"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def init_worker(memory_limit_mb: int):
+    """进程池初始化：在进程启动时的地址空间之上，限制解析最多再占用 memory_limit_mb"""
+    if resource is None or memory_limit_mb <= 0:
+        return
+    current = _current_address_space()
+    if current == 0:
+        return
+    limit = current + memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _close_pdf():
+    global _open_pdf
+    if _open_pdf is not None:
+        _open_pdf[1].close()
+        _open_pdf = None
+
+
+def _reader(file_path: str) -> PdfReader:
+    """同一进程连续解析同一 PDF 的多个页范围时复用已读取的文档结构，不重复解析"""
+    global _open_pdf
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_size, stat.st_mtime_ns)
+    if _open_pdf is None or _open_pdf[0] != key:
+        _close_pdf()
+        f = open(file_path, "rb")
+        try:
+            _open_pdf = (key, f, PdfReader(f))
+        except BaseException:
+            f.close()
+            raise
+    return _open_pdf[2]
+
+
+def pdf_page_count(file_path: str) -> int:
+    return len(_reader(file_path).pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> str:
+    """提取 [start, end) 页的文本，解析到最后一页后释放该文件"""
+    reader = _reader(file_path)
+    text = "".join((reader.pages[i].extract_text() or "") + "\n" for i in range(start, end))
+    if end >= len(reader.pages):
+        _close_pdf()
+    return text
+
+
+def extract_docx(file_path: str) -> str:
+    doc = DocxDocument(file_path)
+    return "".join(paragraph.text + "\n" for paragraph in doc.paragraphs if paragraph.text.strip())
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+向量量化基准测试：float32 vs int8 标量量化 + 全精度重排
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_quantization --count 50000 --dim 1024 --queries 200
+
+报告检索时常驻内存的索引大小、查询延迟，以及相对精确检索的 recall@k。
+默认生成带聚类结构的向量（更接近真实文本嵌入），--uniform 使用各向同性高斯分布。
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.numpy_index import NumpyCollection
+
+
+def make_vectors(rng, count: int, dim: int, uniform: bool) -> np.ndarray:
+    if uniform:
+        return rng.standard_normal((count, dim)).astype(np.float32)
+    centers = rng.standard_normal((max(1, count // 100), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), count)
+    return (centers[assignments] + 0.3 * rng.standard_normal((count, dim))).astype(np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    distances = (vectors ** 2).sum(axis=1)[None, :] - 2.0 * queries @ vectors.T
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def recall_at_k(result_ids, truth: np.ndarray) -> float:
+    hits = 0
+    for ids, expected in zip(result_ids, truth):
+        hits += len({int(i) for i in ids} & set(expected.tolist()))
+    return hits / truth.size
+
+
+def run(name, collection, vectors, queries, truth, k):
+    ids = [str(i) for i in range(len(vectors))]
+    for offset in range(0, len(vectors), 5000):
+        collection.add(ids=ids[offset:offset + 5000], embeddings=vectors[offset:offset + 5000])
+    
+    start = time.perf_counter()
+    result_ids = [collection.query(query_embeddings=query[None, :], n_results=k, include=[])["ids"][0] for query in queries]
+    elapsed = time.perf_counter() - start
+    
+    stats = collection.get_stats()
+    print(f"[{name}]")
+    print(f"  检索常驻内存: {stats['search_bytes'] / 1024 / 1024:.1f} MB（全精度 {stats['full_precision_bytes'] / 1024 / 1024:.1f} MB）")
+    print(f"  单查询: {elapsed / len(queries) * 1000:.2f} ms/次")
+    print(f"  recall@{k}: {recall_at_k(result_ids, truth):.4f}")
+    return stats["search_bytes"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量量化基准测试")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--uniform", action="store_true")
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(42)
+    vectors = make_vectors(rng, args.count, args.dim, args.uniform)
+    queries = vectors[rng.integers(0, args.count, args.queries)] + 0.1 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    truth = exact_top_k(vectors, queries, args.top_k)
+    
+    workdir = tempfile.mkdtemp(prefix="bench_quant_")
+    try:
+        baseline = run("float32", NumpyCollection(f"{workdir}/float32", quantization="none"), vectors, queries, truth, args.top_k)
+        for factor in (1, 2, 4):
+            collection = NumpyCollection(f"{workdir}/int8_{factor}", quantization="int8", rescore_factor=factor)
+            quantized = run(f"int8 重排倍数={factor}", collection, vectors, queries, truth, args.top_k)
+        print(f"内存节省: {(1 - quantized / baseline) * 100:.1f}%")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
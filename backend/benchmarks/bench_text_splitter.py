@@ -0,0 +1,105 @@
+"""
+文本分割器基准测试：原生分割器 vs LangChain RecursiveCharacterTextSplitter
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_text_splitter --chars 5000000 --chunk-size 1000 --chunk-overlap 200
+    python -m benchmarks.bench_text_splitter --layout plain
+    python -m benchmarks.bench_text_splitter --file corpus.txt
+
+默认生成随机组合的中文语料，--layout 控制换行方式：paragraphs（空行分段）、lines（每行固定
+字数硬换行，类似 PDF 提取结果）、plain（没有换行）。也可以指定文本文件。对比切分耗时、块数、
+平均块长以及在句末/段落处结束的块所占比例。未安装 langchain 时只测试原生分割器。
+"""
+
+import argparse
+import random
+import time
+
+from app.services.text_splitter import TextSplitter
+
+_SENTENCE_ENDS = ("。", "！", "？", "；", "\n")
+
+_PHRASES = [
+    "检索增强生成", "向量数据库", "文档分块", "嵌入模型", "相似度检索", "重排序模型", "知识库问答",
+    "用户上传的文档", "系统会自动解析", "并写入索引", "查询时先召回候选片段", "再交给大模型生成回答",
+    "这一过程", "在实际部署中", "需要关注延迟和吞吐", "以及内存占用", "对于较长的手册",
+]
+
+
+def generate_corpus(chars: int, layout: str = "paragraphs", seed: int = 42) -> str:
+    """随机组合短语生成中文语料：句内用逗号/顿号分隔，偶尔夹带英文单词和空格"""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < chars:
+        paragraph = []
+        for _ in range(rng.randint(3, 12)):
+            clauses = [rng.choice(_PHRASES) for _ in range(rng.randint(1, 4))]
+            if rng.random() < 0.02:
+                clauses.append(f" RAG v{rng.randint(1, 9)} ")
+            paragraph.append(rng.choice(["，", "、"]).join(clauses) + rng.choice("。。。！？；"))
+        text = "".join(paragraph) + ("\n\n" if layout == "paragraphs" else "")
+        parts.append(text)
+        size += len(text)
+    corpus = "".join(parts)[:chars]
+    if layout == "lines":
+        corpus = "\n".join(corpus[i:i + 40] for i in range(0, len(corpus), 40))
+    return corpus
+
+
+def bench_splitter(name, split, text, repeat):
+    best = float("inf")
+    chunks = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = split(text)
+        best = min(best, time.perf_counter() - start)
+    
+    sentence_ends = sum(1 for chunk in chunks if chunk.endswith(_SENTENCE_ENDS))
+    print(f"[{name}]")
+    print(f"  耗时: {best:.3f}s ({len(text) / best / 1e6:.2f}M 字符/秒)")
+    print(f"  块数: {len(chunks)}，平均块长: {sum(map(len, chunks)) / max(1, len(chunks)):.0f}，最大块长: {max(map(len, chunks), default=0)}")
+    print(f"  在句末/段落处结束的块: {sentence_ends / max(1, len(chunks)):.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本分割器基准测试")
+    parser.add_argument("--chars", type=int, default=2000000, help="生成语料的字符数")
+    parser.add_argument("--layout", choices=["paragraphs", "lines", "plain"], default="paragraphs")
+    parser.add_argument("--file", help="使用指定的 UTF-8 文本文件作为语料")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = generate_corpus(args.chars, args.layout)
+    print(f"语料: {len(text)} 字符，chunk_size={args.chunk_size}，chunk_overlap={args.chunk_overlap}")
+    
+    splitter = TextSplitter(args.chunk_size, args.chunk_overlap)
+    bench_splitter("native", splitter.split_text, text, args.repeat)
+    
+    start = time.perf_counter()
+    spans = splitter.split_spans(text)
+    print(f"  仅计算偏移: {time.perf_counter() - start:.3f}s，{len(spans)} 个块")
+    
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        print("[langchain] 未安装 langchain，跳过")
+        return
+    
+    langchain_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    bench_splitter("langchain", langchain_splitter.split_text, text, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+向量存储后端基准测试：Chroma vs NumPy 内存映射索引
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_vector_backends --count 50000 --dim 1024 --queries 200
+
+使用随机向量，对比写入耗时、单查询/批量查询延迟以及相对精确检索的 recall@k。
+未安装 chromadb 时只测试 NumPy 后端。
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.numpy_index import NumpyCollection
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    distances = (vectors ** 2).sum(axis=1)[None, :] - 2.0 * queries @ vectors.T
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def recall_at_k(result_ids, truth: np.ndarray) -> float:
+    hits = 0
+    for ids, expected in zip(result_ids, truth):
+        hits += len({int(i) for i in ids} & set(expected.tolist()))
+    return hits / truth.size
+
+
+def bench_backend(name, collection, vectors, queries, k, batch_size, to_input):
+    ids = [str(i) for i in range(len(vectors))]
+    metadatas = [{"document_id": f"doc_{i // 50}", "chunk_index": i % 50} for i in range(len(vectors))]
+    
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch_size):
+        end = offset + batch_size
+        collection.add(
+            ids=ids[offset:end],
+            embeddings=to_input(vectors[offset:end]),
+            documents=[f"chunk {i}" for i in range(offset, min(end, len(vectors)))],
+            metadatas=metadatas[offset:end]
+        )
+    add_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    single_ids = []
+    for query in queries:
+        result = collection.query(query_embeddings=to_input(query[None, :]), n_results=k)
+        single_ids.append(result["ids"][0])
+    single_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    batch_result = collection.query(query_embeddings=to_input(queries), n_results=k)
+    batch_time = time.perf_counter() - start
+    
+    truth = exact_top_k(vectors, queries, k)
+    print(f"[{name}]")
+    print(f"  写入: {add_time:.2f}s ({len(vectors) / add_time:.0f} 向量/秒)")
+    print(f"  单查询: {single_time / len(queries) * 1000:.2f}ms/次")
+    print(f"  批量查询: {batch_time * 1000:.1f}ms / {len(queries)} 个查询")
+    print(f"  recall@{k}: 单查询 {recall_at_k(single_ids, truth):.4f}，批量 {recall_at_k(batch_result['ids'], truth):.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储后端基准测试")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((args.count, args.dim)).astype(np.float32)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    
+    workdir = tempfile.mkdtemp(prefix="bench_vector_")
+    try:
+        collection = NumpyCollection(f"{workdir}/numpy")
+        bench_backend("numpy", collection, vectors, queries, args.top_k, args.batch_size, lambda x: x)
+        collection.close()
+        
+        try:
+            import chromadb
+            from chromadb.config import Settings as ChromaSettings
+        except ImportError:
+            print("[chroma] 未安装 chromadb，跳过")
+            return
+        
+        client = chromadb.PersistentClient(path=f"{workdir}/chroma", settings=ChromaSettings(anonymized_telemetry=False))
+        collection = client.create_collection(name="bench")
+        bench_backend("chroma", collection, vectors, queries, args.top_k, args.batch_size, lambda x: x.tolist())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,12 +1,14 @@
 import logging
+import sys
 import time
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 
-from app.api.endpoints import router
+from app.api.endpoints import router, rag_service, job_manager
 from app.core.config import settings
+from app.core.deadline import set_request_deadline, reset_request_deadline
 
 # 配置日志
 logging.basicConfig(
@@ -46,8 +48,18 @@ async def log_requests(request: Request, call_next):
     # 记录请求开始
     logger.info(f"开始处理请求: {request.method} {request.url}")
     
+    # 设置请求截止时间，供下游服务限制排队和远程调用时间
+    try:
+        timeout = float(request.headers.get(settings.request_timeout_header, settings.default_request_timeout))
+    except ValueError:
+        timeout = settings.default_request_timeout
+    deadline_token = set_request_deadline(timeout)
+    
     # 处理请求
-    response = await call_next(request)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_request_deadline(deadline_token)
     
     # 计算处理时间
     process_time = time.time() - start_time
@@ -91,13 +103,20 @@ async def root():
 async def startup_event():
     logger.info(f"启动 {settings.app_name} v{settings.version}")
     logger.info("系统初始化完成，开始加载模型...")
+    await job_manager.start()
 
 # 关闭事件  
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info(f"关闭 {settings.app_name}")
+    await job_manager.close()
+    await rag_service.close()
 
 if __name__ == "__main__":
+    # 文档解析进程池（forkserver/spawn）的子进程默认会重新执行主模块；服务由 uvicorn 以 "main:app"
+    # 导入，这里去掉 __main__ 的文件路径，避免每个解析进程都重新初始化整个服务
+    del sys.modules["__main__"].__file__
+    
     # 运行服务器
     uvicorn.run(
         "main:app",
@@ -0,0 +1,95 @@
+"""
+测试公共配置
+
+数据文件写入临时目录并使用 NumPy 向量后端，嵌入服务替换为本地确定性的假实现，
+测试不依赖远程服务。
+"""
+
+import asyncio
+import hashlib
+from typing import List, Optional
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+
+EMBEDDING_DIMENSION = 16
+
+
+class FakeEmbeddingService:
+    """按文本哈希生成确定性向量；gate 不为空时嵌入前先等待它，fail 为真时抛出异常"""
+    
+    def __init__(self):
+        self.cache = None
+        self.gate: Optional[asyncio.Event] = None
+        self.fail = False
+        self.calls = 0
+    
+    async def encode(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("嵌入服务不可用")
+        return np.array([
+            np.frombuffer(hashlib.blake2b(text.encode("utf-8"), digest_size=EMBEDDING_DIMENSION * 4).digest(), dtype=np.uint32)
+            / np.float32(2 ** 32)
+            for text in texts
+        ], dtype=np.float32)
+    
+    async def test_connection(self) -> bool:
+        return True
+    
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def data_settings(tmp_path, monkeypatch):
+    """各索引、日志和数据库写入临时目录"""
+    for name, value in {
+        "vector_store_backend": "numpy",
+        "numpy_index_directory": str(tmp_path / "numpy_index"),
+        "chroma_persist_directory": str(tmp_path / "chroma"),
+        "collection_stats_path": str(tmp_path / "collection_stats.json"),
+        "document_registry_path": str(tmp_path / "documents.db"),
+        "embedding_cache_path": str(tmp_path / "embedding_cache.db"),
+        "bm25_index_path": str(tmp_path / "bm25_index.pkl"),
+        "dedup_index_path": str(tmp_path / "dedup_index.pkl"),
+        "ingest_log_path": str(tmp_path / "ingest_log.db"),
+        "ingest_job_db_path": str(tmp_path / "ingest_jobs.db"),
+        "upload_directory": str(tmp_path / "uploads"),
+        "embedding_ingest_max_retries": 0,
+        "embedding_ingest_concurrency": 1
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    return settings
+
+
+@pytest.fixture
+def embedding_service(monkeypatch):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("langchain")
+    from app.services import vector_store
+    
+    service = FakeEmbeddingService()
+    monkeypatch.setattr(vector_store, "RemoteEmbeddingService", lambda: service)
+    return service
+
+
+@pytest.fixture
+def make_vector_store(data_settings, embedding_service):
+    """创建使用临时数据目录的向量存储，可多次调用以模拟重启"""
+    from app.services.vector_store import VectorStore
+    
+    stores = []
+    
+    def make() -> VectorStore:
+        store = VectorStore()
+        stores.append(store)
+        return store
+    
+    yield make
+    for store in stores:
+        asyncio.run(store.close())
\ No newline at end of file
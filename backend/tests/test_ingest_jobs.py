@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("chromadb")
+Document = pytest.importorskip("langchain.schema").Document
+
+from app.services.ingest_jobs import IngestJobManager, JobStore, QUEUED, RUNNING, SUCCEEDED, CANCELLED
+
+
+class FakeRAGService:
+    """把上传文件按行作为文档块写入向量存储；stall 为真时写出前几块后停住，等待任务被取消"""
+    
+    def __init__(self, vector_store, stall: bool = False):
+        self.vector_store = vector_store
+        self.document_processor = self
+        self.stall = stall
+        self.cleaned = []
+    
+    async def add_document(self, file_path, filename, progress=None):
+        with open(file_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        
+        async def chunks():
+            for i, line in enumerate(lines):
+                yield Document(page_content=line, metadata={"document_id": filename, "chunk_index": i})
+            if self.stall:
+                await asyncio.Event().wait()
+        
+        store_result = await self.vector_store.add_documents(
+            chunks(),
+            progress=lambda processed, total: progress and progress("embedding", processed, total),
+            document_ids=[filename]
+        )
+        return {"id": filename, "chunk_count": len(lines), "vector_store_result": store_result}
+    
+    async def cleanup_temp_file(self, file_path):
+        self.cleaned.append(file_path)
+
+
+async def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def upload(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("\n".join(f"第{i}段" for i in range(3)), encoding="utf-8")
+    return str(path)
+
+
+def test_cancel_running_job_rolls_back_written_chunks(make_vector_store, data_settings, monkeypatch, upload):
+    monkeypatch.setattr(data_settings, "embedding_ingest_max_batch_items", 3)
+    store = make_vector_store()
+    rag_service = FakeRAGService(store, stall=True)
+    manager = IngestJobManager(rag_service, store=JobStore(), workers=1)
+    
+    async def scenario():
+        job = await manager.submit("doc-a", upload, 100)
+        
+        async def written():
+            return store.collection.count() == 3
+        await wait_until(written)
+        assert (await manager.get(job["id"]))["status"] == RUNNING
+        
+        cancelled = await manager.cancel(job["id"])
+        await manager.close()
+        return cancelled
+    
+    job = asyncio.run(scenario())
+    manager.store.close()
+    
+    assert job["status"] == CANCELLED
+    assert store.collection.count() == 0
+    assert store.filter_index.chunk_count("doc-a") == 0
+    assert store.ingest_log.pending() == []
+    assert rag_service.cleaned == [upload]
+
+
+def test_running_job_is_requeued_on_restart(make_vector_store, upload):
+    job_store = JobStore()
+    job = job_store.create("doc-a", upload, 100)
+    # 上次运行时执行到一半
+    job_store.update(job["id"], status=RUNNING, stage="embedding", processed_chunks=2, started_at="2024-01-01T00:00:00")
+    
+    store = make_vector_store()
+    manager = IngestJobManager(FakeRAGService(store), store=job_store, workers=1)
+    
+    async def scenario():
+        await manager.start()
+        
+        async def finished():
+            return (await manager.get(job["id"]))["status"] not in (QUEUED, RUNNING)
+        await wait_until(finished)
+        result = await manager.get(job["id"])
+        await manager.close()
+        return result
+    
+    result = asyncio.run(scenario())
+    job_store.close()
+    
+    assert result["status"] == SUCCEEDED
+    assert result["processed_chunks"] == result["total_chunks"] == 3
+    assert result["document_id"] == "doc-a"
+    assert store.filter_index.chunk_count("doc-a") == 3
\ No newline at end of file
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("chromadb")
+Document = pytest.importorskip("langchain.schema").Document
+
+
+def test_unfinished_ingest_is_rolled_back_on_restart(make_vector_store, data_settings, monkeypatch):
+    """进程在入库中途退出（已写入部分批次、未回滚）后，重启时按预写日志回滚这些块"""
+    monkeypatch.setattr(data_settings, "embedding_ingest_max_batch_items", 3)
+    store = make_vector_store()
+    
+    async def crash():
+        async def chunks():
+            for i in range(3):
+                yield Document(page_content=f"第{i}段", metadata={"document_id": "doc-a", "chunk_index": i})
+            # 解析停在这里，直到进程退出
+            await asyncio.Event().wait()
+        
+        task = asyncio.ensure_future(store.add_documents(chunks(), document_ids=["doc-a"]))
+        while store.collection.count() < 3:
+            await asyncio.sleep(0.01)
+        
+        # 进程退出时来不及回滚：预写日志记录保留
+        def interrupted(document_ids):
+            raise RuntimeError("进程已退出")
+        monkeypatch.setattr(store, "_rollback_documents", interrupted)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        pending = store.ingest_log.pending()
+        await store.close()
+        return pending
+    
+    pending = asyncio.run(crash())
+    assert [entry["document_ids"] for entry in pending] == [["doc-a"]]
+    
+    restarted = make_vector_store()
+    
+    assert restarted.rolled_back_document_ids == ["doc-a"]
+    assert restarted.ingest_log.pending() == []
+    assert restarted.collection.count() == 0
+    assert restarted.filter_index.chunk_count("doc-a") == 0
+    assert restarted.ingest_log.get_stats()["replayed"] == 1
\ No newline at end of file
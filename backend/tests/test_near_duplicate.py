@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+
+import pytest
+
+pytest.importorskip("chromadb")
+Document = pytest.importorskip("langchain.schema").Document
+
+
+def make_texts(count: int):
+    return [hashlib.sha256(str(i).encode()).hexdigest() * 2 for i in range(count)]
+
+
+def make_chunks(document_id: str, texts):
+    return [
+        Document(page_content=text, metadata={"document_id": document_id, "chunk_index": i})
+        for i, text in enumerate(texts)
+    ]
+
+
+def stored_texts(store, document_id: str, count: int):
+    chunk_ids = [f"{document_id}_{i}" for i in range(count)]
+    return [text for _, text, _ in store.get_chunks(chunk_ids)]
+
+
+def test_overlapping_ingest_does_not_alias_unwritten_chunks(make_vector_store, embedding_service):
+    """第一次入库的块尚未写入时，第二次入库不能以它们为别名来源；第一次入库失败回滚后第二次入库的块完整"""
+    store = make_vector_store()
+    texts = make_texts(6)
+    
+    async def scenario():
+        gate = asyncio.Event()
+        embedding_service.gate = gate
+        first = asyncio.ensure_future(store.add_documents(make_chunks("doc-a", texts)))
+        while embedding_service.calls == 0:
+            await asyncio.sleep(0.01)
+        
+        # 第一次入库已完成去重、正在嵌入，第二次入库不再等待
+        embedding_service.gate = None
+        second = await store.add_documents(make_chunks("doc-b", texts))
+        
+        embedding_service.fail = True
+        gate.set()
+        with pytest.raises(RuntimeError):
+            await first
+        return second
+    
+    result = asyncio.run(scenario())
+    
+    assert result["added_count"] == len(texts)
+    assert result["duplicate_count"] == 0
+    assert stored_texts(store, "doc-b", len(texts)) == texts
+    assert store.collection.get(where={"document_id": "doc-a"})["ids"] == []
+    assert store.dedup_index.get_stats()["pending_fingerprints"] == 0
+
+
+def test_aliases_to_written_chunks_survive_rollback(make_vector_store, data_settings, monkeypatch):
+    """第二次入库以第一次入库已写入的块为别名来源，第一次入库随后失败回滚时由别名接替这些块"""
+    monkeypatch.setattr(data_settings, "embedding_ingest_max_batch_items", 3)
+    store = make_vector_store()
+    texts = make_texts(3)
+    
+    async def scenario():
+        resume = asyncio.Event()
+        
+        async def chunks():
+            for chunk in make_chunks("doc-a", texts):
+                yield chunk
+            await resume.wait()
+            raise RuntimeError("解析失败")
+        
+        first = asyncio.ensure_future(store.add_documents(chunks(), document_ids=["doc-a"]))
+        while store.dedup_index.get_stats()["fingerprints"] < len(texts):
+            await asyncio.sleep(0.01)
+        
+        second = await store.add_documents(make_chunks("doc-b", texts))
+        resume.set()
+        with pytest.raises(RuntimeError):
+            await first
+        return second
+    
+    result = asyncio.run(scenario())
+    
+    assert result["duplicate_count"] == len(texts)
+    assert stored_texts(store, "doc-b", len(texts)) == texts
+    assert len(store.collection.get(where={"document_id": "doc-b"})["ids"]) == len(texts)
+    assert store.collection.get(where={"document_id": "doc-a"})["ids"] == []
\ No newline at end of file
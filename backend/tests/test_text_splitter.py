@@ -0,0 +1,59 @@
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from app.core.config import settings
+from app.services.document_processor import DocumentProcessor
+
+SENTENCES = [
+    "检索增强生成把文档切成块后写入向量库",
+    "The retriever returns the top k chunks",
+    "查询时先召回候选，再用重排序模型打分",
+    "BM25 and dense vectors are fused with RRF",
+    "“中文文本里空格很少”，只能按标点断句",
+    "Mixed 中英文 text, with numbers like 3.14 and v2.0",
+]
+
+
+def make_text(seed: int, paragraphs: int) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(paragraphs):
+        for _ in range(rng.randint(1, 12)):
+            parts.append(rng.choice(SENTENCES))
+            parts.append(rng.choice(["。", "！", "？", "；", "，", "、", ". ", ", ", " ", "：", "…", ""]))
+        parts.append(rng.choice(["\n", "\n\n", "\n\n\n", " ", ""]))
+    return "".join(parts)
+
+
+async def stream_chunks(processor: DocumentProcessor, text: str, seed: int):
+    rng = random.Random(seed)
+    
+    async def blocks():
+        start = 0
+        while start < len(text):
+            end = start + rng.randint(1, 3000)
+            yield text[start:end]
+            start = end
+    
+    return [document.page_content async for document in processor.iter_chunks(blocks(), "a.txt", "doc")]
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(100, 0), (100, 20), (300, 80), (1000, 200)])
+@pytest.mark.parametrize("seed", range(3))
+def test_streaming_matches_split_text(monkeypatch, chunk_size, chunk_overlap, seed):
+    """任意文本分段方式下，流式分块与整体 split_text 的结果一致"""
+    monkeypatch.setattr(settings, "chunk_size", chunk_size)
+    monkeypatch.setattr(settings, "chunk_overlap", chunk_overlap)
+    processor = DocumentProcessor()
+    text = make_text(seed, 400)
+    
+    expected = processor.text_splitter.split_text(text)
+    chunks = asyncio.run(stream_chunks(processor, text, seed))
+    
+    assert len(expected) > 10
+    assert chunks == expected
+    assert max(len(chunk) for chunk in chunks) <= chunk_size
\ No newline at end of file
@@ -1,11 +1,13 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
-import api from '@/utils/api'
+import api, { streamRequest } from '@/utils/api'
 
 export const useChatStore = defineStore('chat', () => {
   // 状态
   const messages = ref([])
   const isLoading = ref(false)
+  const isStreaming = ref(false)
+  const isLoadingMoreDocuments = ref(false)
   const systemStatus = ref({
     status: 'unknown',
     document_count: 0,
@@ -40,6 +42,8 @@ export const useChatStore = defineStore('chat', () => {
   }
 
   const sendMessage = async (question, options = {}) => {
+    let assistantMessage = null
+
     try {
       isLoading.value = true
       
@@ -49,26 +53,64 @@ export const useChatStore = defineStore('chat', () => {
         content: question
       })
 
-      // 发送API请求
-      const response = await api.post('/query', {
+      let result = null
+      let streamError = null
+
+      // 流式请求：先收到引用来源，再逐段收到答案，最后收到置信度和耗时
+      await streamRequest('/query/stream', {
         question,
         top_k: options.top_k || 5,
         use_rerank: options.use_rerank || false
+      }, {
+        chunks: (data) => {
+          addMessage({
+            type: 'assistant',
+            content: '',
+            sources: data.retrieved_chunks,
+            streaming: true
+          })
+          assistantMessage = messages.value[messages.value.length - 1]
+          isStreaming.value = true
+        },
+        token: (data) => {
+          if (assistantMessage) {
+            assistantMessage.content += data.content
+          }
+        },
+        done: (data) => {
+          if (assistantMessage) {
+            assistantMessage.content = data.answer
+            assistantMessage.confidence = data.confidence
+            assistantMessage.response_time = data.response_time
+            assistantMessage.timings = data.timings
+            assistantMessage.streaming = false
+          }
+          result = {
+            question,
+            answer: data.answer,
+            retrieved_chunks: assistantMessage?.sources || [],
+            confidence: data.confidence,
+            response_time: data.response_time
+          }
+        },
+        error: (data) => {
+          streamError = new Error(data.message)
+        }
       })
 
-      // 添加AI回复
-      addMessage({
-        type: 'assistant',
-        content: response.data.answer,
-        sources: response.data.retrieved_chunks,
-        confidence: response.data.confidence,
-        response_time: response.data.response_time
-      })
+      if (streamError) {
+        throw streamError
+      }
 
-      return response.data
+      return result
     } catch (error) {
       console.error('发送消息失败:', error)
       
+      // 移除未完成的回答
+      if (assistantMessage) {
+        messages.value = messages.value.filter((message) => message !== assistantMessage)
+      }
+
       // 添加错误消息
       addMessage({
         type: 'error',
@@ -78,6 +120,7 @@ export const useChatStore = defineStore('chat', () => {
       throw error
     } finally {
       isLoading.value = false
+      isStreaming.value = false
     }
   }
 
@@ -99,7 +142,8 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
-  const uploadDocument = async (file, onProgress) => {
+  // 上传文档并等待后台入库任务完成，onJobUpdate 接收每次轮询到的任务状态
+  const uploadDocument = async (file, onProgress, onJobUpdate) => {
     try {
       const formData = new FormData()
       formData.append('file', file)
@@ -118,19 +162,49 @@ export const useChatStore = defineStore('chat', () => {
         }
       })
 
+      const job = await waitForJob(response.data.id, onJobUpdate)
+
       // 刷新文档列表和系统状态
       await Promise.all([
         loadDocuments(),
         loadSystemStatus()
       ])
 
-      return response.data
+      return job
     } catch (error) {
       console.error('文档上传失败:', error)
       throw error
     }
   }
 
+  const getJob = async (jobId) => {
+    const response = await api.get(`/jobs/${jobId}`)
+    return response.data
+  }
+
+  const cancelJob = async (jobId) => {
+    try {
+      const response = await api.post(`/jobs/${jobId}/cancel`)
+      return response.data
+    } catch (error) {
+      console.error('取消入库任务失败:', error)
+      throw error
+    }
+  }
+
+  // 轮询入库任务直到结束（成功、失败或取消）
+  const waitForJob = async (jobId, onUpdate, interval = 1000) => {
+    for (;;) {
+      const job = await getJob(jobId)
+      if (onUpdate) onUpdate(job)
+      if (['succeeded', 'failed', 'cancelled'].includes(job.status)) {
+        return job
+      }
+      await new Promise(resolve => setTimeout(resolve, interval))
+    }
+  }
+
+  // 加载第一页文档，后续页面通过 loadMoreDocuments 按游标追加
   const loadDocuments = async () => {
     try {
       const response = await api.get('/documents')
@@ -142,6 +216,27 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
+  const loadMoreDocuments = async () => {
+    const cursor = documents.value.next_cursor
+    if (!cursor || isLoadingMoreDocuments.value) return null
+
+    try {
+      isLoadingMoreDocuments.value = true
+      const response = await api.get('/documents', { params: { cursor } })
+      documents.value = {
+        ...response.data,
+        documents: [...(documents.value.documents || []), ...response.data.documents],
+        chunks: documents.value.chunks
+      }
+      return response.data
+    } catch (error) {
+      console.error('加载更多文档失败:', error)
+      throw error
+    } finally {
+      isLoadingMoreDocuments.value = false
+    }
+  }
+
   const deleteDocument = async (documentId) => {
     try {
       await api.delete(`/documents/${documentId}`)
@@ -201,9 +296,9 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
-  const loadDocumentChunks = async (documentId) => {
+  const loadDocumentChunks = async (documentId, cursor = null) => {
     try {
-      const response = await api.get(`/documents/${documentId}/chunks`)
+      const response = await api.get(`/documents/${documentId}/chunks`, { params: { cursor } })
       return response.data
     } catch (error) {
       console.error('加载文档块失败:', error)
@@ -227,6 +322,8 @@ export const useChatStore = defineStore('chat', () => {
     // 状态
     messages,
     isLoading,
+    isStreaming,
+    isLoadingMoreDocuments,
     systemStatus,
     documents,
     
@@ -241,7 +338,11 @@ export const useChatStore = defineStore('chat', () => {
     sendMessage,
     batchQuery,
     uploadDocument,
+    getJob,
+    cancelJob,
+    waitForJob,
     loadDocuments,
+    loadMoreDocuments,
     deleteDocument,
     clearDocuments,
     loadSystemStatus,
@@ -143,6 +143,63 @@ export const uploadFile = (url, file, onProgress) => {
   })
 }
 
+// Server-Sent Events 流式请求（POST），按事件回调 handlers[event](data)
+export const streamRequest = async (url, data, handlers = {}, { signal } = {}) => {
+  const response = await fetch(`${api.defaults.baseURL}${url}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream'
+    },
+    body: JSON.stringify(data),
+    signal
+  })
+
+  if (!response.ok || !response.body) {
+    const error = new Error(`请求失败 (${response.status})`)
+    error.status = response.status
+    throw error
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder('utf-8')
+  let buffer = ''
+
+  const dispatch = (block) => {
+    let event = 'message'
+    const dataLines = []
+    for (const line of block.split('\n')) {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim()
+      } else if (line.startsWith('data:')) {
+        dataLines.push(line.slice(5).trimStart())
+      }
+    }
+    if (dataLines.length > 0 && handlers[event]) {
+      handlers[event](JSON.parse(dataLines.join('\n')))
+    }
+  }
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+
+    buffer += decoder.decode(value, { stream: true })
+
+    // 事件之间以空行分隔
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      dispatch(buffer.slice(0, boundary))
+      buffer = buffer.slice(boundary + 2)
+      boundary = buffer.indexOf('\n\n')
+    }
+  }
+
+  if (buffer.trim()) {
+    dispatch(buffer)
+  }
+}
+
 // 检查API连接状态
 export const checkApiConnection = async () => {
   try {